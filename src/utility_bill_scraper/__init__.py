@@ -1,30 +1,53 @@
+import asyncio
+import contextlib
 import datetime as dt
 import errno
 import functools
 import getpass
-import glob
 import io
-import json
 import os
 import random
 import re
 import shutil
 import subprocess
 import sys
-import tempfile
+import threading
 import time
 import traceback
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import arrow
-import pandas as pd
-from selenium import webdriver
+# pandas, arrow, selenium's webdriver and the google api client are slow to
+# import, so they're imported where they're used (keeping `import
+# utility_bill_scraper`, and therefore `ubs`, quick to start).
 from selenium.common.exceptions import (
+    InvalidSessionIdException,
     NoSuchElementException,
+    NoSuchWindowException,
     StaleElementReferenceException,
+    WebDriverException,
 )
 
-from .google_drive_helpers import GoogleDriveHelper
+from . import compression as compression_
+from . import downloads
+from . import lean_profile
+from . import metrics
+from . import partitions
+from . import storage
+from . import timing
+from . import waits
+from .workspace import DownloadWorkspace
+from .waits import Timeout
+
+
+def __getattr__(name):
+    # `from utility_bill_scraper import GoogleDriveHelper` imports the google
+    # api client on first use.
+    if name == "GoogleDriveHelper":
+        from .google_drive_helpers import GoogleDriveHelper
+
+        return GoogleDriveHelper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 LIGHT_COLORMAP = [
     (0.533, 0.741, 0.902),
@@ -77,6 +100,8 @@ def convert_divs_to_df(divs):
         r"width:(?P<width>\d+)px.*height:(?P<height>\d+)"
     )
 
+    import pandas as pd
+
     df = pd.DataFrame()
     for x in divs:
         pos = re.search(pos_re, x.decode()).groupdict()
@@ -139,45 +164,41 @@ def pdf_to_html(pdf_file):
     basename, ext = os.path.splitext(pdf_file)
     html_file = basename + ".html"
 
-    # If we're in a conda environment, use the conda packaged pdf2txt.py
-    if os.getenv("CONDA_PREFIX") and os.path.exists(
-        os.path.join(os.getenv("CONDA_PREFIX"), "Scripts", "pdf2txt.py")
-    ):
-        subprocess.check_output(
-            [
-                "python",
-                r"%CONDA_PREFIX%\Scripts\pdf2txt.py",
-                "-o%s" % html_file,
-                pdf_file,
-            ],
-            shell=True,
-        )
-    else:  # Otherwise use the pip version
-        subprocess.check_output(
-            ["pdf2txt.py '-o%s' '%s'" % (html_file, pdf_file)],
-            shell=True,
-        )
+    with timing.span("pdf_to_text", os.path.getsize(pdf_file)):
+        # If we're in a conda environment, use the conda packaged pdf2txt.py
+        if os.getenv("CONDA_PREFIX") and os.path.exists(
+            os.path.join(os.getenv("CONDA_PREFIX"), "Scripts", "pdf2txt.py")
+        ):
+            subprocess.check_output(
+                [
+                    "python",
+                    r"%CONDA_PREFIX%\Scripts\pdf2txt.py",
+                    "-o%s" % html_file,
+                    pdf_file,
+                ],
+                shell=True,
+            )
+        else:  # Otherwise use the pip version
+            subprocess.check_output(
+                ["pdf2txt.py '-o%s' '%s'" % (html_file, pdf_file)],
+                shell=True,
+            )
 
     return html_file
 
 
-def is_gdrive_path(path):
-    if path:
-        return path.startswith("https://drive.google.com/drive")
-    else:
-        return False
-
-
 def wait_for_element(func, seconds=5, *args, **kwargs):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        t_start = time.time()
-        while time.time() - t_start < seconds:
-            try:
-                return func(*args, **kwargs)
-            except NoSuchElementException:
-                pass
-        raise Timeout
+        # Wrap the result in a tuple so that falsy results (e.g., an empty
+        # list of rows) are returned rather than waited on.
+        return waits.until(
+            None,
+            lambda driver: (func(*args, **kwargs),),
+            seconds,
+            name=func.__name__,
+            ignored_exceptions=(NoSuchElementException,),
+        )[0]
 
     return wrapper
 
@@ -240,21 +261,16 @@ def install_colab_dependencies(required_envs, debug=False):
 def wait_for_permission(func, seconds=5, *args, **kwargs):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        t_start = time.time()
-        while time.time() - t_start < seconds:
-            try:
-                return func(*args, **kwargs)
-            except PermissionError:
-                pass
-        raise Timeout
+        return waits.poll(
+            lambda: (func(*args, **kwargs),),
+            seconds,
+            name=func.__name__,
+            ignored_exceptions=(PermissionError,),
+        )[0]
 
     return wrapper
 
 
-class Timeout(Exception):
-    pass
-
-
 class UnsupportedFileType(Exception):
     pass
 
@@ -275,23 +291,45 @@ class UtilityAPI:
         timeout=30,
         save_statements=True,
         google_sa_credentials=None,
+        compression=None,
+        session_cache=None,
+        lean=False,
     ):
         self._user = user
         self._password = password
         self._driver = None
+        self._logged_in = False
+        self._session_depth = 0
         self._browser = browser
         self._headless = headless
-        self._temp_download_dir = tempfile.mkdtemp()
+        self._lean = lean
+        self._workspace = DownloadWorkspace()
+        self._temp_download_dir = self._workspace.browser_dir
         self._data_path = data_path or os.path.abspath(os.path.join(".", "data"))
         self._file_ext = file_ext
         self._save_statements = save_statements
         self._timeout = timeout
         self._resolutions_available = ["monthly"]
-
-        if google_sa_credentials is not None:
-            self._gdh = GoogleDriveHelper(google_sa_credentials)
-        else:
-            self._gdh = None
+        self._manifests = {}
+        self._statement_index = None
+        self._statement_sink = None
+        self._compression = compression_.validate(compression)
+        self._wait_stats = waits.WaitStats()
+        self._timings = timing.Timings()
+        self._run_started = time.time()
+
+        # Cache logged-in sessions if `session_cache` is True (using the
+        # default cache directory) or the path to a cache directory.
+        self._session_cache = None
+        if session_cache:
+            from .session_cache import SessionCache
+
+            self._session_cache = SessionCache(
+                self.name,
+                user,
+                password,
+                cache_dir=None if session_cache is True else session_cache,
+            )
 
         supported_filetypes = [".csv"]
         if self._file_ext not in supported_filetypes:
@@ -309,69 +347,46 @@ class UtilityAPI:
                 + "."
             )
 
-        self._monthly_history = pd.DataFrame()
+        # Storage operations are timed as part of the run report.
+        self._storage = timing.TimedStorage(
+            storage.get_storage(self._data_path, google_sa_credentials),
+            self._timings,
+        )
 
-        # If `data_path` is a google drive folder download the monthly data file.
-        if is_gdrive_path(self._data_path):
-            if google_sa_credentials is None:
-                raise RuntimeError(
-                    "`data_path` looks like a google drive folder, but `google_sa_credentials` is None."
-                )
+        import pandas as pd
 
-            folder_id = self._data_path.split("/")[-1]
-            try:
-                utility_folder = self._gdh.get_file_in_folder(folder_id, self.name)
-            except IndexError:  # Folder doesn't exist
-                utility_folder = self._gdh.create_subfolder(folder_id, self.name)
-
-            def get_history_file(resolution, index_col):
-                try:
-                    data_file = self._gdh.get_file_in_folder(
-                        utility_folder["id"], resolution + self._file_ext
-                    )
-                    file = self._gdh.download_file(
-                        data_file["id"],
-                        os.path.join(
-                            self._temp_download_dir, resolution + self._file_ext
-                        ),
-                    )
-                    return pd.read_csv(
-                        os.path.join(
-                            self._temp_download_dir, resolution + self._file_ext
-                        )
-                    ).set_index(index_col)
-                except IndexError:  # File doesn't exist
-                    return pd.DataFrame()
-
-            self._monthly_history = get_history_file("monthly", "Date")
-            hourly_history = get_history_file("hourly", "Datetime")
-            if len(hourly_history):
-                self._hourly_history = hourly_history
-
-        elif os.path.exists(
-            os.path.join(self._data_path, self.name, "monthly" + self._file_ext)
-        ):
-            # Load csv with previously cached data if it exists locally.
-            self._monthly_history = pd.read_csv(
-                os.path.join(self._data_path, self.name, "monthly" + self._file_ext)
-            ).set_index("Date")
-
-            if os.path.exists(
-                os.path.join(self._data_path, self.name, "hourly" + self._file_ext)
-            ):
-                self._hourly_history = pd.read_csv(
-                    os.path.join(self._data_path, self.name, "hourly" + self._file_ext)
-                ).set_index("Datetime")
+        # Load previously cached history if it exists.
+        self._monthly_history = self._read_history("monthly", "Date")
+        hourly_history = self._read_history("hourly", "Datetime")
+        if len(hourly_history):
+            self._hourly_history = hourly_history
 
         self._monthly_history.index = pd.to_datetime(self._monthly_history.index)
         if hasattr(self, "_hourly_history"):
             self._hourly_history.index = pd.to_datetime(self._hourly_history.index)
 
     def _init_driver(self):
+        from selenium import webdriver
+
+        options = self._driver_options()
+        if self._browser == "Chrome":
+            self._driver = webdriver.Chrome(options=options)
+            if self._lean:
+                lean_profile.apply_chrome_blocking(self._driver)
+        elif self._browser == "Firefox":
+            self._driver = webdriver.Firefox(options=options)
+
+    def _driver_options(self):
+        from selenium import webdriver
+
         if self._browser == "Chrome":
             options = webdriver.ChromeOptions()
             prefs = {"download.default_directory": self._temp_download_dir}
+            if self._lean:
+                prefs.update(lean_profile.CHROME_PREFS)
             options.add_experimental_option("prefs", prefs)
+            # Record DevTools events (used to detect completed downloads).
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
             if self._headless:
                 options.add_argument("--window-size=1920,1080")
                 options.add_argument("--headless")
@@ -381,7 +396,7 @@ class UtilityAPI:
                 options.add_argument(
                     "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36"
                 )
-            self._driver = webdriver.Chrome(options=options)
+            return options
         elif self._browser == "Firefox":
 
             options = webdriver.firefox.options.Options()
@@ -404,7 +419,10 @@ class UtilityAPI:
                 options.add_argument("--start-maximized")
                 options.add_argument("--disable-gpu")
                 options.add_argument("--no-sandbox")
-            self._driver = webdriver.Firefox(options=options)
+            if self._lean:
+                for name, value in lean_profile.FIREFOX_PREFS.items():
+                    options.set_preference(name, value)
+            return options
 
     def history(self, resolution="monthly"):
 
@@ -418,140 +436,716 @@ class UtilityAPI:
         elif resolution == "hourly":
             return self._hourly_history
 
-    def __del__(self):
-        if self._driver:
+    def close(self):
+        """Close the browser (if open) and remove temporary downloads.
+
+        Note that statements returned by `download_statements()` are removed
+        too unless they were saved to `data_path`.
+        """
+        if getattr(self, "_driver", None):
             self._close_driver()
+        if hasattr(self, "_workspace"):
+            self._workspace.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
 
     def _close_driver(self):
-        self._driver.close()
+        if self._logged_in:
+            self._save_session()
+        try:
+            # `quit()` (rather than `close()`) also shuts down the driver
+            # process.
+            self._driver.quit()
+        except WebDriverException:
+            pass  # The browser has already gone away
         self._driver = None
+        self._logged_in = False
 
-    def download_link(self, link, ext):
-        # remove all files in the temp dir
-        files = os.listdir(self._temp_download_dir)
-        for file in files:
-            os.remove(os.path.join(self._temp_download_dir, file))
+    def _driver_is_alive(self):
+        """Return True if the browser is still responding."""
+        if self._driver is None:
+            return False
+        try:
+            self._driver.execute_script("return 1;")
+            return True
+        except WebDriverException:
+            return False
+
+    def _start_session(self):
+        if self._driver is not None and self._logged_in:
+            if self._driver_is_alive():
+                # Leave any iframe that a previous operation switched into.
+                self._driver.switch_to.default_content()
+                return
+            print("Browser session is not responding; reconnecting...")
+            self._close_driver()
+        if self._driver is None:
+            with self._timings.span("driver_start"):
+                self._init_driver()
+        with self._timings.span("restore_session"):
+            restored = self._restore_session()
+        if not restored:
+            with self._timings.span("login"):
+                self._login()
+        self._logged_in = True
+
+    def _restart_session(self):
+        """Replace the current browser session with a fresh browser and a new
+        login (e.g., after the browser crashed or the portal's session
+        expired)."""
+        print("Restarting the browser session...")
+        # Don't save (or later restore) a session that stopped working.
+        self._logged_in = False
+        if self._session_cache is not None:
+            self._session_cache.clear()
+        if self._driver is not None:
+            self._close_driver()
+        self._start_session()
+
+    # Maximum number of times `_retry_with_restarts` restarts the browser
+    # session before giving up.
+    _max_session_restarts = 3
+
+    def _session_lost(self, error):
+        """Return True if `error` means that the browser session was lost
+        (i.e., the browser crashed or the portal's session expired), as
+        opposed to, e.g., a missing element or a page without data."""
+        if isinstance(error, (InvalidSessionIdException, NoSuchWindowException)):
+            return True
+        if isinstance(error, (NoSuchElementException, StaleElementReferenceException)):
+            return False
+        if not isinstance(error, (WebDriverException, Timeout)):
+            return False
+        if not self._driver_is_alive():
+            return True
+        if not isinstance(error, Timeout) or self._session_url is None:
+            return False
+        # The page stopped responding: check whether we were logged out.
+        try:
+            self._driver.switch_to.default_content()
+            return not self._is_logged_in()
+        except (WebDriverException, Timeout):
+            # Neither the portal nor its login form is showing.
+            return False
+
+    def _retry_with_restarts(self, func, name):
+        """Call `func()` within a session. If it fails because the browser
+        session was lost (see `_session_lost()`), restart the session and call
+        it again (up to `_max_session_restarts` times). Other errors are
+        raised right away.
+
+        `func` is expected to resume from where the previous call stopped
+        (e.g., by skipping the pages or months it already completed).
+        """
+        restarts = 0
+        while True:
+            try:
+                return func()
+            except (WebDriverException, Timeout) as e:
+                if restarts >= self._max_session_restarts or not self._session_lost(e):
+                    raise
+                restarts += 1
+                print(
+                    "%s failed (%s: %s); retrying with a new session (%d/%d)"
+                    % (name, type(e).__name__, e, restarts, self._max_session_restarts)
+                )
+                self._restart_session()
+
+    # Subclasses that support session caching set `_session_url` to a page
+    # that requires being logged in and implement `_is_logged_in()`.
+    _session_url = None
+
+    # Whether `update()` drives a browser (i.e., whether keeping a session
+    # open between updates saves anything).
+    _uses_browser = True
+
+    def _is_logged_in(self):
+        """Return True if the current page shows a logged-in session."""
+        raise NotImplementedError
+
+    def _restore_session(self):
+        """Restore cached cookies into the browser. Return True if this
+        resulted in a logged-in session."""
+        if self._session_cache is None or self._session_url is None:
+            return False
+        cookies = self._session_cache.load()
+        if not cookies:
+            return False
+        try:
+            # Cookies can only be set for the domain of the current page.
+            self._driver.get(self._session_url)
+            for cookie in cookies:
+                self._driver.add_cookie(cookie)
+            self._driver.get(self._session_url)
+            if self._is_logged_in():
+                print("Restored cached session.")
+                return True
+        except (WebDriverException, Timeout):
+            pass
+        print("Cached session is no longer valid; logging in.")
+        self._session_cache.clear()
+        self._driver.delete_all_cookies()
+        return False
 
+    def _save_session(self):
+        if self._session_cache is None or self._session_url is None:
+            return
+        try:
+            self._driver.switch_to.default_content()
+            self._session_cache.save(self._driver.get_cookies())
+        except WebDriverException:
+            pass  # The browser has already gone away
+
+    @contextlib.contextmanager
+    def session(self):
+        """Context manager providing a logged-in browser session.
+
+        Sessions are reference counted, so operations run inside a
+        `with api.session():` block share a single browser and login, e.g.,
+
+            with api.session():
+                api.update()
+                api.download_hourly_data()
+
+        The browser is closed when the outermost block exits. If it stops
+        responding between operations, it is restarted and logged in again.
+        """
+        self._session_depth += 1
+        try:
+            self._start_session()
+            yield self._driver
+        finally:
+            self._session_depth -= 1
+            if self._session_depth == 0 and self._driver is not None:
+                self._close_driver()
+
+    def download_link(self, link, ext):
         # add a random delay to keep from being banned
         time.sleep(1 * random.random() * 3)
 
         # download the link
-        link.click()
-
-        t_start = time.time()
-        filepath = None
-        # wait for the file to finish downloading
-        while time.time() - t_start < self._timeout:
-            files = glob.glob(os.path.join(self._temp_download_dir, "*.%s" % ext))
-            if len(files) and os.path.getsize(files[0]) > 0:
-                filepath = os.path.join(self._temp_download_dir, files[0])
-                time.sleep(0.5)
-                break
-        if not filepath:
-            raise Timeout
+        return self._download(link.click, ext)
+
+    def _download(self, start, ext):
+        """Call `start()` to start a download into a new directory and return
+        the path of the downloaded file once it has finished."""
+        download = downloads.Download(
+            self._driver,
+            self._browser,
+            self._workspace.new_dir(),
+        )
+        try:
+            download.prepare()
+        except WebDriverException:
+            # The download directory can't be changed (e.g., Firefox without
+            # access to its privileged context), so fall back to the
+            # browser's default directory.
+            for file in os.listdir(self._temp_download_dir):
+                if os.path.isfile(os.path.join(self._temp_download_dir, file)):
+                    os.remove(os.path.join(self._temp_download_dir, file))
+            download = downloads.Download(
+                self._driver, self._browser, self._temp_download_dir
+            )
+        with self._timings.span("download") as span:
+            start()
+            filepath = download.wait(
+                "*.%s" % ext, self._timeout, stats=self._wait_stats
+            )
+            span.bytes = os.path.getsize(filepath)
         return filepath
 
-    def get_statements(self):
-        # If `data_path` is a google drive url, upload pdfs to gdrive.
-        if is_gdrive_path(self._data_path):
-            statements_folder = self._get_gdrive_statements_folder()
-            return self._gdh.get_files_in_folder(statements_folder["id"], "*.pdf")
-        else:
-            # If `data_path` is a local path
-            return glob.glob(
-                os.path.join(self._data_path, self.name, "statements", "*.pdf")
-            )
+    def _wait(self, condition, name=None, timeout=None, **kwargs):
+        """Wait until `condition(driver)` returns a truthy value (see
+        `waits.until`)."""
+        return waits.until(
+            self._driver,
+            condition,
+            timeout or self._timeout,
+            name=name,
+            stats=self._wait_stats,
+            **kwargs,
+        )
 
-    def _get_gdrive_statements_folder(self):
-        if is_gdrive_path(self._data_path):
-            folder_id = self._data_path.split("/")[-1]
-            try:
-                utility_folder = self._gdh.get_file_in_folder(folder_id, self.name)
-            except IndexError:
-                utility_folder = self._gdh.create_subfolder(folder_id, self.name)
+    def wait_stats(self):
+        """Return the number and duration of waits, by name."""
+        return self._wait_stats.as_dict()
+
+    def run_report(self):
+        """Return a report of the work done by this object so far (as a
+        JSON-serializable dict).
+
+        The report has the duration, count, failures and bytes transferred of
+        each phase (see `timing`), counts of statements and history rows, the
+        waits (see `wait_stats()`) and the storage requests made. The account
+        is identified by a short hash of the user name (so that reports and
+        metrics don't include logins).
+        """
+        finished = time.time()
+        counts = self._timings.counts()
+        counts["monthly_rows"] = len(self._monthly_history)
+        if hasattr(self, "_hourly_history"):
+            counts["hourly_rows"] = len(self._hourly_history)
+        return {
+            "utility_name": self.name,
+            "account": metrics.account_hash(self.name, self._user),
+            "started": dt.datetime.fromtimestamp(
+                self._run_started, dt.timezone.utc
+            ).isoformat(),
+            "finished": dt.datetime.fromtimestamp(
+                finished, dt.timezone.utc
+            ).isoformat(),
+            "seconds": finished - self._run_started,
+            "phases": self._timings.phases(),
+            "counts": counts,
+            "waits": self.wait_stats(),
+            "storage_requests": self._storage.stats(),
+        }
+
+    @property
+    def _gdh(self):
+        # Kept for backwards compatibility; use `self._storage` instead.
+        return getattr(self._storage, "gdh", None)
+
+    def _statements_path(self):
+        return storage.join(self.name, "statements")
+
+    def get_statements(self):
+        """Return the archived statements.
+
+        For a local `data_path` these are the paths to the pdf files;
+        otherwise they are the (possibly compressed) object paths relative to
+        `data_path`.
+        """
+        names = [
+            x
+            for x in self._storage.list(self._statements_path())
+            if compression_.strip_suffix(x).endswith(".pdf")
+        ]
+        if self._storage.is_remote:
+            return [storage.join(self._statements_path(), x) for x in names]
+        return [
+            self._storage.local_path(storage.join(self._statements_path(), x))
+            for x in names
+        ]
+
+    def _archived_statements(self):
+        """Return a dict mapping the names of the archived statements (without
+        any compression suffix) to the names of the files in `data_path`.
+
+        The statements folder is only listed once per instance.
+        """
+        if self._statement_index is None:
+            self._statement_index = {
+                compression_.strip_suffix(x): x
+                for x in self._storage.list(self._statements_path())
+                if compression_.strip_suffix(x).endswith(".pdf")
+            }
+        return self._statement_index
+
+    def _archived_statement(self, name, download_path):
+        """Return a local path to the archived statement `name` (e.g.,
+        `"2021-10-19 - Kitchener Utilities - $123.45.pdf"`), or None if it
+        hasn't been archived.
+
+        Remote (or compressed) statements are copied to `download_path`.
+        """
+        archived_name = self._archived_statements().get(name)
+        if archived_name is None:
+            return None
+        path = storage.join(self._statements_path(), archived_name)
+        codec = compression_.codec_from_name(archived_name)
+        if not self._storage.is_remote and codec is None:
+            return self._storage.local_path(path)
+        local_path = os.path.join(download_path, name)
+        with open(local_path, "wb") as f:
+            f.write(compression_.decompress(self._storage.read(path), codec))
+        return local_path
+
+    def _read_history(self, resolution, index_col):
+        """Read a history file from `data_path`.
+
+        Remote history is stored as partitions in the `<utility>/<resolution>`
+        folder. If the partitioned history doesn't exist yet, this falls back
+        to the single `<utility>/<resolution><file_ext>` file (which is also
+        the format used for a local `data_path`).
+        """
+        with self._timings.span("history_read"):
+            return self._read_history_files(resolution, index_col)
+
+    def _read_history_files(self, resolution, index_col):
+        import pandas as pd
+
+        folder = storage.join(self.name, resolution)
+        manifest_path = storage.join(folder, partitions.MANIFEST_NAME)
+        if not self._storage.is_remote or not self._storage.exists(manifest_path):
             try:
-                statements_folder = self._gdh.get_file_in_folder(
-                    utility_folder["id"], "statements"
-                )
-            except IndexError:
-                statements_folder = self._gdh.create_subfolder(
-                    utility_folder["id"], "statements"
+                data = self._storage.read(
+                    storage.join(self.name, resolution + self._file_ext)
                 )
-            return statements_folder
-        return None
+            except FileNotFoundError:
+                return pd.DataFrame()
+            return pd.read_csv(io.BytesIO(data)).set_index(index_col)
 
-    def _copy_statements_to_data_path(self, pdf_files):
-        # If `data_path` is a google drive url, upload pdfs to gdrive.
-        if is_gdrive_path(self._data_path):
-            statements_folder = self._get_gdrive_statements_folder()
-            for local_path in pdf_files:
-                if (
-                    self._gdh.file_exists_in_folder(
-                        statements_folder["id"], os.path.split(local_path)[-1]
-                    )
-                    == False
-                ):
-                    self._gdh.create_file_in_folder(statements_folder["id"], local_path)
-        else:
-            # If `data_path` is a local path, copy pdfs to their new location.
-            os.makedirs(
-                os.path.join(self._data_path, self.name, "statements"),
-                exist_ok=True,
+        manifest = partitions.load_manifest(self._storage.read(manifest_path))
+        self._manifests[resolution] = manifest
+
+        def read_partition(entry):
+            data = compression_.decompress(
+                self._storage.read(storage.join(folder, entry["name"])),
+                compression_.codec_from_name(entry["name"]),
             )
-            for local_path in pdf_files:
-                shutil.move(
-                    local_path,
-                    os.path.join(
-                        self._data_path,
-                        self.name,
-                        "statements",
-                        os.path.basename(local_path),
-                    ),
-                )
+            return pd.read_csv(io.BytesIO(data)).set_index(index_col)
 
-            # Update the `pdf_files` list
-            pdf_files = [
-                os.path.join(
-                    self._data_path,
-                    self.name,
-                    "statements",
-                    os.path.basename(local_path),
+        # Download the partitions in parallel.
+        frames = self._storage.map(
+            read_partition,
+            [entry for key, entry in sorted(manifest["partitions"].items())],
+        )
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames)
+
+    def _write_history(self, resolution, df):
+        with self._timings.span("history_write"):
+            if not self._storage.is_remote:
+                self._storage.write(
+                    storage.join(self.name, resolution + self._file_ext),
+                    df.to_csv().encode("utf-8"),
+                    mimetype="text/csv",
                 )
-                for local_path in pdf_files
-            ]
+                return
+            self._write_history_partitions(resolution, df)
+
+    def _write_history_partitions(self, resolution, df):
+        """Upload the partitions of a history file whose content has changed
+        since it was last uploaded, followed by an updated manifest."""
+        manifest = self._manifests.get(resolution, partitions.new_manifest(resolution))
+        history_partitions = partitions.split_history(df, resolution)
+        changed = partitions.changed_partitions(
+            history_partitions, manifest, self._file_ext, self._compression
+        )
+        removed = set(manifest["partitions"].keys()) - set(history_partitions.keys())
+        if not changed and not removed and resolution in self._manifests:
+            return []
+
+        folder = storage.join(self.name, resolution)
+
+        def upload_partition(key):
+            data = history_partitions[key]
+            name = partitions.partition_name(key, self._file_ext, self._compression)
+            self._storage.write(
+                storage.join(folder, name),
+                compression_.compress(data, self._compression),
+                mimetype=compression_.MIMETYPES.get(self._compression, "text/csv"),
+            )
+            return {"name": name, "md5": partitions.checksum(data)}
+
+        # Upload the changed partitions in parallel.
+        for key, entry in zip(changed, self._storage.map(upload_partition, changed)):
+            manifest["partitions"][key] = entry
+
+        # Partitions that no longer exist are dropped from the manifest (the
+        # files themselves are left in place).
+        for key in removed:
+            manifest["partitions"].pop(key)
+
+        self._storage.write(
+            storage.join(folder, partitions.MANIFEST_NAME),
+            partitions.dump_manifest(manifest),
+            mimetype="application/json",
+        )
+        self._manifests[resolution] = manifest
+        return changed
+
+    def _archive_statement(self, local_path):
+        """Copy a downloaded statement to the statements folder in
+        `data_path` (unless it has already been archived) and return its
+        path.
+
+        If `data_path` is a local path, the pdf is moved there (and the new
+        path is returned). Otherwise it is uploaded (and `local_path` is
+        returned).
+        """
+        name = os.path.basename(local_path)
+        if not self._storage.is_remote:
+            new_path = self._storage.local_path(
+                storage.join(self._statements_path(), name)
+            )
+            # Skip statements that are already archived.
+            if os.path.abspath(local_path) != os.path.abspath(new_path):
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                shutil.move(local_path, new_path)
+            if self._statement_index is not None:
+                self._statement_index.setdefault(name, name)
+            return new_path
+
+        archived = self._archived_statements()
+        if name in archived:
+            return local_path
+        archived_name = compression_.add_suffix(name, self._compression)
+        path = storage.join(self._statements_path(), archived_name)
+        if self._compression:
+            with open(local_path, "rb") as f:
+                data = compression_.compress(f.read(), self._compression)
+            self._storage.write(
+                path, data, mimetype=compression_.MIMETYPES[self._compression]
+            )
+        else:
+            self._storage.upload(local_path, path, mimetype="application/pdf")
+        archived[name] = archived_name
+        return local_path
+
+    def _copy_statements_to_data_path(self, pdf_files):
+        if self._statement_sink is not None:
+            # `aupdate()` archives each statement as soon as it's extracted.
+            return pdf_files
+        if not self._storage.is_remote:
+            return [self._archive_statement(x) for x in pdf_files]
+        # List the archived statements once, then upload in parallel.
+        self._archived_statements()
+        self._storage.map(self._archive_statement, pdf_files)
         return pdf_files
 
-    def update(self, max_downloads=None):
-        # Download any new statements.
-        start_date = None
+    def _statement_ready(self, filepath):
+        """Called by `download_statements()` as soon as each statement is
+        available locally (downloaded or copied from the archive)."""
+        if self._statement_sink is not None:
+            self._statement_sink(filepath)
+
+    def _update_start_date(self):
+        import arrow
+
+        # Download statements newer than the latest one in the history.
         if len(self._monthly_history):
-            start_date = (
+            return (
                 arrow.get(self._monthly_history.sort_index().index[-1]).date()
                 + dt.timedelta(days=1)
             ).isoformat()
-        pdf_files = self.download_statements(
-            start_date=start_date, max_downloads=max_downloads
-        )
-        return self.extract_data_from_statements(pdf_files)
+        return None
+
+    def update(self, max_downloads=None):
+        with self._timings.span("update"):
+            # Download any new statements.
+            pdf_files = self.download_statements(
+                start_date=self._update_start_date(), max_downloads=max_downloads
+            )
+            return self.extract_data_from_statements(pdf_files)
+
+    async def aupdate(
+        self, max_downloads=None, max_pending=4, extract_workers=2, upload_workers=2
+    ):
+        """Asynchronous version of `update()`.
+
+        The work is split into three stages connected by bounded queues:
+        downloading statements, extracting data from each pdf and archiving
+        each pdf to `data_path`. Each statement moves on to the next stage as
+        soon as it's ready, so the stages overlap (e.g., one statement is
+        being uploaded while the next is parsed and a third is downloaded).
+        The blocking work in each stage (the browser, `pdftotext` and
+        storage calls) runs in executor threads, so other coroutines keep
+        running on the event loop.
+
+        Parameters
+        ----------
+        max_downloads : int, optional
+            Maximum number of statements to download.
+        max_pending : int
+            Maximum number of statements waiting between two stages. The
+            download stage blocks when the extract stage falls this far
+            behind (and likewise between extract and upload).
+        extract_workers : int
+            Number of statements extracted at once.
+        upload_workers : int
+            Number of statements archived at once.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The new rows added to the monthly history (as for `update()`).
+        """
+        loop = asyncio.get_running_loop()
+        start_date = self._update_start_date()
+        cached_invoice_dates = self._cached_invoice_dates()
+        downloaded = asyncio.Queue(max_pending)
+        extracted = asyncio.Queue(max_pending)
+        rows = []
+        stopped = threading.Event()
+
+        def sink(filepath):
+            # Called from the download thread; blocks while the queue is full.
+            if stopped.is_set():
+                raise RuntimeError("The update was cancelled.")
+            asyncio.run_coroutine_threadsafe(downloaded.put(filepath), loop).result()
+
+        def download():
+            self._statement_sink = sink
+            try:
+                self.download_statements(
+                    start_date=start_date, max_downloads=max_downloads
+                )
+            finally:
+                self._statement_sink = None
+
+        async def download_stage():
+            await loop.run_in_executor(None, download)
+            for _ in range(extract_workers):
+                await downloaded.put(None)
+
+        async def extract_stage():
+            while True:
+                pdf = await downloaded.get()
+                if pdf is None:
+                    return
+                row = await loop.run_in_executor(
+                    None, self._extract_statement, pdf, cached_invoice_dates
+                )
+                if row is not None:
+                    rows.append(row)
+                if self._save_statements:
+                    await extracted.put(pdf)
+
+        async def upload_stage():
+            while True:
+                pdf = await extracted.get()
+                if pdf is None:
+                    return
+                await loop.run_in_executor(None, self._archive_statement, pdf)
+
+        async def extract_and_upload():
+            await asyncio.gather(*[extract_stage() for _ in range(extract_workers)])
+            for _ in range(upload_workers):
+                await extracted.put(None)
+
+        with self._timings.span("update"):
+            if self._save_statements and self._storage.is_remote:
+                # List the archived statements before the uploads start.
+                await loop.run_in_executor(None, self._archived_statements)
+
+            tasks = [
+                asyncio.ensure_future(x)
+                for x in [download_stage(), extract_and_upload()]
+                + [upload_stage() for _ in range(upload_workers)]
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                stopped.set()
+                for task in tasks:
+                    task.cancel()
+                # Unblock the download thread if it's waiting on a full queue.
+                while not downloaded.empty():
+                    downloaded.get_nowait()
+                raise
+            return await loop.run_in_executor(None, self._add_monthly_rows, rows)
+
+    def _cached_invoice_dates(self):
+        import pandas as pd
+
+        return [
+            x.date().isoformat() for x in pd.to_datetime(self._monthly_history.index)
+        ]
+
+    def _extract_statement(self, pdf, cached_invoice_dates):
+        """Return the data extracted from `pdf` (as a one-row DataFrame), or
+        None if it's already in the history (or can't be extracted)."""
+        import pandas as pd
+
+        date = os.path.splitext(os.path.basename(pdf))[0].split(" - ")[0]
+
+        # If we've already scraped this pdf, continue
+        if date in cached_invoice_dates:
+            return None
+        print("Scrape data from %s" % pdf)
+        try:
+            # `pdf_to_html()` records its own "pdf_to_text" spans.
+            with timing.recording(self._timings), self._timings.span("extract"):
+                result = self.extract_data(pdf)
+        except Exception:
+            traceback.print_exc()
+            return None
+        self._timings.count("statements_extracted")
+        return pd.DataFrame(result, index=[None]).set_index("Date")
 
     def extract_data_from_statements(self, pdf_files):
-        df_new_rows = pd.DataFrame()
-        cached_invoice_dates = list(self._monthly_history.index)
-        for pdf in pdf_files:
-            # Scrape data from pdf file
-            date = os.path.splitext(os.path.basename(pdf))[0].split(" - ")[0]
-
-            # If we've already scraped this pdf, continue
-            if date not in cached_invoice_dates:
-                print("Scrape data from %s" % pdf)
-                try:
-                    result = self.extract_data(pdf)
-                    df_new_rows = df_new_rows.append(
-                        pd.DataFrame(result, index=[None]).set_index("Date")
-                    )
-                except Exception:
-                    traceback.print_exc()
-        self._monthly_history = self._monthly_history.append(df_new_rows)
+        cached_invoice_dates = self._cached_invoice_dates()
+        rows = [self._extract_statement(x, cached_invoice_dates) for x in pdf_files]
+        return self._add_monthly_rows([x for x in rows if x is not None])
+
+    def extract_statements(
+        self, pdf_files=None, max_workers=None, force=False, progress=None
+    ):
+        """Extract data from statements that have already been downloaded and
+        merge it into the history, without starting a browser.
+
+        Parameters
+        ----------
+        pdf_files : list of str, optional
+            Paths to the statements. Defaults to the statements archived in
+            `data_path` (remote statements are copied to a temporary folder).
+        max_workers : int, optional
+            Number of statements extracted at once (defaults to the number of
+            CPUs).
+        force : bool
+            Re-extract statements that are already in the history and replace
+            their rows (e.g., to rebuild the history after a parser fix).
+        progress : callable, optional
+            Called as `progress(done, total, pdf)` after each statement.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The rows added to (or replaced in) the monthly history.
+        """
+        if pdf_files is None:
+            download_path = self._workspace.new_dir("statements-")
+            pdf_files = list(
+                self._storage.map(
+                    lambda x: self._archived_statement(x, download_path),
+                    sorted(self._archived_statements()),
+                )
+            )
+        cached_invoice_dates = [] if force else self._cached_invoice_dates()
+        rows = []
+        with self._timings.span("extract_statements"):
+            # Most of the work happens in `pdf2txt.py` subprocesses, so the
+            # statements are extracted in parallel threads.
+            with ThreadPoolExecutor(max_workers or os.cpu_count()) as executor:
+                futures = {
+                    executor.submit(self._extract_statement, x, cached_invoice_dates): x
+                    for x in pdf_files
+                }
+                for i, future in enumerate(as_completed(futures)):
+                    row = future.result()
+                    if row is not None:
+                        rows.append(row)
+                    if progress:
+                        progress(i + 1, len(futures), futures[future])
+            return self._add_monthly_rows(rows, replace=force)
+
+    def _add_monthly_rows(self, rows, replace=False):
+        """Add `rows` to the monthly history and write it. If `replace` is
+        True, existing rows with the same dates are replaced."""
+        import pandas as pd
+
+        if not rows:
+            # Nothing new, so there's no need to rewrite the history.
+            return pd.DataFrame()
+        df_new_rows = pd.concat(rows)
+        if replace:
+            df_new_rows.index = pd.to_datetime(df_new_rows.index)
+            df_new_rows = df_new_rows[~df_new_rows.index.duplicated(keep="last")]
+            self._monthly_history = self._monthly_history[
+                ~self._monthly_history.index.isin(df_new_rows.index)
+            ]
+        self._timings.count("new_rows", len(df_new_rows))
+        self._monthly_history = pd.concat([self._monthly_history, df_new_rows])
         self._monthly_history.index = pd.to_datetime(self._monthly_history.index)
         self._monthly_history.sort_index(inplace=True)
         self._update_history()
@@ -559,54 +1153,7 @@ class UtilityAPI:
 
     def _update_history(self):
         # Update history
+        self._write_history("monthly", self._monthly_history)
 
-        # If `data_path` is a google drive folder, upload the history file(s).
-        if is_gdrive_path(self._data_path):
-            folder_id = self._data_path.split("/")[-1]
-            try:
-                utility_folder = self._gdh.get_file_in_folder(folder_id, self.name)
-            except IndexError:
-                utility_folder = self._gdh.create_subfolder(folder_id, self.name)
-
-            def upload_file(resolution):
-                try:
-                    data_file = self._gdh.get_file_in_folder(
-                        utility_folder["id"], resolution + self._file_ext
-                    )
-                    self._gdh.upload_file(
-                        data_file["id"],
-                        os.path.join(
-                            self._temp_download_dir, resolution + self._file_ext
-                        ),
-                    )
-                except IndexError:
-                    data_file = self._gdh.create_file_in_folder(
-                        utility_folder["id"],
-                        os.path.join(
-                            self._temp_download_dir, resolution + self._file_ext
-                        ),
-                    )
-
-            self._monthly_history.to_csv(
-                os.path.join(self._temp_download_dir, "monthly" + self._file_ext)
-            )
-            upload_file("monthly")
-
-            if hasattr(self, "_hourly_history"):
-                self._hourly_history.to_csv(
-                    os.path.join(self._temp_download_dir, "hourly" + self._file_ext)
-                )
-                upload_file("hourly")
-        else:
-            # Create directories if necessary
-            os.makedirs(os.path.join(self._data_path, self.name), exist_ok=True)
-
-            # Update csv file
-            self._monthly_history.to_csv(
-                os.path.join(self._data_path, self.name, "monthly" + self._file_ext)
-            )
-
-            if hasattr(self, "_hourly_history"):
-                self._hourly_history.to_csv(
-                    os.path.join(self._data_path, self.name, "hourly" + self._file_ext)
-                )
+        if hasattr(self, "_hourly_history"):
+            self._write_history("hourly", self._hourly_history)
@@ -1,4 +1,6 @@
 import argparse
+import contextlib
+import json
 import os
 import sys
 
@@ -7,6 +9,47 @@ from dotenv import load_dotenv
 sys.path.insert(0, os.path.join("..", ".."))
 
 
+def make_api(
+    utility_name, user=None, password=None, transport=None, listing_cache=None, **kwargs
+):
+    import inspect
+
+    from utility_bill_scraper import registry
+
+    # Only the chosen utility's module is imported.
+    cls = registry.get(utility_name)
+    # Options that only some utilities support are ignored by the others.
+    parameters = inspect.signature(cls).parameters
+    if transport and "transport" in parameters:
+        kwargs["transport"] = transport
+    if listing_cache and "listing_cache" in parameters:
+        kwargs["listing_cache"] = listing_cache
+    return cls(user, password, **kwargs)
+
+
+def parse_cache_option(value):
+    """Parse a cache option: 'true' uses the default cache directory, 'false'
+    disables the cache and anything else is the path to a cache directory."""
+    if value and value.lower() in ("true", "1"):
+        return True
+    elif value and value.lower() in ("false", "0"):
+        return None
+    return value
+
+
+def write_report(path, report):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote run report to {path}")
+
+
+def write_metrics(path, reports):
+    from utility_bill_scraper import metrics
+
+    metrics.write_textfile(path, metrics.render(reports, openmetrics=False))
+    print(f"Wrote metrics to {path}")
+
+
 def update(
     utility_name,
     user,
@@ -16,52 +59,98 @@ def update(
     max_downloads,
     google_sa_credentials,
     browser,
+    compression=None,
+    session_cache=None,
+    lean=False,
+    transport=None,
+    report_path=None,
+    metrics_path=None,
+    listing_cache=None,
 ):
-    if utility_name == "Kitchener Utilities":
-        import utility_bill_scraper.canada.on.kitchener_utilities as ku
-
-        api = ku.KitchenerUtilitiesAPI(
-            user,
-            password,
-            data_path=data_path,
-            save_statements=save_statements,
-            google_sa_credentials=google_sa_credentials,
-            browser=browser,
-        )
-    elif utility_name == "Kitchener-Wilmot Hydro":
-        import utility_bill_scraper.canada.on.kitchener_wilmot_hydro as kwh
-
-        api = kwh.KitchenerWilmotHydroAPI(
-            user,
-            password,
-            data_path=data_path,
-            save_statements=save_statements,
-            google_sa_credentials=google_sa_credentials,
-            browser=browser,
-        )
-    else:
-        raise RuntimeError(f"Unsupported utility: {utility_name}")
+    api = make_api(
+        utility_name,
+        user,
+        password,
+        data_path=data_path,
+        save_statements=save_statements,
+        google_sa_credentials=google_sa_credentials,
+        browser=browser,
+        compression=compression,
+        session_cache=session_cache,
+        lean=lean,
+        transport=transport,
+        listing_cache=listing_cache,
+    )
 
-    updates = api.update(max_downloads=max_downloads)
+    try:
+        updates = api.update(max_downloads=max_downloads)
+    finally:
+        if report_path:
+            write_report(report_path, api.run_report())
+        if metrics_path:
+            write_metrics(metrics_path, [api.run_report()])
     if updates is not None:
         print(f"Downloaded {len(updates)} new statements")
     else:
         print("No new updates")
 
 
-def export(utility_name, data_path, output, google_sa_credentials):
-    if utility_name == "Kitchener Utilities":
-        import utility_bill_scraper.canada.on.kitchener_utilities as ku
+def update_all(config_path, max_workers=None, report_path=None, metrics_path=None):
+    from utility_bill_scraper import orchestrator
 
-        api = ku.KitchenerUtilitiesAPI(data_path=data_path)
-    elif utility_name == "Kitchener-Wilmot Hydro":
-        import utility_bill_scraper.canada.on.kitchener_wilmot_hydro as kwh
+    config = orchestrator.load_config(config_path)
+    results = orchestrator.update_all(
+        config["accounts"],
+        make_api,
+        max_workers=max_workers
+        or config.get("max_workers", orchestrator.DEFAULT_MAX_WORKERS),
+        portal_limits=config.get("portal_limits"),
+    )
+    print(orchestrator.format_summary(results))
+    print(f"Downloaded {sum(x['new_statements'] for x in results)} new statements")
+    if report_path:
+        write_report(report_path, {"accounts": results})
+    if metrics_path:
+        write_metrics(metrics_path, [x["report"] for x in results if x["report"]])
+    if any(x["status"] != "ok" for x in results):
+        sys.exit(1)
 
-        api = kwh.KitchenerWilmotHydroAPI(data_path=data_path)
-    else:
-        raise RuntimeError(f"Unsupported utility: {utility_name}")
 
-    df = api.cached_history()
+def serve(config_path, host, port, max_workers=None):
+    import signal
+    import threading
+
+    from utility_bill_scraper import daemon, orchestrator
+
+    config = orchestrator.load_config(config_path)
+    host = host or daemon.DEFAULT_HOST
+    port = int(port or daemon.DEFAULT_PORT)
+    server = daemon.Daemon(
+        config["accounts"],
+        make_api,
+        max_workers=max_workers
+        or config.get("max_workers", orchestrator.DEFAULT_MAX_WORKERS),
+        portal_limits=config.get("portal_limits"),
+        interval=config.get("interval", daemon.DEFAULT_INTERVAL),
+        jitter=config.get("jitter", daemon.DEFAULT_JITTER),
+    )
+    host, port = server.serve(host, port)
+    print(f"Serving history on http://{host}:{port}/accounts")
+    server.start()
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopped.set())
+    stopped.wait()
+    print("Stopping...")
+    server.stop()
+
+
+def export(utility_name, data_path, output, google_sa_credentials):
+    with make_api(
+        utility_name, data_path=data_path, google_sa_credentials=google_sa_credentials
+    ) as api:
+        df = api.history()
     ext = os.path.splitext(output.lower())[-1]
     if ext == ".csv":
         df.to_csv(output)
@@ -69,6 +158,59 @@ def export(utility_name, data_path, output, google_sa_credentials):
         df.to_excel(output)
 
 
+def expand_statement_paths(paths):
+    """Expand directories (to the pdfs they contain) and glob patterns in
+    `paths`."""
+    import glob
+
+    pdf_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, "*.pdf"))
+        else:
+            matches = glob.glob(path)
+        if not matches:
+            sys.stderr.write(f"Warning: no statements match `{path}`.\n")
+        pdf_files.extend(sorted(matches))
+    # Drop duplicates (e.g., from overlapping patterns).
+    return list(dict.fromkeys(pdf_files))
+
+
+def extract(
+    utility_name,
+    data_path,
+    paths,
+    google_sa_credentials,
+    max_workers=None,
+    force=False,
+    compression=None,
+):
+    def progress(done, total, pdf):
+        print(f"[{done}/{total}] {os.path.basename(pdf)}")
+
+    with make_api(
+        utility_name,
+        data_path=data_path,
+        google_sa_credentials=google_sa_credentials,
+        compression=compression,
+    ) as api:
+        # Without any paths, extract the statements archived in `data_path`.
+        pdf_files = expand_statement_paths(paths) if paths else None
+        df = api.extract_statements(
+            pdf_files, max_workers=max_workers, force=force, progress=progress
+        )
+    print(f"{'Updated' if force else 'Added'} {len(df)} rows in the history")
+
+
+def add_profile_argument(parser):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run and write a flamegraph-ready profile to the "
+        "`profiles` folder of the data path",
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description="ubs (Utility bill scraper)")
     parser.add_argument("-e", "--env", help="path to .env file")
@@ -96,9 +238,99 @@ def main():
     parser_update.add_argument(
         "-b", "--browser", help="'Firefox' (default) or 'Chrome'"
     )
+    parser_update.add_argument(
+        "--compression",
+        help="compress history and statements stored remotely ('gzip' or 'zstd')",
+    )
+    parser_update.add_argument(
+        "--session-cache",
+        help="directory for the encrypted login session cache ('true' to use the "
+        "default directory)",
+    )
+    parser_update.add_argument(
+        "--listing-cache",
+        help="remember the statements listed on the billing page between runs "
+        "('true' to use the default directory, or a cache directory; Kitchener "
+        "Utilities only)",
+    )
+    parser_update.add_argument(
+        "--lean",
+        action="store_true",
+        help="don't load images, fonts, media or third-party analytics",
+    )
+    parser_update.add_argument(
+        "--transport",
+        help="'selenium' (default) or 'odata' (Kitchener Utilities only; talks to "
+        "the portal's OData service without a browser)",
+    )
+
+    parser_update.add_argument(
+        "--report", help="write a JSON report of the run's phases to this path"
+    )
+    parser_update.add_argument(
+        "--metrics",
+        help="write metrics in the Prometheus text format to this path (e.g., "
+        "for the node exporter's textfile collector)",
+    )
+
+    add_profile_argument(parser_update)
+
+    parser_update.add_argument(
+        "--all",
+        action="store_true",
+        help="update every account in a config file (see --config)",
+    )
+    parser_update.add_argument(
+        "--config", help="path to the accounts config file used by --all"
+    )
+    parser_update.add_argument(
+        "-j",
+        "--max-workers",
+        help="maximum number of accounts to update at once (with --all)",
+    )
+
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="keep the accounts in a config file up to date and serve their "
+        "history over http",
+    )
+    parser_serve.add_argument("--config", help="path to the accounts config file")
+    parser_serve.add_argument("--host", help="address to listen on (default=127.0.0.1)")
+    parser_serve.add_argument("--port", help="port to listen on (default=8765)")
+    parser_serve.add_argument(
+        "-j", "--max-workers", help="maximum number of accounts to update at once"
+    )
 
     parser_export = subparsers.add_parser("export")
     parser_export.add_argument("-o", "--output", help="export file path")
+    add_profile_argument(parser_export)
+
+    parser_extract = subparsers.add_parser(
+        "extract",
+        help="extract data from statements that have already been downloaded "
+        "(without starting a browser) and merge it into the history",
+    )
+    parser_extract.add_argument(
+        "paths",
+        nargs="*",
+        help="statements, folders of statements or glob patterns (default: the "
+        "statements archived in the data path)",
+    )
+    parser_extract.add_argument(
+        "-j", "--max-workers", help="maximum number of statements to extract at once"
+    )
+    parser_extract.add_argument(
+        "--force",
+        action="store_true",
+        help="re-extract statements that are already in the history and replace "
+        "their rows (e.g., after a parser fix)",
+    )
+    parser_extract.add_argument(
+        "--compression",
+        help="compress the history stored remotely ('gzip' or 'zstd'; use the "
+        "same codec as `update`)",
+    )
+    add_profile_argument(parser_extract)
 
     args = parser.parse_args(sys.argv[1:])
 
@@ -112,13 +344,49 @@ def main():
         "GOOGLE_SA_CREDENTIALS"
     )
 
-    from utility_bill_scraper import is_gdrive_path
+    profile = contextlib.nullcontext()
+    if getattr(args, "profile", False):
+        from utility_bill_scraper import profiling
+
+        profile = profiling.profile(
+            profiling.output_dir(data_path), "ubs-" + args.subcommand
+        )
+
+    from utility_bill_scraper.storage import is_gdrive_path
 
     def missing_required_arg(arg):
         sys.stderr.write(f"Error: no `{arg}` set.\n")
         parser.print_help()
         sys.exit(2)
 
+    if args.subcommand == "serve":
+        config_path = args.config or os.getenv("UBS_CONFIG")
+        if config_path is None:
+            missing_required_arg("config")
+        max_workers = args.max_workers or os.getenv("MAX_WORKERS")
+        serve(
+            config_path,
+            args.host or os.getenv("UBS_HOST"),
+            args.port or os.getenv("UBS_PORT"),
+            int(max_workers) if max_workers else None,
+        )
+        return
+
+    if args.subcommand == "update" and args.all:
+        # Accounts (and their settings) come from the config file.
+        config_path = args.config or os.getenv("UBS_CONFIG")
+        if config_path is None:
+            missing_required_arg("config")
+        max_workers = args.max_workers or os.getenv("MAX_WORKERS")
+        with profile:
+            update_all(
+                config_path,
+                int(max_workers) if max_workers else None,
+                args.report or os.getenv("REPORT"),
+                args.metrics or os.getenv("METRICS"),
+            )
+        return
+
     if is_gdrive_path(data_path) and google_sa_credentials is None:
         missing_required_arg("google-sa-credentials")
 
@@ -130,6 +398,15 @@ def main():
         password = args.password or os.getenv("PASSWORD")
         browser = args.browser or os.getenv("BROWSER", "Firefox")
         print(f"BROWSER: { browser }")
+        compression = args.compression or os.getenv("COMPRESSION")
+        session_cache = parse_cache_option(
+            args.session_cache or os.getenv("SESSION_CACHE")
+        )
+        listing_cache = parse_cache_option(
+            args.listing_cache or os.getenv("LISTING_CACHE")
+        )
+        lean = args.lean or os.getenv("LEAN", "").lower() in ("true", "1")
+        transport = args.transport or os.getenv("TRANSPORT")
 
         # Default for save statements is True
         save_statements = os.getenv("SAVE_STATEMENTS", True)
@@ -144,21 +421,42 @@ def main():
             missing_required_arg("user")
         if password is None:
             missing_required_arg("password")
-        update(
-            utility_name,
-            user,
-            password,
-            data_path,
-            save_statements,
-            max_downloads,
-            google_sa_credentials,
-            browser,
-        )
+        with profile:
+            update(
+                utility_name,
+                user,
+                password,
+                data_path,
+                save_statements,
+                max_downloads,
+                google_sa_credentials,
+                browser,
+                compression,
+                session_cache,
+                lean,
+                transport,
+                args.report or os.getenv("REPORT"),
+                args.metrics or os.getenv("METRICS"),
+                listing_cache,
+            )
     elif args.subcommand == "export":
         output = args.output or os.getenv("OUTPUT")
         if output is None:
             missing_required_arg("output")
-        export(utility_name, data_path, output, google_sa_credentials)
+        with profile:
+            export(utility_name, data_path, output, google_sa_credentials)
+    elif args.subcommand == "extract":
+        max_workers = args.max_workers or os.getenv("MAX_WORKERS")
+        with profile:
+            extract(
+                utility_name,
+                data_path,
+                args.paths,
+                google_sa_credentials,
+                int(max_workers) if max_workers else None,
+                args.force,
+                args.compression or os.getenv("COMPRESSION"),
+            )
 
 
 if __name__ == "__main__":
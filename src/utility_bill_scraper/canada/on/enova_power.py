@@ -1,10 +1,10 @@
-import glob
+import calendar
 import datetime
+import json
 import os
 import random
 import re
 import shutil
-import tempfile
 import time
 
 import arrow
@@ -15,13 +15,14 @@ from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 
 from utility_bill_scraper import (
-    Timeout,
     UtilityAPI,
     format_fields,
     pdf_to_html,
+    storage,
     wait_for_element,
     is_number,
 )
+from utility_bill_scraper.dom import read_table
 
 
 re_consumption = (
@@ -39,6 +40,9 @@ re_consumption = (
 
 NAME = "Kitchener-Wilmot Hydro"
 
+# Records which months of hourly data have been downloaded (in `data_path`).
+HOURLY_CHECKPOINT_NAME = "hourly_checkpoint.json"
+
 
 def get_consumption(soup):
     def _get_consumption(soup):
@@ -243,6 +247,9 @@ def get_amount_due(soup):
 
 class EnovaPowerAPI(UtilityAPI):
     name = NAME
+    _session_url = (
+        "https://myaccount.enovapower.com/app/capricorn?para=greenButtonPromptV3&inquiryType=electric&tab=GBDMD&deviceLandingPage=GBDMD"
+    )
 
     def __init__(
         self,
@@ -255,6 +262,9 @@ class EnovaPowerAPI(UtilityAPI):
         timeout=10,
         save_statements=True,
         google_sa_credentials=None,
+        compression=None,
+        session_cache=None,
+        lean=False,
     ):
         super().__init__(
             user=user,
@@ -266,6 +276,9 @@ class EnovaPowerAPI(UtilityAPI):
             timeout=timeout,
             save_statements=save_statements,
             google_sa_credentials=google_sa_credentials,
+            compression=compression,
+            session_cache=session_cache,
+            lean=lean,
         )
         self._resolutions_available.append("hourly")
         if not hasattr(self, "_hourly_history"):
@@ -277,14 +290,40 @@ class EnovaPowerAPI(UtilityAPI):
         self._driver.find_element(By.ID, "password").send_keys(self._password)
         self._driver.find_element(By.ID, "login_btn").click()
 
-    def download_hourly_data(self, start_date=None, end_date=None):
-        self._init_driver()
+    def _is_logged_in(self):
+        # Wait for either the account navigation or the login form.
+        def page_loaded(driver):
+            if driver.find_elements(By.LINK_TEXT, "Bills & Payment"):
+                return "logged in"
+            if driver.find_elements(By.ID, "accessCode"):
+                return "login form"
+            return None
 
-        df_new_rows = pd.DataFrame()
+        return self._wait(page_loaded, name="session check") == "logged in"
+
+    def _hourly_checkpoint_path(self):
+        return storage.join(self.name, HOURLY_CHECKPOINT_NAME)
 
+    def _load_hourly_checkpoint(self):
+        """Return the set of months (e.g., "2021-10") whose hourly data has
+        been downloaded."""
         try:
-            self._login()
+            data = self._storage.read(self._hourly_checkpoint_path())
+        except FileNotFoundError:
+            return set()
+        return set(json.loads(data)["completed"])
+
+    def _save_hourly_checkpoint(self, completed):
+        self._storage.write(
+            self._hourly_checkpoint_path(),
+            json.dumps({"completed": sorted(completed)}, indent=2).encode("utf-8"),
+            mimetype="application/json",
+        )
+
+    def download_hourly_data(self, start_date=None, end_date=None):
+        df_new_rows = pd.DataFrame()
 
+        with self.session():
             yesterday = arrow.get().date() - datetime.timedelta(days=1)
 
             if not start_date:
@@ -306,10 +345,22 @@ class EnovaPowerAPI(UtilityAPI):
 
             last_update = None
             if len(self._hourly_history):
-                last_update = self._hourly_history.index[-1].date()
+                last_update = self._hourly_history.index[-1]
+
+            # Months that were completed by an earlier (possibly interrupted)
+            # run, including months without any data.
+            checkpoint = self._load_hourly_checkpoint()
 
             for date in date_range:
-                if last_update and date <= last_update:
+                month = "%d-%02d" % (date.year, date.month)
+                last_day = calendar.monthrange(date.year, date.month)[1]
+                # The current month is only complete once its last day is
+                # available.
+                complete = date.day == last_day
+
+                if last_update and date <= last_update.date():
+                    continue
+                if month in checkpoint:
                     continue
 
                 print(
@@ -317,170 +368,168 @@ class EnovaPowerAPI(UtilityAPI):
                     % (date.year, date.month, date.year, date.month, date.day)
                 )
 
-                # Wait a random period between requests so that we don't get blocked
-                time.sleep(5 + random.random() * 5)
-
-                # Navigate directly to the Electric Downloads page (Green Button Downloads)
-                # This is a sub-tab within the Smart Meter section
-                url = "https://myaccount.enovapower.com/app/capricorn?para=greenButtonPromptV3&inquiryType=electric&tab=GBDMD&deviceLandingPage=GBDMD"
-                self._driver.get(url)
-
-                # Wait for the date input fields to be present
-                from selenium.webdriver.support.ui import WebDriverWait
-                from selenium.webdriver.support import expected_conditions as EC
-
-                wait = WebDriverWait(self._driver, self._timeout)
-                wait.until(EC.presence_of_element_located((By.ID, "GB_fromDate")))
-
-                # Set the date range in the Electric Downloads section (Green Button section)
-                # Format dates as MM/DD/YYYY
-                from_date_str = "%02d/01/%d" % (date.month, date.year)
-                to_date_str = "%02d/%02d/%d" % (date.month, date.day, date.year)
-
-                # Set the visible date fields
-                from_date_field = self._driver.find_element(By.ID, "GB_fromDate")
-                from_date_field.clear()
-                from_date_field.send_keys(from_date_str)
-
-                to_date_field = self._driver.find_element(By.ID, "GB_toDate")
-                to_date_field.clear()
-                to_date_field.send_keys(to_date_str)
-
-                # Set to Hourly granularity
-                # The radio button is hidden inside a Bootstrap button group, so click the label instead
-                hourly_labels = self._driver.find_elements(By.XPATH, '//label[contains(@class, "btn") and .//input[@name="hourlyOrDaily"][@value="Hourly"]]')
-                if hourly_labels:
-                    self._driver.execute_script("arguments[0].scrollIntoView(true);", hourly_labels[0])
-                    time.sleep(0.5)
-                    hourly_labels[0].click()
-
-                time.sleep(1)  # Brief wait after setting options
-
-                def is_valid_date_range():
-                    valid_date_range = True
-                    try:
-                        valid_date_range = not self._driver.find_element(By.CLASS_NAME,
-                            "alert.alert-danger"
-                        ).text.startswith(
-                            "You are not authorized to view the selected date range."
-                        )
-                    except NoSuchElementException:
-                        pass
-                    return valid_date_range
-
-                # Check if this date range is valid
-                if not is_valid_date_range():
-                    print("  No data for this date range.")
+                # If the browser crashes or the session expires, log in again
+                # and retry this month.
+                df = self._retry_with_restarts(
+                    lambda: self._download_hourly_month(date),
+                    "Downloading hourly data for %s" % month,
+                )
+                if df is None:
+                    if complete:
+                        checkpoint.add(month)
+                        self._save_hourly_checkpoint(checkpoint)
                     continue
 
-                # Wait a random period between requests so that we don't get blocked
-                time.sleep(5 + random.random() * 5)
-
-                # Wait a bit longer to ensure data is fully loaded before downloading
-                time.sleep(3)
-
-                # Click the SPREADSHEET download button (not the chart download button)
-                # This is in the "Electric Downloads" section of the Smart Meter page
-                download_button = self._driver.find_element(By.ID, "DownloadToSpreadsheetButton")
-                download_button.click()
-
-                # Wait for the CSV file to be downloaded
-                # Enova downloads files named like "SmartMeter8493100000_YYYY-MM-DDHH.MM.SS.csv"
-                import glob
-                t_start = time.time()
-                filepath = None
-                last_size = 0
-                stable_count = 0
-
-                while time.time() - t_start < self._timeout:
-                    # Look for CSV files (excluding Chrome temp files)
-                    files = [f for f in glob.glob(os.path.join(self._temp_download_dir, "*.csv"))
-                             if not f.endswith('.crdownload') and not f.endswith('.tmp')]
-
-                    if files:
-                        # Sort by modification time (most recent first)
-                        files.sort(key=os.path.getmtime, reverse=True)
-                        candidate = files[0]
-
-                        # Check if file size is stable (hasn't changed)
-                        try:
-                            current_size = os.path.getsize(candidate)
-                            if current_size > 0:
-                                if current_size == last_size:
-                                    stable_count += 1
-                                    if stable_count >= 3:  # File size stable for 3 checks
-                                        filepath = candidate
-                                        break
-                                else:
-                                    stable_count = 0
-                                    last_size = current_size
-                        except OSError:
-                            pass  # File might be in use
-
-                    time.sleep(0.5)
-
-                if not filepath:
-                    raise Timeout("Timed out waiting for CSV download")
-
-                # Read the csv file
-                # Note: The CSV from Electric Downloads has trailing commas on data rows
-                # which creates an extra empty column. We need to handle this carefully.
-
-                # Read all lines and fix the trailing comma issue
-                with open(filepath, 'r') as f:
-                    lines = f.readlines()
-
-                # Remove trailing commas from data rows (but keep header as-is)
-                cleaned_lines = [lines[0]]  # Keep header
-                for line in lines[1:-1]:  # Process data rows (skip last note line)
-                    if line.strip().endswith(','):
-                        cleaned_lines.append(line.rstrip(',\n') + '\n')
-                    else:
-                        cleaned_lines.append(line)
-
-                # Parse the cleaned CSV
-                import io
-                df_csv = pd.read_csv(io.StringIO(''.join(cleaned_lines)))
-
-                # Create an hourly index
-                index = pd.date_range(
-                    df_csv["Reading Date"].iloc[0],
-                    (
-                        arrow.get(df_csv["Reading Date"].iloc[-1])
-                        + datetime.timedelta(days=1)
-                    )
-                    .date()
-                    .isoformat(),
-                    freq="h",
-                )[:-1]
-
-                # Create a new dataframe to store the reformatted data
-                df = pd.DataFrame({"kWh": np.zeros(len(index))}, index=index)
-                df.index = pd.to_datetime(df.index)
-                df.index.name = "Datetime"
-
-                # Reformat the data indexed by a timestamp
-                for i, row in df_csv.iterrows():
-                    date = pd.Timestamp(row["Reading Date"])
-                    hourly_values = row.iloc[1:25].values
-                    for hour in range(24):
-                        timestamp = date + pd.Timedelta(hours=hour+1)
-                        df.loc[timestamp, "kWh"] = hourly_values[hour]
-
-                # Append the reformatted data
+                # The portal may not have published the last days yet, so
+                # the month is only complete if the data reaches midnight
+                # after its last day.
+                complete = len(df) > 0 and df.index[-1] >= pd.Timestamp(
+                    date.year, date.month, last_day
+                ) + pd.Timedelta(days=1)
+
+                # Commit this month before moving on to the next one, so that
+                # an interrupted backfill doesn't lose it. Note that each day
+                # ends at midnight of the following day, so compare
+                # timestamps rather than dates.
                 if last_update:
-                    df_new_rows = pd.concat([df_new_rows, df[df.index.date > last_update]])
-                else:
+                    df = df[df.index > last_update]
+                if len(df):
+                    self._hourly_history = pd.concat([self._hourly_history, df])
+                    self._hourly_history.index = pd.to_datetime(
+                        self._hourly_history.index
+                    )
+                    self._write_history("hourly", self._hourly_history)
+                    last_update = self._hourly_history.index[-1]
                     df_new_rows = pd.concat([df_new_rows, df])
-        finally:
-            self._close_driver()
+                if complete:
+                    checkpoint.add(month)
+                    self._save_hourly_checkpoint(checkpoint)
 
-        if len(df_new_rows):
-            self._hourly_history = pd.concat([self._hourly_history, df_new_rows])
-            self._hourly_history.index = pd.to_datetime(self._hourly_history.index)
-            self._update_history()
         return df_new_rows
 
+    def _download_hourly_month(self, date):
+        """Download the hourly data from the first of `date`'s month to `date`.
+
+        Returns a DataFrame indexed by timestamp, or None if the portal has no
+        data for this date range.
+        """
+        # Wait a random period between requests so that we don't get blocked
+        time.sleep(5 + random.random() * 5)
+
+        # Navigate directly to the Electric Downloads page (Green Button Downloads)
+        # This is a sub-tab within the Smart Meter section
+        url = "https://myaccount.enovapower.com/app/capricorn?para=greenButtonPromptV3&inquiryType=electric&tab=GBDMD&deviceLandingPage=GBDMD"
+        # Wait for the date input fields to be present
+        from selenium.webdriver.support import expected_conditions as EC
+
+        with self._timings.span("navigate"):
+            self._driver.get(url)
+            self._wait(
+                EC.presence_of_element_located((By.ID, "GB_fromDate")),
+                name="GB_fromDate",
+            )
+
+        # Set the date range in the Electric Downloads section (Green Button section)
+        # Format dates as MM/DD/YYYY
+        from_date_str = "%02d/01/%d" % (date.month, date.year)
+        to_date_str = "%02d/%02d/%d" % (date.month, date.day, date.year)
+
+        # Set the visible date fields
+        from_date_field = self._driver.find_element(By.ID, "GB_fromDate")
+        from_date_field.clear()
+        from_date_field.send_keys(from_date_str)
+
+        to_date_field = self._driver.find_element(By.ID, "GB_toDate")
+        to_date_field.clear()
+        to_date_field.send_keys(to_date_str)
+
+        # Set to Hourly granularity
+        # The radio button is hidden inside a Bootstrap button group, so click the label instead
+        hourly_labels = self._driver.find_elements(By.XPATH, '//label[contains(@class, "btn") and .//input[@name="hourlyOrDaily"][@value="Hourly"]]')
+        if hourly_labels:
+            self._driver.execute_script("arguments[0].scrollIntoView(true);", hourly_labels[0])
+            time.sleep(0.5)
+            hourly_labels[0].click()
+
+        time.sleep(1)  # Brief wait after setting options
+
+        def is_valid_date_range():
+            valid_date_range = True
+            try:
+                valid_date_range = not self._driver.find_element(By.CLASS_NAME,
+                    "alert.alert-danger"
+                ).text.startswith(
+                    "You are not authorized to view the selected date range."
+                )
+            except NoSuchElementException:
+                pass
+            return valid_date_range
+
+        # Check if this date range is valid
+        if not is_valid_date_range():
+            print("  No data for this date range.")
+            return None
+
+        # Wait a random period between requests so that we don't get blocked
+        time.sleep(5 + random.random() * 5)
+
+        # Wait a bit longer to ensure data is fully loaded before downloading
+        time.sleep(3)
+
+        # Click the SPREADSHEET download button (not the chart download button)
+        # This is in the "Electric Downloads" section of the Smart Meter page
+        download_button = self._driver.find_element(By.ID, "DownloadToSpreadsheetButton")
+
+        # Wait for the CSV file to be downloaded
+        # Enova downloads files named like "SmartMeter8493100000_YYYY-MM-DDHH.MM.SS.csv"
+        filepath = self._download(download_button.click, "csv")
+
+        # Read the csv file
+        # Note: The CSV from Electric Downloads has trailing commas on data rows
+        # which creates an extra empty column. We need to handle this carefully.
+
+        # Read all lines and fix the trailing comma issue
+        with open(filepath, 'r') as f:
+            lines = f.readlines()
+
+        # Remove trailing commas from data rows (but keep header as-is)
+        cleaned_lines = [lines[0]]  # Keep header
+        for line in lines[1:-1]:  # Process data rows (skip last note line)
+            if line.strip().endswith(','):
+                cleaned_lines.append(line.rstrip(',\n') + '\n')
+            else:
+                cleaned_lines.append(line)
+
+        # Parse the cleaned CSV
+        import io
+        df_csv = pd.read_csv(io.StringIO(''.join(cleaned_lines)))
+
+        # Create an hourly index
+        index = pd.date_range(
+            df_csv["Reading Date"].iloc[0],
+            (
+                arrow.get(df_csv["Reading Date"].iloc[-1])
+                + datetime.timedelta(days=1)
+            )
+            .date()
+            .isoformat(),
+            freq="h",
+        )[:-1]
+
+        # Create a new dataframe to store the reformatted data
+        df = pd.DataFrame({"kWh": np.zeros(len(index))}, index=index)
+        df.index = pd.to_datetime(df.index)
+        df.index.name = "Datetime"
+
+        # Reformat the data indexed by a timestamp
+        for i, row in df_csv.iterrows():
+            reading_date = pd.Timestamp(row["Reading Date"])
+            hourly_values = row.iloc[1:25].values
+            for hour in range(24):
+                timestamp = reading_date + pd.Timedelta(hours=hour+1)
+                df.loc[timestamp, "kWh"] = hourly_values[hour]
+        return df
+
     def extract_data(self, pdf):
         html_file = pdf_to_html(pdf)
         with open(html_file, "r", encoding="utf8") as f:
@@ -509,75 +558,85 @@ class EnovaPowerAPI(UtilityAPI):
         }
 
     def download_statements(self, start_date=None, end_date=None, max_downloads=None):
-        download_path = tempfile.mkdtemp()
-        self._init_driver()
+        download_path = self._workspace.new_dir("statements-")
         downloaded_files = []
 
-        try:
-            self._login()
-
+        with self.session():
             # convert start and end dates to date objects
             if start_date:
                 start_date = arrow.get(start_date).date()
             if end_date:
                 end_date = arrow.get(end_date).date()
 
-            # Iterate through the invoices in reverse chronological order
-            # (i.e., newest invoices are first).
+            def list_and_download():
+                # Iterate through the invoices in reverse chronological order
+                # (i.e., newest invoices are first).
 
-            # Open Bills & Payment
-            link = self._driver.find_element(By.LINK_TEXT, "Bills & Payment")
-            link.location_once_scrolled_into_view
-            link.click()
-            self._driver.switch_to.frame("iframe-BILLINQ")
+                # Open Bills & Payment
+                with self._timings.span("navigate"):
+                    self._driver.switch_to.default_content()
+                    link = self._driver.find_element(By.LINK_TEXT, "Bills & Payment")
+                    link.location_once_scrolled_into_view
+                    link.click()
+                    self._driver.switch_to.frame("iframe-BILLINQ")
 
-            @wait_for_element
-            def get_bills_table():
-                return self._driver.find_element(By.ID, "billsTable")
+                @wait_for_element
+                def get_bills_table():
+                    return self._driver.find_element(By.ID, "billsTable")
 
-            @wait_for_element
-            def get_bills_table_rows(bills_table):
-                rows = [
-                    [y for y in x.find_elements(By.TAG_NAME, "td")]
-                    for x in bills_table.find_element(By.TAG_NAME,
-                        "tbody"
-                    ).find_elements(By.TAG_NAME, "tr")
-                ]
-                return rows
+                @wait_for_element
+                def get_bills_table_rows(bills_table):
+                    # Raises `NoSuchElementException` until the table body exists.
+                    tbody = bills_table.find_element(By.TAG_NAME, "tbody")
+                    return read_table(self._driver, tbody)
 
-            bills_table = get_bills_table()
-            rows = get_bills_table_rows(bills_table)
+                bills_table = get_bills_table()
+                rows = get_bills_table_rows(bills_table)
 
-            data = []
-            for row in rows:
-                row_data = [x.text for x in row[1:]]
+                data = []
+                for row in rows:
+                    row_data = [x["text"] for x in row[1:]]
 
-                date = arrow.get(row_data[0], "MMM D, YYYY").date()
+                    date = arrow.get(row_data[0], "MMM D, YYYY").date()
 
-                if start_date and date < start_date:
-                    break
+                    if start_date and date < start_date:
+                        break
 
-                if end_date and date > end_date:
-                    continue
+                    if end_date and date > end_date:
+                        continue
 
-                if max_downloads and len(downloaded_files) >= max_downloads:
-                    break
+                    if max_downloads and len(downloaded_files) >= max_downloads:
+                        break
 
-                data.append(row_data)
-                new_filepath = os.path.join(
-                    download_path,
-                    "%s - %s - $%s.pdf"
-                    % (date.isoformat(), self.name, row_data[1].split(" ")[1]),
-                )
+                    data.append(row_data)
+                    name = "%s - %s - $%s.pdf" % (
+                        date.isoformat(),
+                        self.name,
+                        row_data[1].split(" ")[1],
+                    )
+
+                    # Skip statements handled by an earlier attempt.
+                    if name in [os.path.basename(x) for x in downloaded_files]:
+                        continue
+
+                    # Skip statements that have already been archived.
+                    filepath = self._archived_statement(name, download_path)
+                    if filepath:
+                        downloaded_files.append(filepath)
+                        self._statement_ready(filepath)
+                        continue
 
-                downloaded_files.append(new_filepath)
-                if not os.path.exists(new_filepath):
                     # download the pdf invoice
-                    img = row[0].find_element(By.TAG_NAME, "img")
+                    new_filepath = os.path.join(download_path, name)
+                    img = row[0]["imgs"][0]["element"]
                     filepath = self.download_link(img, "pdf")
                     shutil.move(filepath, new_filepath)
-        finally:
-            self._close_driver()
+                    downloaded_files.append(new_filepath)
+                    self._statement_ready(new_filepath)
+
+            # If the browser crashes or the session expires, log in again and
+            # carry on with the statements that haven't been downloaded yet.
+            self._retry_with_restarts(list_and_download, "Downloading statements")
 
         if self._save_statements:
             downloaded_files = self._copy_statements_to_data_path(downloaded_files)
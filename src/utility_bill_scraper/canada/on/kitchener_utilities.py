@@ -2,29 +2,57 @@ import calendar
 import os
 import re
 import shutil
-import tempfile
-import time
 
 import arrow
 import pandas as pd
 from bs4 import BeautifulSoup
-from selenium.common.exceptions import (
-    NoSuchElementException,
-    StaleElementReferenceException,
-)
 from selenium.webdriver.common.by import By
 
 from utility_bill_scraper import (
-    Timeout,
     UtilityAPI,
     convert_divs_to_df,
     format_fields,
     pdf_to_html,
 )
+from utility_bill_scraper import waits
+from utility_bill_scraper.dom import read_table
+from utility_bill_scraper.listing_cache import ListingCache
+from utility_bill_scraper.sap_umc import UMCClient
 
 
 NAME = "Kitchener Utilities"
 
+# The portal's OData service is used by the "odata" transport.
+PORTAL_URL = "https://ebilling.kitchener.ca"
+TRANSPORTS = ["selenium", "odata"]
+
+
+def _row_texts(rows):
+    return [[x["text"] for x in row] for row in rows]
+
+
+# Text of the row that the portal shows in place of an empty table's rows.
+NO_DATA_TEXT = "No data"
+
+
+def _shows_no_data(rows):
+    """Return True if `rows` are those of an empty table (i.e., there are no
+    rows, or the only text is the portal's "no data" row)."""
+    texts = [x for row in _row_texts(rows) for x in row if x]
+    return not rows or (
+        len(texts) > 0 and all(x.lower() == NO_DATA_TEXT.lower() for x in texts)
+    )
+
+
+def _listing_entry(row_data):
+    """Return the listing cache entry for a row of the billing table."""
+    date = arrow.get(row_data[1], "MM/DD/YYYY").date().isoformat()
+    return {
+        "id": "|".join([row_data[0], date, row_data[3]]),
+        "date": date,
+        "amount": row_data[3],
+    }
+
 
 def get_summary(soup):
     def find_seq_id(tag):
@@ -294,6 +322,7 @@ def get_gas_rates(soup):
 
 class KitchenerUtilitiesAPI(UtilityAPI):
     name = NAME
+    _session_url = "https://ebilling.kitchener.ca/sap/bc/ui5_ui5/sap/ZUMCUI5/index.html"
 
     def __init__(
         self,
@@ -306,6 +335,11 @@ class KitchenerUtilitiesAPI(UtilityAPI):
         timeout=10,
         save_statements=True,
         google_sa_credentials=None,
+        compression=None,
+        session_cache=None,
+        lean=False,
+        transport="selenium",
+        listing_cache=None,
     ):
         super().__init__(
             user=user,
@@ -317,7 +351,44 @@ class KitchenerUtilitiesAPI(UtilityAPI):
             timeout=timeout,
             save_statements=save_statements,
             google_sa_credentials=google_sa_credentials,
+            compression=compression,
+            session_cache=session_cache,
+            lean=lean,
         )
+        # "selenium" drives the portal in a browser; "odata" talks to its
+        # OData service directly (no browser required).
+        if transport not in TRANSPORTS:
+            raise RuntimeError(
+                f"`transport`={transport} is invalid. Supported transports are "
+                + ",".join([f'"{x}"' for x in TRANSPORTS])
+                + "."
+            )
+        self._transport = transport
+        self._odata_client = None
+
+        # Optionally cache the billing table's rows so that later runs can
+        # stop paging once they reach rows that were already seen (`True`
+        # uses the default directory; a string is the path to a cache
+        # directory).
+        self._listing_cache = None
+        if listing_cache:
+            self._listing_cache = ListingCache(
+                self.name,
+                user,
+                None if listing_cache is True else listing_cache,
+            )
+
+    @property
+    def _uses_browser(self):
+        return self._transport == "selenium"
+
+    @property
+    def _odata(self):
+        if self._odata_client is None:
+            self._odata_client = UMCClient(
+                PORTAL_URL, self._user, self._password, timeout=self._timeout
+            )
+        return self._odata_client
 
     def _login(self):
         self._driver.get(
@@ -328,205 +399,323 @@ class KitchenerUtilitiesAPI(UtilityAPI):
         self._driver.find_element(By.ID, "__field0").send_keys(self._password)
         self._driver.find_element(By.ID, "__button0").click()
 
+    def _is_logged_in(self):
+        # Wait for either the header navigation bar or the login form.
+        def page_loaded(driver):
+            if driver.find_elements(By.ID, "headerNavigationBar"):
+                return "logged in"
+            if driver.find_elements(By.ID, "__field1"):
+                return "login form"
+            return None
+
+        return self._wait(page_loaded, name="session check") == "logged in"
+
     def _get_header_nav_bar(self):
-        result = None
-        t_start = time.time()
-        while time.time() - t_start < self._timeout:
-            try:
-                pages = self._driver.find_element(By.ID,
-                    "headerNavigationBar"
-                ).find_elements(By.TAG_NAME, "li")
-                keys = [x.text for x in pages]
-                result = dict(zip(keys, pages))
-                result.pop("", None)
-                return result
-            except NoSuchElementException:
-                pass
-        raise Timeout
+        def header_nav_bar(driver):
+            pages = driver.find_element(By.ID, "headerNavigationBar").find_elements(
+                By.TAG_NAME, "li"
+            )
+            keys = [x.text for x in pages]
+            result = dict(zip(keys, pages))
+            result.pop("", None)
+            return result
+
+        return self._wait(header_nav_bar)
 
     def _get_contracts(self):
         # Pick the account (e.g., "Gas", "Water and Sewer", "Stormwater")
-        contract_table = self._driver.find_element(By.ID,
-            "ContractTable-table"
-        ).find_element(By.TAG_NAME, "tbody")
-        rows = contract_table.find_elements(By.TAG_NAME, "tr")
-
-        contracts = [x.find_elements(By.TAG_NAME, "td")[0] for x in rows]
-        keys = [x.text for x in contracts]
-        return dict(zip(keys, contracts))
+        contract_table = self._driver.find_element(By.ID, "ContractTable-table")
+        rows = read_table(self._driver, contract_table)
+        return {row[0]["text"]: row[0]["element"] for row in rows}
 
     def _first_page(self):
-        # Get a list of the pages available
-        t_start = time.time()
-        link = None
-        while time.time() - t_start < self._timeout:
-            try:
-                link = self._driver.find_element(By.ID,
-                    "__table1-paginator--firstPageLink"
-                )
-                link.location_once_scrolled_into_view
-                link.click()
-                return
-            except NoSuchElementException:
-                pass
-            except StaleElementReferenceException:
-                pass
-        raise Timeout
+        def click_first_page(driver):
+            link = driver.find_element(By.ID, "__table1-paginator--firstPageLink")
+            link.location_once_scrolled_into_view
+            link.click()
+            return True
+
+        self._wait(click_first_page)
 
     def _get_pages(self):
-        # Get a list of the pages available
-        table = None
-        t_start = time.time()
-        while time.time() - t_start < self._timeout:
-            try:
-                table = self._driver.find_element(By.ID, "__table1-paginator-pages")
-                time.sleep(1)
-                break
-            except NoSuchElementException:
-                pass
-
-        if table:
-            time.sleep(0.5)
-            pages = table.find_elements(By.TAG_NAME, "li")
-            keys = [int(x.text) for x in pages]
-            return dict(zip(keys, pages))
-        else:
-            raise Timeout
-        return None
+        # Get a list of the pages available (retrying while the paginator
+        # re-renders after a page change).
+        def get_pages(driver):
+            paginator = driver.find_element(By.ID, "__table1-paginator-pages")
+            pages = paginator.find_elements(By.TAG_NAME, "li")
+            return {int(x.text): x for x in pages}
+
+        return self._wait(
+            get_pages,
+            name="paginator",
+            ignored_exceptions=waits.IGNORED_EXCEPTIONS + (ValueError,),
+        )
 
-    def download_statements(self, start_date=None, end_date=None, max_downloads=None):
-        download_path = tempfile.mkdtemp()
-        self._init_driver()
-        downloaded_files = []
+    def _iter_pages(self, read_rows, first_page=True):
+        """Yield the rows of each page of a paginated table, in order.
 
-        try:
-            self._login()
+        Instead of sleeping after each click, wait for the table to show
+        different rows. Stop iterating to stop paging. An empty table yields
+        a single empty page.
+        """
+        if first_page:
+            self._first_page()
 
-            # convert start and end dates to date objects
-            if start_date:
-                start_date = arrow.get(start_date).date()
-            if end_date:
-                end_date = arrow.get(end_date).date()
+        def table_rendered(driver):
+            # Wait for rows with data (rather than the blank rows shown while
+            # the table loads), or for the portal's "no data" row.
+            rows = read_rows()
+            if _shows_no_data(rows):
+                return ([],)
+            return (rows,) if any(x for row in _row_texts(rows) for x in row) else None
+
+        with self._timings.span("navigate"):
+            (rows,) = self._wait(table_rendered, name="table")
+        if not rows:
+            yield rows
+            return
+        visited = set()
+        while True:
+            yield rows
+            pages = self._get_pages()
+            if not visited:
+                visited.add(min(pages))
+            remaining = sorted(x for x in pages if x not in visited)
+            if not remaining:
+                return
+            page = remaining[0]
+            previous = _row_texts(rows)
 
-            def get_data():
-                # Iterate through the statements in reverse chronological order
-                # (i.e., newest statements are first).
+            def page_changed(driver):
+                rows = read_rows()
+                return rows if _row_texts(rows) != previous else None
 
-                billing_table = self._driver.find_element(By.ID, "__table1-table")
+            with self._timings.span("navigate"):
+                link = pages[page]
+                link.location_once_scrolled_into_view
+                link.click()
+                rows = self._wait(page_changed, name="page change")
+            visited.add(page)
 
-                rows = [
-                    [y for y in x.find_elements(By.TAG_NAME, "td")]
-                    for x in billing_table.find_element(By.TAG_NAME,
-                        "tbody"
-                    ).find_elements(By.TAG_NAME, "tr")
-                ]
+    def _read_billing_table(self):
+        billing_table = self._driver.find_element(By.ID, "__table1-table")
+        return read_table(self._driver, billing_table)
 
-                data = []
-                date = None
-                for row in rows:
-                    row_data = [x.text for x in row[1:]]
-                    if row_data[0] == "":
-                        continue
+    def download_statements(self, start_date=None, end_date=None, max_downloads=None):
+        if self._transport == "odata":
+            return self._download_statements_odata(start_date, end_date, max_downloads)
 
-                    date = arrow.get(row_data[1], "MM/DD/YYYY").date()
+        download_path = self._workspace.new_dir("statements-")
+        downloaded_files = []
+
+        # convert start and end dates to date objects
+        if start_date:
+            start_date = arrow.get(start_date).date()
+        if end_date:
+            end_date = arrow.get(end_date).date()
 
-                    if start_date and date < start_date:
-                        break
+        def statement_name(entry):
+            return "%s - %s - $%s.pdf" % (entry["date"], self.name, entry["amount"])
+
+        def in_range(entry):
+            return not (
+                (start_date and entry["date"] < start_date.isoformat())
+                or (end_date and entry["date"] > end_date.isoformat())
+            )
 
-                    if end_date and date > end_date:
+        def done(entry):
+            # Statements are in reverse chronological order (i.e., newest
+            # statements are first), so we can stop as soon as we've checked
+            # a date that is prior to the start date.
+            if start_date and entry["date"] < start_date.isoformat():
+                return True
+            return bool(max_downloads and len(downloaded_files) >= max_downloads)
+
+        cached_rows = self._listing_cache.load() if self._listing_cache else []
+        cached_ids = [x["id"] for x in cached_rows]
+        # Listed rows (by id), and the number of pages that have been fully
+        # handled (so that a retry can skip them).
+        listing = {}
+        pages_done = [0]
+
+        def list_and_download():
+            with self._timings.span("navigate"):
+                self._get_header_nav_bar()["BILLING"].click()
+
+            for page, rows in enumerate(self._iter_pages(self._read_billing_table)):
+                if page < pages_done[0]:
+                    continue
+                rows = [x for x in rows if len(x) > 1 and x[1]["text"] != ""]
+                entries = [_listing_entry([x["text"] for x in row[1:]]) for row in rows]
+                listing.update((x["id"], x) for x in entries)
+                done_names = [os.path.basename(x) for x in downloaded_files]
+
+                for row, entry in zip(rows, entries):
+                    if done(entry):
+                        return
+                    if not in_range(entry):
                         continue
 
-                    if max_downloads and len(downloaded_files) >= max_downloads:
-                        break
+                    # Skip statements handled by an earlier attempt.
+                    name = statement_name(entry)
+                    if name in done_names:
+                        continue
 
-                    data.append(row_data)
-                    new_filepath = os.path.join(
-                        download_path,
-                        "%s - %s - $%s.pdf"
-                        % (date.isoformat(), self.name, row_data[3]),
-                    )
+                    # Skip statements that have already been archived.
+                    filepath = self._archived_statement(name, download_path)
+                    if filepath:
+                        downloaded_files.append(filepath)
+                        self._statement_ready(filepath)
+                        continue
 
+                    # download the pdf statement
+                    new_filepath = os.path.join(download_path, name)
+                    for img in row[0]["imgs"]:
+                        if img["title"] == "PDF":
+                            filepath = self.download_link(img["element"], "pdf")
+                            shutil.move(filepath, new_filepath)
                     downloaded_files.append(new_filepath)
-                    if not os.path.exists(new_filepath):
-                        # download the pdf statement
-                        for img in row[0].find_elements(By.TAG_NAME, "img"):
-                            if img.get_property("title") == "PDF":
-                                filepath = self.download_link(img, "pdf")
-                                shutil.move(filepath, new_filepath)
+                    self._statement_ready(new_filepath)
+
+                pages_done[0] = page + 1
+                if not entries:
+                    return
+
+                # Once a page ends with a row that was seen on an earlier run,
+                # the rest of the listing comes from the cache (as long as
+                # every statement we need from it has already been archived).
+                if entries[-1]["id"] in cached_ids:
+                    names = []
+                    i = cached_ids.index(entries[-1]["id"])
+                    for entry in cached_rows[i + 1 :]:
+                        if start_date and entry["date"] < start_date.isoformat():
+                            break
+                        if in_range(entry):
+                            names.append(statement_name(entry))
+                    if max_downloads:
+                        names = names[: max_downloads - len(downloaded_files)]
+                    archived = self._archived_statements()
+                    if all(x in archived for x in names):
+                        for x in names:
+                            filepath = self._archived_statement(x, download_path)
+                            downloaded_files.append(filepath)
+                            self._statement_ready(filepath)
+                        return
+
+        with self.session():
+            # If the browser crashes or the session expires, log in again and
+            # resume from the first page that wasn't finished.
+            self._retry_with_restarts(list_and_download, "Downloading statements")
+
+        if self._listing_cache:
+            self._listing_cache.update(list(listing.values()))
+
+        if self._save_statements:
+            downloaded_files = self._copy_statements_to_data_path(downloaded_files)
 
-                return data, date
+        return downloaded_files
 
-            self._get_header_nav_bar()["BILLING"].click()
-            self._first_page()
+    def _download_statements_odata(
+        self, start_date=None, end_date=None, max_downloads=None
+    ):
+        download_path = self._workspace.new_dir("statements-")
+        if start_date:
+            start_date = arrow.get(start_date).date()
+        if end_date:
+            end_date = arrow.get(end_date).date()
 
-            pages_downloaded = []
-            pages_to_download = list(self._get_pages().keys())
-            data = []
-            while len(pages_to_download):
-                pages = self._get_pages()
-
-                # Add any new pages that are not in our list
-                for x in pages.keys():
-                    if x not in pages_to_download and x not in pages_downloaded:
-                        pages_to_download += [x]
-
-                # Download the first page in the list
-                i = pages_to_download.pop(0)
-
-                pages[i].click()
-                pages_downloaded += [i]
-                time.sleep(1)
-                page_data, last_date = get_data()
-                data += page_data
-
-                # Because the statments are in reverse chronological order, we
-                # can stop as soon as we've checked a date that is prior to the
-                # start date.
-                if start_date and last_date < start_date:
-                    break
-        finally:
-            self._close_driver()
+        # Invoices are in reverse chronological order (i.e., newest first).
+        invoices = self._odata.invoices(start_date, end_date)
+        if max_downloads:
+            invoices = invoices[:max_downloads]
+
+        downloaded_files = []
+        downloads = []
+        for x in invoices:
+            name = "%s - %s - $%.2f.pdf" % (
+                x["InvoiceDate"].isoformat(),
+                self.name,
+                float(x["AmountDue"]),
+            )
+            # Skip statements that have already been archived.
+            filepath = self._archived_statement(name, download_path)
+            if filepath is None:
+                filepath = os.path.join(download_path, name)
+                downloads.append((x["InvoiceID"], filepath))
+            downloaded_files.append(filepath)
+        if downloads:
+            # The invoices are downloaded in parallel, so they're timed as one
+            # batch.
+            with self._timings.span("download_invoices") as span:
+                self._odata.download_invoices(downloads)
+                span.bytes = sum(os.path.getsize(x) for _, x in downloads)
+        for filepath in downloaded_files:
+            self._statement_ready(filepath)
 
         if self._save_statements:
             downloaded_files = self._copy_statements_to_data_path(downloaded_files)
 
         return downloaded_files
 
+    def _get_consumption_history_odata(self, contract):
+        # `contract` is the name shown in the portal's contract table (e.g.,
+        # "Gas"); also accept a contract id.
+        contracts = self._odata.contracts()
+        matches = [
+            x
+            for x in contracts
+            if contract in (x.get("Description"), x.get("ContractID"))
+        ]
+        if not matches:
+            raise KeyError(contract)
+
+        # sum values within the same month
+        results = {}
+        for value in self._odata.consumption(matches[0]["ContractID"]):
+            date = value["EndDate"] or value["StartDate"]
+            date = "%d-%02d-%02d" % (
+                date.year,
+                date.month,
+                calendar.monthrange(date.year, date.month)[1],
+            )
+            results[date] = results.get(date, 0) + float(value["ConsumptionValue"])
+        results = dict(sorted(results.items()))
+        return pd.Series(list(results.values()), index=list(results.keys()))
+
     def get_consumption_history(self, contract):
-        self._init_driver()
+        if self._transport == "odata":
+            return self._get_consumption_history_odata(contract)
 
-        try:
+        with self.session():
 
-            def get_data():
+            def read_rows():
                 # The Consumption history div (this contains all of the data we are interested in)
-                consumption_history = (
-                    self._driver.find_element(By.ID, "contractConsumptionHistory")
-                    .find_element(By.ID, "__table1-table")
-                    .find_element(By.TAG_NAME, "tbody")
+                consumption_history = self._driver.find_element(
+                    By.CSS_SELECTOR, "#contractConsumptionHistory #__table1-table"
                 )
-                rows = consumption_history.find_elements(By.TAG_NAME, "tr")
-                data = [
-                    [y.text for y in x.find_elements(By.TAG_NAME, "td")] for x in rows
-                ]
-                return data
+                return read_table(self._driver, consumption_history)
 
-            self._login()
+            def read_history():
+                self._get_header_nav_bar()["ACCOUNTS"].click()
+                self._get_contracts()[contract].click()
 
-            self._get_header_nav_bar()["ACCOUNTS"].click()
-            self._get_contracts()[contract].click()
-
-            # Click on the "Consumption History" tab
-            link = self._driver.find_element(By.ID, "contractDetailNavigationBarItem2")
-            link.location_once_scrolled_into_view
-            link.click()
-            time.sleep(0.5)
-
-            data = []
-            for page in self._get_pages().keys():
-                link = self._get_pages()[page]
+                # Click on the "Consumption History" tab
+                link = self._driver.find_element(
+                    By.ID, "contractDetailNavigationBarItem2"
+                )
                 link.location_once_scrolled_into_view
                 link.click()
-                data += get_data()
+
+                data = []
+                for rows in self._iter_pages(read_rows, first_page=False):
+                    data += _row_texts(rows)
+                return data
+
+            # If the browser crashes or the session expires, log in again and
+            # read the history from the start.
+            data = self._retry_with_restarts(
+                read_history, "Reading the consumption history"
+            )
 
             # sum values that have the same date
             dates = [x for x, y in data]
@@ -535,8 +724,6 @@ class KitchenerUtilitiesAPI(UtilityAPI):
             for date, consumption in data:
                 if date != "":
                     results[date] += float(consumption)
-        finally:
-            self._close_driver()
 
         def convert_to_series(data):
             dates = [
@@ -0,0 +1,83 @@
+"""Optional transparent compression for objects stored remotely.
+
+Compressed objects keep their original name with a codec-specific suffix
+appended (e.g., `2023.csv.gz` or `2021-10-18 - Kitchener Utilities -
+$102.30.pdf.zst`), so the codec can always be recovered from the name alone.
+"""
+
+import gzip
+
+# Supported codecs and the suffix appended to compressed object names.
+SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+MIMETYPES = {
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+}
+
+
+class UnsupportedCompression(Exception):
+    pass
+
+
+def validate(codec):
+    if codec is not None and codec not in SUFFIXES:
+        raise UnsupportedCompression(
+            f"`compression`={codec} is invalid. Supported codecs are "
+            + ",".join([f'"{x}"' for x in SUFFIXES])
+            + "."
+        )
+    return codec
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise UnsupportedCompression(
+            "zstd compression requires the `zstandard` package "
+            "(`pip install zstandard`)."
+        )
+    return zstandard
+
+
+def compress(data, codec):
+    if codec is None:
+        return data
+    elif codec == "gzip":
+        # Set `mtime` so that identical inputs produce identical outputs.
+        return gzip.compress(data, mtime=0)
+    elif codec == "zstd":
+        return _zstandard().ZstdCompressor().compress(data)
+    validate(codec)
+
+
+def decompress(data, codec):
+    if codec is None:
+        return data
+    elif codec == "gzip":
+        return gzip.decompress(data)
+    elif codec == "zstd":
+        return _zstandard().ZstdDecompressor().decompress(data)
+    validate(codec)
+
+
+def add_suffix(name, codec):
+    return name + SUFFIXES[codec] if codec else name
+
+
+def codec_from_name(name):
+    """Return the codec used for the object `name` (or None if the object is
+    not compressed)."""
+    for codec, suffix in SUFFIXES.items():
+        if name.endswith(suffix):
+            return codec
+    return None
+
+
+def strip_suffix(name):
+    codec = codec_from_name(name)
+    return name[: -len(SUFFIXES[codec])] if codec else name
@@ -0,0 +1,360 @@
+"""Keep accounts up to date from a long-running process (`ubs serve`).
+
+A `Daemon` holds one `UtilityAPI` per account for as long as it runs, so each
+account's history is only read from `data_path` once and (for scrapers that
+drive a browser) its logged-in browser session stays open between refreshes.
+Refreshes are scheduled per account, every `interval` seconds with random
+jitter so that accounts (and restarts) don't all hit the portals at once.
+They run in a bounded pool of worker threads, with the same per-portal limits
+as `ubs update --all`.
+
+The latest history is served to local readers over HTTP:
+
+ * `GET /accounts`: the status of each account (as JSON).
+ * `GET /accounts/<id>/history.csv` (or `.json`): an account's history
+   (`?resolution=hourly` for hourly data, where available).
+ * `POST /accounts/<id>/refresh`: refresh an account now.
+ * `GET /metrics`: metrics for every account in the OpenMetrics text format
+   (see `metrics`).
+
+Each account's `id` is its `name` in the config (or its index if it has no
+name). The config is the same as for `ubs update --all` (see
+`orchestrator`), plus optional `interval` and `jitter` keys, both at the top
+level and per account.
+"""
+
+import contextlib
+import datetime as dt
+import json
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import metrics, orchestrator
+
+DEFAULT_INTERVAL = 24 * 60 * 60  # seconds
+
+# Each delay is randomly lengthened or shortened by up to this fraction.
+DEFAULT_JITTER = 0.1
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+# The first refresh of each account starts at a random time within this many
+# seconds of starting the daemon.
+STARTUP_SPREAD = 60
+
+
+def jittered(interval, jitter):
+    return interval * (1 + jitter * (2 * random.random() - 1))
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return dt.datetime.fromtimestamp(timestamp, dt.timezone.utc).isoformat()
+
+
+class Account:
+    def __init__(self, id, config, interval, jitter):
+        config = dict(config)
+        self.id = id
+        self.utility_name = config.pop("utility_name")
+        self.max_downloads = config.pop("max_downloads", None)
+        self.interval = config.pop("interval", interval)
+        self.jitter = config.pop("jitter", jitter)
+        self.kwargs = config
+        self.api = None
+        self.session = contextlib.ExitStack()
+        self.warm = False
+        self.lock = threading.Lock()
+        self.running = False
+        self.next_refresh = None
+        # Set by `Daemon.refresh_now()` while a refresh is running, so that
+        # the account is refreshed again as soon as it finishes.
+        self.refresh_requested = False
+        self.last_refresh = None
+        self.status = "pending"
+        self.refreshes = 0
+        self.failures = 0
+        self.new_statements = 0
+        self.seconds = None
+        self.error = None
+
+    def as_dict(self):
+        return dict(
+            id=self.id,
+            utility_name=self.utility_name,
+            user=self.kwargs.get("user"),
+            status=self.status,
+            running=self.running,
+            last_refresh=_isoformat(self.last_refresh),
+            next_refresh=_isoformat(self.next_refresh),
+            new_statements=self.new_statements,
+            seconds=self.seconds,
+            error=self.error,
+        )
+
+
+class Daemon:
+    def __init__(
+        self,
+        accounts,
+        make_api,
+        max_workers=orchestrator.DEFAULT_MAX_WORKERS,
+        portal_limits=None,
+        interval=DEFAULT_INTERVAL,
+        jitter=DEFAULT_JITTER,
+        warm_sessions=True,
+    ):
+        """
+        Parameters
+        ----------
+        accounts : list of dict
+            Account configs (see `orchestrator.update_all`).
+        make_api : callable
+            `make_api(utility_name, **kwargs)` returns a `UtilityAPI`.
+        max_workers : int
+            Maximum number of accounts refreshed at once.
+        portal_limits : dict, optional
+            Maximum number of accounts refreshed at once for each utility.
+        interval : float
+            Default number of seconds between refreshes of an account.
+        jitter : float
+            Default fraction by which each delay is randomly changed.
+        warm_sessions : bool
+            Keep each account's browser session open between refreshes.
+        """
+        self._make_api = make_api
+        self._warm_sessions = warm_sessions
+        self._accounts = {}
+        for i, config in enumerate(accounts):
+            config = dict(config)
+            id = str(config.pop("name", i))
+            self._accounts[id] = Account(id, config, interval, jitter)
+        self._semaphores = orchestrator.portal_semaphores(accounts, portal_limits)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._server = None
+
+    @property
+    def accounts(self):
+        return self._accounts
+
+    def start(self, startup_spread=STARTUP_SPREAD):
+        """Start the scheduler. Each account's first refresh starts at a
+        random time within `startup_spread` seconds (so that restarts don't
+        hit the portals all at once)."""
+        now = time.time()
+        for account in self._accounts.values():
+            account.next_refresh = now + startup_spread * random.random()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.is_set():
+            now = time.time()
+            delays = []
+            for account in self._accounts.values():
+                with account.lock:
+                    if account.running:
+                        continue
+                    if account.next_refresh <= now:
+                        account.running = True
+                        account.refresh_requested = False
+                        self._executor.submit(self._refresh, account)
+                    else:
+                        delays.append(account.next_refresh - now)
+            self._wake.wait(min(delays + [1.0]))
+            self._wake.clear()
+
+    def refresh_now(self, id):
+        """Schedule an immediate refresh of an account (or, if it's being
+        refreshed, another refresh as soon as that one finishes)."""
+        account = self._accounts[id]
+        with account.lock:
+            account.next_refresh = time.time()
+            account.refresh_requested = True
+        self._wake.set()
+
+    def _refresh(self, account):
+        with self._semaphores[account.utility_name]:
+            t_start = time.time()
+            print(f"Refreshing {account.utility_name} ({account.id})")
+            try:
+                self._update(account)
+            except Exception as e:
+                traceback.print_exc()
+                account.status = "failed"
+                account.error = f"{type(e).__name__}: {e}"
+                account.failures += 1
+                # Start from a fresh browser session next time.
+                account.session.close()
+                account.warm = False
+            else:
+                account.status = "ok"
+                account.error = None
+            account.seconds = time.time() - t_start
+            account.refreshes += 1
+            print(
+                f"Refreshed {account.utility_name} ({account.id}): "
+                f"{account.status} in {account.seconds:.1f} s"
+            )
+        with account.lock:
+            account.last_refresh = time.time()
+            if account.refresh_requested:
+                # A refresh was requested while this one was running.
+                account.next_refresh = account.last_refresh
+            else:
+                account.next_refresh = account.last_refresh + jittered(
+                    account.interval, account.jitter
+                )
+            account.running = False
+        self._wake.set()
+
+    def _update(self, account):
+        if account.api is None:
+            # The history is read from `data_path` once, here.
+            account.api = self._make_api(account.utility_name, **account.kwargs)
+        api = account.api
+        if self._warm_sessions and api._uses_browser and not account.warm:
+            # Keep the browser session open until the daemon stops (or a
+            # refresh fails). Nested sessions opened by `update()` reuse it.
+            account.session.enter_context(api.session())
+            account.warm = True
+        updates = api.update(max_downloads=account.max_downloads)
+        account.new_statements = 0 if updates is None else len(updates)
+
+    def history(self, id, resolution="monthly"):
+        account = self._accounts[id]
+        if account.api is None:
+            return None
+        return account.api.history(resolution)
+
+    def metrics(self):
+        """Return the metrics of every account in the OpenMetrics text
+        format."""
+        families = metrics.MetricFamilies()
+        for account in self._accounts.values():
+            labels = {"utility": account.utility_name, "account": account.id}
+            families.counter(
+                "ubs_account_refreshes",
+                "Number of finished refreshes of each account.",
+                account.refreshes,
+                labels,
+            )
+            families.counter(
+                "ubs_account_refresh_failures",
+                "Number of failed refreshes of each account.",
+                account.failures,
+                labels,
+            )
+            if account.last_refresh is not None:
+                families.gauge(
+                    "ubs_account_last_refresh_success",
+                    "1 if the last refresh of each account succeeded, else 0.",
+                    int(account.status == "ok"),
+                    labels,
+                )
+                families.gauge(
+                    "ubs_account_last_refresh_timestamp_seconds",
+                    "Time of the last refresh of each account.",
+                    account.last_refresh,
+                    labels,
+                )
+            if account.api is not None:
+                report = account.api.run_report()
+                report["account"] = account.id
+                metrics.collect(families, report)
+        return families.render()
+
+    def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start serving history over HTTP (in a background thread) and
+        return the server's address."""
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self._executor.shutdown(wait=True)
+        for account in self._accounts.values():
+            account.session.close()
+            if account.api is not None:
+                account.api.close()
+
+    def _handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_error(self, status, message):
+                self._send(status, json.dumps({"error": message}))
+
+            def _account(self, parts):
+                if len(parts) < 2 or parts[0] != "accounts":
+                    return None
+                return daemon.accounts.get(parts[1])
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if parts == ["metrics"]:
+                    return self._send(200, daemon.metrics(), metrics.CONTENT_TYPE)
+                if parts in [["accounts"], [""]]:
+                    return self._send(
+                        200,
+                        json.dumps([x.as_dict() for x in daemon.accounts.values()]),
+                    )
+                account = self._account(parts)
+                if account is None or len(parts) != 3:
+                    return self._send_error(404, "Not found")
+                if parts[2] not in ["history.csv", "history.json"]:
+                    return self._send_error(404, "Not found")
+
+                resolution = parse_qs(url.query).get("resolution", ["monthly"])[0]
+                try:
+                    df = daemon.history(account.id, resolution)
+                except RuntimeError as e:
+                    return self._send_error(400, str(e))
+                if df is None:
+                    return self._send_error(503, "History hasn't been loaded yet")
+                if parts[2] == "history.csv":
+                    return self._send(200, df.to_csv(), "text/csv")
+                return self._send(
+                    200,
+                    df.reset_index().to_json(orient="records", date_format="iso"),
+                )
+
+            def do_POST(self):
+                parts = urlparse(self.path).path.strip("/").split("/")
+                account = self._account(parts)
+                if account is None or parts[2:] != ["refresh"]:
+                    return self._send_error(404, "Not found")
+                daemon.refresh_now(account.id)
+                self._send(202, json.dumps(account.as_dict()))
+
+        return Handler
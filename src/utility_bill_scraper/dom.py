@@ -0,0 +1,46 @@
+"""Helpers for reading the DOM in bulk.
+
+Each `find_element(s)` call or `.text` access on a `WebElement` is a separate
+request to the WebDriver server. Reading a table cell by cell therefore
+costs several round trips per row; `read_table` instead reads a whole table
+in a single `execute_script` call.
+"""
+
+READ_TABLE_SCRIPT = """
+var table = arguments[0];
+var body = table.tagName === "TBODY" ? table : table.getElementsByTagName("tbody")[0] || table;
+
+function text(element) {
+    return (element.innerText || "").replace(/\\u00a0/g, " ").trim();
+}
+
+return Array.from(body.getElementsByTagName("tr")).map(function (row) {
+    return Array.from(row.getElementsByTagName("td")).map(function (cell) {
+        return {
+            text: text(cell),
+            element: cell,
+            links: Array.from(cell.getElementsByTagName("a")).map(function (a) {
+                return {href: a.href, text: text(a), element: a};
+            }),
+            imgs: Array.from(cell.getElementsByTagName("img")).map(function (img) {
+                return {title: img.title, alt: img.alt, src: img.src, element: img};
+            }),
+        };
+    });
+});
+"""
+
+
+def read_table(driver, table):
+    """Read the rows of `table` (a `<table>` or `<tbody>` `WebElement`).
+
+    Returns a list of rows, each of which is a list of cells. Each cell is a
+    dict with:
+
+     * `text`: the cell's text
+     * `element`: the cell's `WebElement` (e.g., to click on it)
+     * `links`: a list of dicts (`href`, `text`, `element`) for each `<a>`
+     * `imgs`: a list of dicts (`title`, `alt`, `src`, `element`) for each
+       `<img>`
+    """
+    return driver.execute_script(READ_TABLE_SCRIPT, table)
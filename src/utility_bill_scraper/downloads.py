@@ -0,0 +1,134 @@
+"""Detecting when a browser download has finished.
+
+Each download is sent to its own directory, so that concurrent downloads
+(and leftovers from earlier ones) can't be mistaken for each other.
+
+ * Chrome: the target directory is set through the DevTools
+   `Browser.setDownloadBehavior` command, and completion is detected from the
+   `downloadWillBegin`/`downloadProgress` events in the performance log.
+ * Firefox: the target directory is set through the `browser.download.dir`
+   pref (from the privileged "chrome" context), and a download is complete
+   once its `.part` file is gone.
+
+In both cases, a completed file appearing in the directory also ends the wait
+(e.g., if the events aren't available).
+"""
+
+import fnmatch
+import json
+import os
+
+from selenium.common.exceptions import WebDriverException
+
+from . import waits
+
+# Suffixes of files that are still being downloaded.
+PARTIAL_SUFFIXES = (".part", ".crdownload", ".tmp")
+
+DOWNLOAD_EVENTS = ("Page.downloadWillBegin", "Browser.downloadWillBegin")
+PROGRESS_EVENTS = ("Page.downloadProgress", "Browser.downloadProgress")
+
+
+class DownloadFailed(Exception):
+    pass
+
+
+def completed_file(directory, pattern):
+    """Return the newest non-empty file in `directory` matching `pattern`, or
+    None if there isn't one or a download is still in progress."""
+    names = os.listdir(directory)
+    if any(x.endswith(PARTIAL_SUFFIXES) for x in names):
+        return None
+    files = [
+        os.path.join(directory, x)
+        for x in names
+        if fnmatch.fnmatch(x, pattern) and os.path.getsize(os.path.join(directory, x))
+    ]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def _performance_log(driver):
+    try:
+        return driver.get_log("performance")
+    except (WebDriverException, ValueError, AttributeError):
+        return []
+
+
+class Download:
+    """A single download into `directory`.
+
+    Call `prepare()` before clicking on the link (or button) that starts the
+    download and `wait()` afterwards.
+    """
+
+    def __init__(self, driver, browser, directory):
+        self._driver = driver
+        self._browser = browser
+        self._directory = directory
+        self._guid = None
+        self._filename = None
+        self._state = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def prepare(self):
+        if self._browser == "Chrome":
+            # Discard events from earlier downloads.
+            _performance_log(self._driver)
+            self._driver.execute_cdp_cmd(
+                "Browser.setDownloadBehavior",
+                {
+                    "behavior": "allow",
+                    "downloadPath": self._directory,
+                    "eventsEnabled": True,
+                },
+            )
+        elif self._browser == "Firefox":
+            with self._driver.context(self._driver.CONTEXT_CHROME):
+                self._driver.execute_script(
+                    'Services.prefs.setStringPref("browser.download.dir", '
+                    "arguments[0]);",
+                    self._directory,
+                )
+
+    def _read_events(self):
+        for entry in _performance_log(self._driver):
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            params = message.get("params", {})
+            if message.get("method") in DOWNLOAD_EVENTS and self._guid is None:
+                self._guid = params.get("guid")
+                self._filename = params.get("suggestedFilename")
+            elif (
+                message.get("method") in PROGRESS_EVENTS
+                and params.get("guid") == self._guid
+            ):
+                self._state = params.get("state")
+
+    def _completed(self, pattern):
+        if self._browser == "Chrome":
+            self._read_events()
+            if self._state == "canceled":
+                raise DownloadFailed(f"Download of {self._filename} was canceled.")
+            if self._state == "completed" and self._filename:
+                filepath = os.path.join(self._directory, self._filename)
+                if os.path.exists(filepath):
+                    return filepath
+        return completed_file(self._directory, pattern)
+
+    def wait(self, pattern, timeout, stats=None):
+        """Wait for a file matching `pattern` to finish downloading and return
+        its path."""
+        return waits.until(
+            self._driver,
+            lambda driver: self._completed(pattern),
+            timeout,
+            name="download",
+            poll_frequency=0.1,
+            ignored_exceptions=(OSError,),
+            stats=stats,
+        )
@@ -2,42 +2,130 @@ import fnmatch
 import json
 import os
 import io
+import threading
 
 from apiclient import discovery
 from google.oauth2.service_account import Credentials
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import (
+    MediaFileUpload,
+    MediaIoBaseDownload,
+    MediaIoBaseUpload,
+)
+
+from .request_executor import RequestExecutor
 
 DEFAULT_SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
+# HTTP status codes (and 403 reasons) that google drive uses for transient
+# errors that should be retried.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_REASONS = ["rateLimitExceeded", "userRateLimitExceeded"]
 
-class GoogleDriveHelper:
-    def __init__(self, service_account_info):
-        if type(service_account_info) == str:
-            service_account_info = json.loads(service_account_info)
-        self._credentials = Credentials.from_service_account_info(
-            info=service_account_info,
-            scopes=DEFAULT_SCOPES,
+
+def is_retryable(error):
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in RETRY_STATUSES:
+        return True
+    if error.resp.status == 403 and isinstance(error.error_details, list):
+        return any(
+            detail.get("reason") in RETRY_REASONS for detail in error.error_details
         )
-        self._service = discovery.build("drive", "v3", credentials=self._credentials)
+    return False
+
+
+# Fields returned for each file when listing a folder.
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, md5Checksum, size)"
+
+
+def _quote(value):
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+class GoogleDriveHelper:
+    def __init__(self, service_account_info=None, executor=None, service=None):
+        """
+        Parameters
+        ----------
+        service_account_info : dict or str
+            Google service account credentials (or their json encoding).
+        executor : RequestExecutor, optional
+            Executor used for all requests (defaults to one that retries
+            transient drive errors).
+        service : optional
+            A pre-built drive service (e.g., an in-memory fake for testing).
+            If set, `service_account_info` is ignored.
+        """
+        if service is None:
+            if type(service_account_info) == str:
+                service_account_info = json.loads(service_account_info)
+            self._credentials = Credentials.from_service_account_info(
+                info=service_account_info,
+                scopes=DEFAULT_SCOPES,
+            )
+        self._executor = executor or RequestExecutor(is_retryable=is_retryable)
+        self._shared_service = service
+
+        # The underlying http client isn't thread safe, so each thread gets
+        # its own service object.
+        self._local = threading.local()
+
+    @property
+    def _service(self):
+        if self._shared_service is not None:
+            return self._shared_service
+        if not hasattr(self._local, "service"):
+            self._local.service = discovery.build(
+                "drive", "v3", credentials=self._credentials
+            )
+        return self._local.service
+
+    @property
+    def executor(self):
+        return self._executor
+
+    def stats(self):
+        """Return request counters (calls, errors, retries and latency) for
+        each drive method."""
+        return self._executor.stats()
+
+    def map(self, func, items):
+        """Apply `func` to each item in parallel (bounded by the executor's
+        concurrency limit)."""
+        return self._executor.map(func, items)
+
+    def _list(self, q):
+        # Return all files matching the query `q` (following pagination).
+        files = []
+        page_token = None
+        while True:
+            response = self._executor.execute(
+                "files.list",
+                lambda: self._service.files()
+                .list(q=q, fields=LIST_FIELDS, pageToken=page_token)
+                .execute(),
+            )
+            files += response["files"]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return files
 
     def get_file_in_folder(self, folder_id, file_name):
         # Query the shared google folder for file that matches `file_name`
-        return (
-            self._service.files()
-            .list(q=f"'{folder_id}' in parents and name='{file_name}'")
-            .execute()["files"][0]
-        )
+        return self._list(
+            f"'{folder_id}' in parents and name='{_quote(file_name)}' "
+            "and trashed=false"
+        )[0]
 
     def get_files_in_folder(self, folder_id, pattern="*"):
         # Query the shared google folder for files that match `pattern`
         return [
             file
-            for file in self._service.files()
-            .list(q=f"'{folder_id}' in parents")
-            .execute()["files"]
+            for file in self._list(f"'{folder_id}' in parents and trashed=false")
             if fnmatch.fnmatch(file["name"], pattern)
         ]
 
@@ -50,7 +138,9 @@ class GoogleDriveHelper:
 
     def get_file(self, file_id):
         # Query google drive for a file matching the `file_id`
-        return self._service.files().get(fileId=file_id).execute()
+        return self._executor.execute(
+            "files.get", lambda: self._service.files().get(fileId=file_id).execute()
+        )
 
     def create_subfolder(self, parent_folder_id, name):
         file_metadata = {
@@ -58,49 +148,115 @@ class GoogleDriveHelper:
             "mimeType": "application/vnd.google-apps.folder",
             "parents": [parent_folder_id],
         }
-        file = self._service.files().create(body=file_metadata, fields="id").execute()
-        return file
+        return self._executor.execute(
+            "files.create",
+            lambda: self._service.files()
+            .create(body=file_metadata, fields="id")
+            .execute(),
+        )
 
-    def create_file_in_folder(self, folder_id, local_path):
+    def create_file_in_folder(self, folder_id, local_path, mimetype="text/csv"):
         print(
             f"Upload file to google drive folder(folder_id={folder_id}, local_path={local_path}"
         )
         file_metadata = {"name": os.path.basename(local_path), "parents": [folder_id]}
-        media = MediaFileUpload(local_path, mimetype="text/csv", resumable=True)
-        file = (
-            self._service.files()
-            .create(body=file_metadata, media_body=media, fields="id")
-            .execute()
+        return self._executor.execute(
+            "files.create",
+            lambda: self._service.files()
+            .create(
+                body=file_metadata,
+                media_body=MediaFileUpload(
+                    local_path, mimetype=mimetype, resumable=True
+                ),
+                fields="id",
+            )
+            .execute(),
         )
-        return file
 
     def upload_file(self, file_id, local_path):
         print(f"Upload file to google drive(file_id={file_id}, local_path={local_path}")
         file = self.get_file(file_id)
-        media_body = MediaFileUpload(
-            local_path, mimetype=file["mimeType"], resumable=True
+        return self._executor.execute(
+            "files.update",
+            lambda: self._service.files()
+            .update(
+                fileId=file["id"],
+                media_body=MediaFileUpload(
+                    local_path, mimetype=file["mimeType"], resumable=True
+                ),
+            )
+            .execute(),
         )
-        updated_file = (
-            self._service.files()
-            .update(fileId=file["id"], media_body=media_body)
-            .execute()
-        )
-        return updated_file
 
     def download_file(self, file_id, local_path):
         print(
             f"Download file from google drive(file_id={file_id}, local_path={local_path}"
         )
-        file = self._service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, file)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
+        data = self.download_bytes(file_id)
 
         # Make parent dirs if necessary.
         os.makedirs(os.path.split(local_path)[0], exist_ok=True)
 
         # Write the file.
         with open(local_path, "wb") as f:
-            f.write(fh.getbuffer().tobytes())
+            f.write(data)
+
+    def create_file_from_bytes(self, folder_id, name, data, mimetype):
+        print(f"Upload file to google drive folder(folder_id={folder_id}, name={name}")
+        file_metadata = {"name": name, "parents": [folder_id]}
+        return self._executor.execute(
+            "files.create",
+            lambda: self._service.files()
+            .create(
+                body=file_metadata,
+                media_body=MediaIoBaseUpload(
+                    io.BytesIO(data), mimetype=mimetype, resumable=True
+                ),
+                fields="id",
+            )
+            .execute(),
+        )
+
+    def update_file_from_bytes(self, file_id, data, mimetype):
+        print(f"Upload file to google drive(file_id={file_id}")
+        return self._executor.execute(
+            "files.update",
+            lambda: self._service.files()
+            .update(
+                fileId=file_id,
+                media_body=MediaIoBaseUpload(
+                    io.BytesIO(data), mimetype=mimetype, resumable=True
+                ),
+            )
+            .execute(),
+        )
+
+    def download_bytes(self, file_id, start=None, end=None):
+        """Download the contents of a file.
+
+        If `start` is set, only bytes `[start, end)` are requested (or
+        everything from `start` if `end` is None).
+        """
+        if start is None:
+
+            def download():
+                fh = io.BytesIO()
+                downloader = MediaIoBaseDownload(
+                    fh, self._service.files().get_media(fileId=file_id)
+                )
+                done = False
+                while done is False:
+                    status, done = downloader.next_chunk()
+                return fh.getvalue()
+
+        else:
+
+            def download():
+                request = self._service.files().get_media(fileId=file_id)
+                request.headers["Range"] = "bytes=%d-%s" % (
+                    start,
+                    "" if end is None else end - 1,
+                )
+                return request.execute()
+
+        return self._executor.execute("files.get_media", download)
@@ -0,0 +1,59 @@
+"""On-disk cache of the statements listed by a portal.
+
+Portals list statements newest first, split over several pages. Caching the
+rows that were scraped (date, amount and an id for each row) lets the next
+run stop paging as soon as it reaches a page that was already seen: every
+older row is then known from the cache. Each utility/account pair gets its
+own file.
+"""
+
+import hashlib
+import json
+import os
+
+
+def default_cache_dir():
+    return os.getenv("UBS_LISTING_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "utility-bill-scraper", "listings"
+    )
+
+
+class ListingCache:
+    def __init__(self, utility_name, user, cache_dir=None):
+        account = hashlib.sha256(f"{utility_name}\0{user}".encode()).hexdigest()
+        self._path = os.path.join(cache_dir or default_cache_dir(), account + ".json")
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        """Return the cached rows, newest first.
+
+        Each row is a dict with (at least) `id`, `date` (an ISO date string)
+        and `amount` keys.
+        """
+        try:
+            with open(self._path) as f:
+                return json.load(f)["rows"]
+        except (FileNotFoundError, KeyError, ValueError):
+            return []
+
+    def update(self, rows):
+        """Merge newly scraped `rows` into the cache and return all of the
+        cached rows, newest first."""
+        ids = {x["id"] for x in rows}
+        merged = list(rows) + [x for x in self.load() if x["id"] not in ids]
+        # Rows with the same date keep the portal's order.
+        merged.sort(key=lambda x: x["date"], reverse=True)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # Only the current user can read the file.
+        fd = os.open(self._path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"rows": merged}, f, indent=1)
+        os.replace(self._path + ".tmp", self._path)
+        return merged
+
+    def clear(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
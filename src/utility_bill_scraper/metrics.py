@@ -0,0 +1,206 @@
+"""Export run metrics in the OpenMetrics (or Prometheus) text format.
+
+Metrics are rendered from run reports (see `UtilityAPI.run_report()`), with
+`utility` and `account` labels on every sample, so one scrape covers many
+accounts. The `account` label is the account's `name` in the config (see
+`orchestrator`), or else the short hash of the user name from the report:
+
+ * `ubs_phase_duration_seconds`: a histogram of the duration of each phase
+   (`phase` label; e.g., "download", "extract", "storage_write" or
+   "update"). Its `_count` is the number of downloads, extractions, etc.
+ * `ubs_phase_failures_total`: the number of spans of each phase that
+   failed (e.g., failed updates or statements that couldn't be parsed).
+ * `ubs_phase_bytes_total`: bytes transferred by each phase.
+ * `ubs_statements_extracted_total` and `ubs_new_rows_total`.
+ * `ubs_history_rows`: the number of rows in each history (`resolution`
+   label).
+ * `ubs_storage_requests_total`, `ubs_storage_request_errors_total`,
+   `ubs_storage_request_retries_total` and
+   `ubs_storage_request_seconds_total`: requests to remote storage (e.g.,
+   google drive), by `method`.
+
+`ubs update --metrics PATH` writes them to a file in the Prometheus text
+format (version 0.0.4, which the node exporter's textfile collector reads) and
+`ubs serve` serves them in the OpenMetrics text format at `/metrics`.
+"""
+
+import hashlib
+import os
+
+from . import timing
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def account_hash(utility_name, user):
+    """Return a short hash identifying an account (so that reports and metrics
+    don't include logins)."""
+    if user is None:
+        return None
+    account = f"{utility_name}\0{user}".encode()
+    return hashlib.sha256(account).hexdigest()[:12]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels.items())
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricFamilies:
+    """Collects samples, grouped by metric family, and renders them."""
+
+    def __init__(self):
+        self._families = {}
+
+    def add(self, name, type, help, value, labels=None, suffix=""):
+        """Add a sample of the family `name` (the sample's name is `name` plus
+        `suffix`, e.g., "_total" for counters)."""
+        family = self._families.setdefault(
+            name, {"type": type, "help": help, "samples": []}
+        )
+        family["samples"].append((name + suffix, dict(labels or {}), value))
+
+    def counter(self, name, help, value, labels=None):
+        self.add(name, "counter", help, value, labels, "_total")
+
+    def gauge(self, name, help, value, labels=None):
+        self.add(name, "gauge", help, value, labels)
+
+    def histogram(self, name, help, buckets, count, sum, labels=None):
+        """Add a histogram from the counts of observations no larger than each
+        of `timing.BUCKETS`."""
+        labels = dict(labels or {})
+        for bound, n in zip(timing.BUCKETS, buckets):
+            le = _format_value(float(bound))
+            self.add(name, "histogram", help, n, dict(labels, le=le), suffix="_bucket")
+        self.add(
+            name, "histogram", help, count, dict(labels, le="+Inf"), suffix="_bucket"
+        )
+        self.add(name, "histogram", help, count, labels, suffix="_count")
+        self.add(name, "histogram", help, sum, labels, suffix="_sum")
+
+    def render(self, openmetrics=True):
+        """Render the samples in the OpenMetrics text format, or else in the
+        Prometheus text format (where counter families are named after their
+        `_total` samples and there's no `# EOF` line)."""
+        lines = []
+        for name, family in self._families.items():
+            if family["type"] == "counter" and not openmetrics:
+                name += "_total"
+            lines.append("# TYPE %s %s" % (name, family["type"]))
+            lines.append("# HELP %s %s" % (name, family["help"]))
+            for sample_name, labels, value in family["samples"]:
+                lines.append(
+                    "%s%s %s"
+                    % (sample_name, _format_labels(labels), _format_value(value))
+                )
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def collect(families, report):
+    """Add the metrics of a run report to `families`."""
+    labels = {
+        "utility": report["utility_name"],
+        "account": report.get("account") or "",
+    }
+    for phase, stats in sorted(report["phases"].items()):
+        phase_labels = dict(labels, phase=phase)
+        families.histogram(
+            "ubs_phase_duration_seconds",
+            "Duration of each phase of a run.",
+            stats["buckets"],
+            stats["count"],
+            stats["total_seconds"],
+            phase_labels,
+        )
+        families.counter(
+            "ubs_phase_failures",
+            "Number of spans of each phase that failed.",
+            stats["failed"],
+            phase_labels,
+        )
+        families.counter(
+            "ubs_phase_bytes",
+            "Bytes transferred by each phase.",
+            stats["bytes"],
+            phase_labels,
+        )
+
+    counts = report["counts"]
+    families.counter(
+        "ubs_statements_extracted",
+        "Number of statements whose data was extracted.",
+        counts.get("statements_extracted", 0),
+        labels,
+    )
+    families.counter(
+        "ubs_new_rows",
+        "Number of rows added to the monthly history.",
+        counts.get("new_rows", 0),
+        labels,
+    )
+    for resolution in ["monthly", "hourly"]:
+        if resolution + "_rows" in counts:
+            families.gauge(
+                "ubs_history_rows",
+                "Number of rows in the history.",
+                counts[resolution + "_rows"],
+                dict(labels, resolution=resolution),
+            )
+
+    for method, stats in sorted(report.get("storage_requests", {}).items()):
+        method_labels = dict(labels, method=method)
+        families.counter(
+            "ubs_storage_requests",
+            "Number of requests to remote storage.",
+            stats["calls"],
+            method_labels,
+        )
+        families.counter(
+            "ubs_storage_request_errors",
+            "Number of requests to remote storage that failed.",
+            stats["errors"],
+            method_labels,
+        )
+        families.counter(
+            "ubs_storage_request_retries",
+            "Number of retried requests to remote storage.",
+            stats["retries"],
+            method_labels,
+        )
+        families.counter(
+            "ubs_storage_request_seconds",
+            "Time spent on requests to remote storage.",
+            stats["total_seconds"],
+            method_labels,
+        )
+
+
+def render(reports, openmetrics=True):
+    """Return the metrics of a list of run reports in the OpenMetrics text
+    format (or the Prometheus text format if `openmetrics` is False)."""
+    families = MetricFamilies()
+    for report in reports:
+        collect(families, report)
+    return families.render(openmetrics)
+
+
+def write_textfile(path, text):
+    """Write metrics to `path` atomically (so that a collector never reads a
+    partially written file)."""
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,198 @@
+"""Update many accounts in one pass.
+
+`update_all()` runs `update()` for a list of (utility, account) pairs in a
+bounded pool of worker threads. Each account gets its own `UtilityAPI` (and
+therefore its own browser and download workspace), and each portal has its
+own concurrency limit so that a fleet of accounts doesn't trip a portal's
+rate limiting.
+
+Accounts are usually read from a JSON config file:
+
+    {
+        "max_workers": 4,
+        "portal_limits": {"Kitchener Utilities": 1},
+        "defaults": {"browser": "Firefox", "lean": true},
+        "accounts": [
+            {
+                "name": "ku",
+                "utility_name": "Kitchener Utilities",
+                "user": "me@example.com",
+                "password": "${KU_PASSWORD}",
+                "data_path": "data/ku"
+            },
+            {
+                "name": "kwh",
+                "utility_name": "Kitchener-Wilmot Hydro",
+                "user": "me@example.com",
+                "password": "${KWH_PASSWORD}",
+                "data_path": "data/kwh"
+            }
+        ]
+    }
+
+Every key other than `name`, `utility_name` and `max_downloads` is passed to
+the utility's constructor. The optional `name` identifies the account in
+reports, metrics and the summary (instead of a hash of its `user`, so that
+logins aren't included). String values can refer to environment variables
+(`$NAME` or `${NAME}`), so passwords don't need to be stored in the file.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+DEFAULT_MAX_WORKERS = 4
+
+# Maximum number of concurrent sessions per portal (unless overridden in the
+# config's `portal_limits`).
+DEFAULT_PORTAL_LIMIT = 2
+
+
+def _expand_vars(value):
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    elif isinstance(value, list):
+        return [_expand_vars(x) for x in value]
+    elif isinstance(value, dict):
+        return {k: _expand_vars(v) for k, v in value.items()}
+    return value
+
+
+def load_config(path):
+    """Load a config file, expanding environment variables and merging the
+    `defaults` into each account."""
+    with open(path) as f:
+        config = _expand_vars(json.load(f))
+    if not config.get("accounts"):
+        raise RuntimeError(f"No `accounts` found in {path}.")
+    defaults = config.get("defaults", {})
+    config["accounts"] = [dict(defaults, **x) for x in config["accounts"]]
+    for i, account in enumerate(config["accounts"]):
+        if "utility_name" not in account:
+            raise RuntimeError(f"Account {i} in {path} has no `utility_name`.")
+    return config
+
+
+def portal_semaphores(accounts, portal_limits=None):
+    """Return a semaphore limiting concurrent sessions for each utility."""
+    portal_limits = portal_limits or {}
+    return {
+        name: threading.BoundedSemaphore(portal_limits.get(name, DEFAULT_PORTAL_LIMIT))
+        for name in set(x["utility_name"] for x in accounts)
+    }
+
+
+def _interleave(accounts):
+    """Return `(index, account)` pairs ordered round-robin by portal, so that
+    workers waiting on one portal's limit don't hold up the others."""
+    by_portal = {}
+    for i, account in enumerate(accounts):
+        by_portal.setdefault(account["utility_name"], []).append((i, account))
+    queues = list(by_portal.values())
+    ordered = []
+    while queues:
+        ordered += [x.pop(0) for x in queues]
+        queues = [x for x in queues if x]
+    return ordered
+
+
+def update_all(accounts, make_api, max_workers=DEFAULT_MAX_WORKERS, portal_limits=None):
+    """Update each account and return a list of results (in the order of
+    `accounts`).
+
+    Parameters
+    ----------
+    accounts : list of dict
+        Each dict has a `utility_name`, an optional `name` and
+        `max_downloads` and the keyword arguments for `make_api`.
+    make_api : callable
+        `make_api(utility_name, **kwargs)` returns a `UtilityAPI`.
+    max_workers : int
+        Maximum number of accounts updated at once.
+    portal_limits : dict, optional
+        Maximum number of accounts updated at once for each utility (default
+        `DEFAULT_PORTAL_LIMIT`).
+
+    Returns
+    -------
+    list of dict
+        `utility_name`, `account` (its `name`, or else a short hash of its
+        `user`; see `metrics.account_hash`), `status` ("ok" or "failed"),
+        `new_statements`, `seconds`, `error` and `report` (the account's
+        `run_report()`, or None if its `UtilityAPI` couldn't be created) for
+        each account. An error in one account doesn't stop the others.
+    """
+    semaphores = portal_semaphores(accounts, portal_limits)
+
+    def update(item):
+        i, account = item
+        kwargs = dict(account)
+        utility_name = kwargs.pop("utility_name")
+        max_downloads = kwargs.pop("max_downloads", None)
+        name = kwargs.pop("name", None)
+        result = dict(
+            utility_name=utility_name,
+            account=(
+                str(name)
+                if name is not None
+                else metrics.account_hash(utility_name, kwargs.get("user"))
+            ),
+            status="ok",
+            new_statements=0,
+            seconds=0.0,
+            error=None,
+            report=None,
+        )
+        with semaphores[utility_name]:
+            t_start = time.time()
+            print(f"Updating {utility_name} ({result['account']})")
+            try:
+                api = make_api(utility_name, **kwargs)
+                try:
+                    updates = api.update(max_downloads=max_downloads)
+                finally:
+                    result["report"] = api.run_report()
+                    result["report"]["account"] = result["account"]
+                    api.close()
+                if updates is not None:
+                    result["new_statements"] = len(updates)
+            except Exception as e:
+                traceback.print_exc()
+                result["status"] = "failed"
+                result["error"] = f"{type(e).__name__}: {e}"
+            result["seconds"] = time.time() - t_start
+        return i, result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(executor.map(update, _interleave(accounts)))
+    return [results[i] for i in range(len(accounts))]
+
+
+def format_summary(results):
+    failed = [x for x in results if x["status"] != "ok"]
+    lines = [
+        "Updated %d account(s): %d ok, %d failed, %d new statement(s)"
+        % (
+            len(results),
+            len(results) - len(failed),
+            len(failed),
+            sum(x["new_statements"] for x in results),
+        )
+    ]
+    for x in results:
+        line = "  %-24s %-32s %-6s %3d new %7.1f s" % (
+            x["utility_name"],
+            x["account"] or "",
+            x["status"],
+            x["new_statements"],
+            x["seconds"],
+        )
+        if x["error"]:
+            line += "  " + x["error"]
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,85 @@
+"""Helpers for storing history files as a set of partitions plus a manifest.
+
+Remote history is split into one file per period (years for monthly data,
+months for hourly data). A small json manifest records the checksum of each
+partition so that an update only needs to upload the partitions whose content
+actually changed.
+"""
+
+import hashlib
+import json
+
+from . import compression
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Period used to partition each history resolution (see `pandas.Period`).
+PARTITION_FREQ = {
+    "monthly": "Y",
+    "hourly": "M",
+}
+
+# Explicit index formats so that every partition parses the same way.
+DATE_FORMAT = {
+    "monthly": "%Y-%m-%d",
+    "hourly": "%Y-%m-%d %H:%M:%S",
+}
+
+
+def checksum(data):
+    """Return the md5 hex digest of `data` (the same checksum google drive
+    reports as `md5Checksum`)."""
+    return hashlib.md5(data).hexdigest()
+
+
+def new_manifest(resolution):
+    return {"version": MANIFEST_VERSION, "resolution": resolution, "partitions": {}}
+
+
+def load_manifest(data):
+    manifest = json.loads(data)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(
+            f"Unsupported history manifest version: {manifest.get('version')}."
+        )
+    return manifest
+
+
+def dump_manifest(manifest):
+    return json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+
+
+def partition_name(key, file_ext, codec=None):
+    return compression.add_suffix(key + file_ext, codec)
+
+
+def split_history(df, resolution):
+    """Split a history DataFrame into partitions.
+
+    Returns
+    -------
+    dict mapping partition keys (e.g., "2023" or "2023-04") to csv bytes.
+    """
+    if not len(df):
+        return {}
+    freq = PARTITION_FREQ[resolution]
+    df = df.sort_index()
+    keys = df.index.to_period(freq).astype(str)
+    return {
+        key: df[keys == key].to_csv(date_format=DATE_FORMAT[resolution]).encode("utf-8")
+        for key in keys.unique()
+    }
+
+
+def changed_partitions(partitions, manifest, file_ext, codec=None):
+    """Return the sorted list of partition keys whose content differs from the
+    checksums recorded in `manifest` (checksums are computed on the
+    uncompressed data), or that are stored with a different codec."""
+
+    def is_changed(key, data):
+        entry = manifest["partitions"].get(key, {})
+        name = partition_name(key, file_ext, codec)
+        return entry.get("md5") != checksum(data) or entry.get("name") != name
+
+    return sorted(key for key, data in partitions.items() if is_changed(key, data))
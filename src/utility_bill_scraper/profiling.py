@@ -0,0 +1,204 @@
+"""Profile a run (`ubs <command> --profile`).
+
+A `SamplingProfiler` records the Python stack of every thread (the browser
+driver, executor threads running pdf conversions or storage requests, etc.)
+at a fixed interval, and tracks peak memory with `tracemalloc`. Sampling
+keeps the overhead low enough to profile a real update, and the wall-clock
+samples include the time spent waiting on the browser, subprocesses and the
+network.
+
+`profile()` writes two files to the output directory:
+
+ * `<name>-<timestamp>.folded`: the sampled stacks in the "folded" format
+   used by `flamegraph.pl`, `inferno` and speedscope (one
+   `frame;frame;... count` line per stack, rooted at the thread's name).
+ * `<name>-<timestamp>.json`: a summary with the duration, number of
+   samples, peak memory and the hottest functions.
+
+and prints the hottest functions when the run finishes.
+"""
+
+import collections
+import contextlib
+import datetime as dt
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from . import storage
+
+DEFAULT_INTERVAL = 0.005  # seconds
+
+# Leaf functions where a thread is idle (e.g., an executor thread waiting
+# for work). Their samples are kept in the folded stacks but left out of the
+# hot function summaries.
+IDLE_FUNCTIONS = [
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+]
+
+
+def output_dir(data_path=None):
+    """Return the directory for profiles of runs using `data_path`: a
+    `profiles` folder in a local `data_path`, or in the current directory
+    if `data_path` is remote."""
+    if storage.is_gdrive_path(data_path) or storage.is_s3_path(data_path):
+        return os.path.abspath("profiles")
+    return os.path.join(data_path or os.path.abspath("data"), "profiles")
+
+
+def _frame_name(code):
+    # The last two path components are enough to tell modules apart (e.g.,
+    # ".../utility_bill_scraper/__init__.py").
+    path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    return "%s (%s:%d)" % (code.co_name, path, code.co_firstlineno)
+
+
+def _is_idle(code):
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_INTERVAL, trace_memory=True):
+        self._interval = interval
+        self._trace_memory = trace_memory
+        self._stacks = collections.Counter()
+        self._idle_stacks = set()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = None
+        self._seconds = None
+        self._peak_memory = None
+
+    def start(self):
+        if self._trace_memory:
+            tracemalloc.start()
+        self._started = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._seconds = time.time() - self._started
+        if self._trace_memory:
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self._sample()
+
+    def _sample(self):
+        names = {x.ident: x.name for x in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self._thread.ident:
+                continue
+            idle = _is_idle(frame.f_code)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, "thread-%d" % thread_id))
+            stack = tuple(reversed(stack))
+            self._stacks[stack] += 1
+            if idle:
+                self._idle_stacks.add(stack)
+
+    @property
+    def samples(self):
+        return sum(self._stacks.values())
+
+    @property
+    def seconds(self):
+        return self._seconds
+
+    @property
+    def peak_memory(self):
+        """Peak memory allocated by Python during the run (in bytes), or None
+        if memory wasn't traced."""
+        return self._peak_memory
+
+    def folded(self):
+        """Return the sampled stacks in the folded format."""
+        return "".join(
+            "%s %d\n" % (";".join(stack), count)
+            for stack, count in sorted(self._stacks.items())
+        )
+
+    def hot_functions(self, n=15):
+        """Return the `n` functions with the most samples (excluding idle
+        threads), as `(name, self samples, total samples)` tuples sorted by
+        self samples. A function's total samples include the functions it
+        called."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self._stacks.items():
+            if stack in self._idle_stacks:
+                continue
+            own[stack[-1]] += count
+            for name in set(stack[1:]):
+                total[name] += count
+        return [(name, count, total[name]) for name, count in own.most_common(n)]
+
+    def summary(self, n=15):
+        return {
+            "seconds": self._seconds,
+            "interval": self._interval,
+            "samples": self.samples,
+            "peak_memory": self._peak_memory,
+            "hot_functions": [
+                {"function": name, "self_samples": own, "total_samples": total}
+                for name, own, total in self.hot_functions(n)
+            ],
+        }
+
+    def format_summary(self, n=15):
+        lines = ["Profile: %d samples over %.1f s" % (self.samples, self._seconds)]
+        if self._peak_memory is not None:
+            lines[0] += "; peak memory %.1f MiB" % (self._peak_memory / 2**20)
+        busy = max(
+            1,
+            sum(
+                count
+                for stack, count in self._stacks.items()
+                if stack not in self._idle_stacks
+            ),
+        )
+        lines.append("%7s %7s  %s" % ("self%", "total%", "function"))
+        for name, own, total in self.hot_functions(n):
+            lines.append(
+                "%6.1f%% %6.1f%%  %s" % (100.0 * own / busy, 100.0 * total / busy, name)
+            )
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile(directory, name, interval=DEFAULT_INTERVAL, trace_memory=True):
+    """Profile the code in the `with` block, write `<name>-<timestamp>.folded`
+    and `.json` files to `directory` and print the hottest functions.
+
+    The files are written (and the summary printed) even if the block
+    raises.
+    """
+    profiler = SamplingProfiler(interval, trace_memory).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(
+            directory, "%s-%s" % (name, dt.datetime.now().strftime("%Y%m%d-%H%M%S"))
+        )
+        with open(stem + ".folded", "w") as f:
+            f.write(profiler.folded())
+        with open(stem + ".json", "w") as f:
+            json.dump(profiler.summary(), f, indent=2)
+        print(profiler.format_summary())
+        print(f"Wrote profile to {stem}.folded (flamegraph-ready) and {stem}.json")
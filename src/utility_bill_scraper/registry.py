@@ -0,0 +1,55 @@
+"""Registry of the supported utilities.
+
+Each utility's name maps to the `module:ClassName` of its `UtilityAPI`, and a
+utility's module (with its dependencies) is only imported when that utility
+is used.
+
+Other packages can register utilities with a `utility_bill_scraper.utilities`
+entry point, e.g., in their `pyproject.toml`:
+
+    [tool.poetry.plugins."utility_bill_scraper.utilities"]
+    "My Utility" = "my_package.my_utility:MyUtilityAPI"
+"""
+
+import functools
+import importlib
+
+ENTRY_POINT_GROUP = "utility_bill_scraper.utilities"
+
+UTILITIES = {
+    "Kitchener Utilities": (
+        "utility_bill_scraper.canada.on.kitchener_utilities:KitchenerUtilitiesAPI"
+    ),
+    "Kitchener-Wilmot Hydro": (
+        "utility_bill_scraper.canada.on.enova_power:EnovaPowerAPI"
+    ),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        return {}
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:  # Python < 3.10
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep.value for ep in eps}
+
+
+def names():
+    """Return the names of the supported utilities."""
+    return sorted(set(UTILITIES) | set(_entry_points()))
+
+
+def get(utility_name):
+    """Import and return the `UtilityAPI` subclass for `utility_name`."""
+    # Entry points are only looked up for utilities that aren't built in.
+    target = UTILITIES.get(utility_name) or _entry_points().get(utility_name)
+    if target is None:
+        raise RuntimeError(f"Unsupported utility: {utility_name}")
+    module_name, _, class_name = target.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,138 @@
+"""A shared executor for remote storage requests.
+
+Requests are retried with jittered exponential backoff, the number of requests
+in flight is capped, and latency/error counters are kept per method.
+"""
+
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Network errors that are always worth retrying.
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, socket.timeout)
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return dict(
+            calls=self.calls,
+            errors=self.errors,
+            retries=self.retries,
+            total_seconds=self.total_seconds,
+            max_seconds=self.max_seconds,
+        )
+
+
+class RequestExecutor:
+    def __init__(
+        self,
+        is_retryable=None,
+        max_retries=5,
+        backoff_base=1.0,
+        backoff_max=32.0,
+        max_concurrency=4,
+        sleep=time.sleep,
+    ):
+        """
+        Parameters
+        ----------
+        is_retryable : callable, optional
+            Called with an exception raised by a request; returns True if the
+            request should be retried. `TRANSIENT_ERRORS` are always retried.
+        max_retries : int
+            Maximum number of retries before the error is re-raised.
+        backoff_base, backoff_max : float
+            The delay before retry `n` is drawn uniformly from
+            `[0, min(backoff_max, backoff_base * 2 ** n)]` ("full jitter").
+        max_concurrency : int
+            Maximum number of requests in flight at once (across threads).
+        """
+        self._is_retryable = is_retryable or (lambda error: False)
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    def _method_stats(self, method):
+        with self._lock:
+            return self._stats.setdefault(method, MethodStats())
+
+    def stats(self):
+        """Return a snapshot of the counters for each method."""
+        with self._lock:
+            return {k: v.as_dict() for k, v in self._stats.items()}
+
+    def backoff(self, attempt):
+        return random.uniform(
+            0, min(self._backoff_max, self._backoff_base * 2**attempt)
+        )
+
+    def execute(self, method, func):
+        """Call `func()` (which should build and execute a single request),
+        retrying on retryable errors.
+
+        `func` is called again for each attempt, so it must not reuse request
+        objects that hold state between attempts (e.g., resumable uploads).
+        """
+        stats = self._method_stats(method)
+        attempt = 0
+        while True:
+            t_start = time.time()
+            try:
+                with self._semaphore:
+                    result = func()
+                error = None
+            except Exception as e:
+                error = e
+            elapsed = time.time() - t_start
+
+            retry = (
+                error is not None
+                and attempt < self._max_retries
+                and (isinstance(error, TRANSIENT_ERRORS) or self._is_retryable(error))
+            )
+            with self._lock:
+                stats.calls += 1
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+                if error is not None:
+                    stats.errors += 1
+                if retry:
+                    stats.retries += 1
+
+            if error is None:
+                return result
+            if not retry:
+                raise error
+            delay = self.backoff(attempt)
+            print(f"{method} failed ({error}); retrying in {delay:.1f}s...")
+            self._sleep(delay)
+            attempt += 1
+
+    def map(self, func, items):
+        """Apply `func` to each item using a pool of `max_concurrency` threads
+        and return the results in order."""
+        items = list(items)
+        if len(items) <= 1 or self._max_concurrency <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_concurrency, len(items))
+        ) as pool:
+            return list(pool.map(func, items))
@@ -0,0 +1,193 @@
+"""A client for the SAP Utilities Multichannel Foundation (UMC) OData service.
+
+Customer portals built on SAP UMC (e.g., the Kitchener Utilities portal at
+`ebilling.kitchener.ca/sap/bc/ui5_ui5/sap/ZUMCUI5`) are UI5 apps backed by
+the `ERP_UTILITIES_UMC` OData (v2) service. Talking to the service directly
+avoids starting a browser: invoices, contracts and consumption history are
+listed with a handful of pooled HTTP requests, and invoice PDFs are
+downloaded in parallel.
+"""
+
+import datetime as dt
+import os
+import re
+
+from .request_executor import RequestExecutor
+
+SERVICE_PATH = "/sap/opu/odata/sap/ERP_UTILITIES_UMC"
+
+# HTTP statuses for transient errors that should be retried.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+def is_retryable(error):
+    import requests
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUSES
+    return False
+
+
+def parse_date(value):
+    """Parse an OData v2 JSON date (e.g., `"/Date(1634515200000)/"`)."""
+    if value is None:
+        return None
+    match = re.match(r"/Date\((-?\d+)([+-]\d{4})?\)/", value)
+    if not match:
+        return dt.date.fromisoformat(value[:10])
+    timestamp = int(match.group(1)) / 1000
+    return dt.datetime.fromtimestamp(timestamp, dt.timezone.utc).date()
+
+
+def _quote(value):
+    return "'%s'" % str(value).replace("'", "''")
+
+
+class UMCClient:
+    def __init__(self, base_url, user, password, timeout=30, max_concurrency=4):
+        """
+        Parameters
+        ----------
+        base_url : str
+            Scheme and host of the portal (e.g., `https://ebilling.kitchener.ca`).
+        user, password : str
+            Portal credentials.
+        timeout : float
+            Timeout (in seconds) for each request.
+        max_concurrency : int
+            Maximum number of requests in flight at once (e.g., when
+            downloading PDFs).
+        """
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            raise RuntimeError(
+                "The OData transport requires the `requests` package "
+                "(`pip install requests`)."
+            )
+        self._service_url = base_url.rstrip("/") + SERVICE_PATH
+        self._timeout = timeout
+        self._executor = RequestExecutor(
+            is_retryable=is_retryable, max_concurrency=max_concurrency
+        )
+        self._csrf_token = None
+        self._logged_in = False
+
+        # Reuse connections (one pool slot per concurrent request).
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.auth = (user, password)
+        self._session.headers.update({"Accept": "application/json"})
+
+    @property
+    def executor(self):
+        return self._executor
+
+    def stats(self):
+        return self._executor.stats()
+
+    def close(self):
+        self._session.close()
+
+    def _request(self, method, url, **kwargs):
+        def request():
+            response = self._session.request(
+                "GET", url, timeout=self._timeout, **kwargs
+            )
+            if response.status_code in (401, 403):
+                raise AuthenticationError(
+                    f"{method} was rejected ({response.status_code}); check the "
+                    "user name and password."
+                )
+            response.raise_for_status()
+            return response
+
+        return self._executor.execute(method, request)
+
+    def login(self):
+        """Authenticate and fetch a CSRF token.
+
+        The session cookies set by this request authenticate subsequent
+        requests.
+        """
+        response = self._request(
+            "login", self._service_url + "/", headers={"X-CSRF-Token": "Fetch"}
+        )
+        self._csrf_token = response.headers.get("X-CSRF-Token")
+        self._logged_in = True
+        # Once we have a session cookie, stop sending credentials.
+        if self._session.cookies:
+            self._session.auth = None
+
+    def _get(self, method, path, params=None):
+        """GET an entity set (following server-side paging) or entity."""
+        if not self._logged_in:
+            self.login()
+        url = self._service_url + "/" + path
+        params = dict(params or {}, **{"$format": "json"})
+        results = []
+        while url:
+            data = self._request(method, url, params=params).json()["d"]
+            if "results" not in data:
+                return data
+            results += data["results"]
+            # Server-side paging; the next link already includes the query.
+            url, params = data.get("__next"), None
+        return results
+
+    def accounts(self):
+        return self._get("Accounts", "Accounts")
+
+    def contracts(self):
+        return self._get("Contracts", "Contracts")
+
+    def invoices(self, start_date=None, end_date=None):
+        """Return invoices, newest first, optionally limited to those dated
+        within `[start_date, end_date]`."""
+        invoices = self._get("Invoices", "Invoices", {"$orderby": "InvoiceDate desc"})
+        for invoice in invoices:
+            invoice["InvoiceDate"] = parse_date(invoice["InvoiceDate"])
+        return [
+            x
+            for x in invoices
+            if (start_date is None or x["InvoiceDate"] >= start_date)
+            and (end_date is None or x["InvoiceDate"] <= end_date)
+        ]
+
+    def consumption(self, contract_id):
+        """Return the consumption values for a contract."""
+        values = self._get(
+            "ContractConsumptionValues",
+            "Contracts(%s)/ContractConsumptionValues" % _quote(contract_id),
+        )
+        for value in values:
+            value["StartDate"] = parse_date(value.get("StartDate"))
+            value["EndDate"] = parse_date(value.get("EndDate"))
+        return values
+
+    def download_invoice(self, invoice_id, filepath):
+        if not self._logged_in:
+            self.login()
+        response = self._request(
+            "InvoicePDFs",
+            self._service_url
+            + "/InvoicePDFs(InvoiceID=%s)/$value" % _quote(invoice_id),
+            headers={"Accept": "application/pdf"},
+        )
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as f:
+            f.write(response.content)
+        return filepath
+
+    def download_invoices(self, invoices):
+        """Download `(invoice_id, filepath)` pairs in parallel."""
+        return self._executor.map(lambda x: self.download_invoice(*x), invoices)
@@ -0,0 +1,95 @@
+"""Encrypted on-disk cache of logged-in browser sessions.
+
+After a successful login, the browser's cookies are saved so that the next
+run can restore them instead of going through the portal's login page
+again. Each utility/account pair gets its own file, encrypted (Fernet) with
+a key derived from the account's password, so changing the password
+invalidates the cache. Requires the `cryptography` package
+(`pip install utility-bill-scraper[session-cache]`).
+"""
+
+import base64
+import hashlib
+import json
+import os
+
+# Sessions older than this are not restored.
+DEFAULT_MAX_AGE = 12 * 60 * 60  # seconds
+
+SALT_SIZE = 16
+KDF_ITERATIONS = 200000
+
+
+def default_cache_dir():
+    return os.getenv("UBS_SESSION_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "utility-bill-scraper", "sessions"
+    )
+
+
+def _require_cryptography():
+    try:
+        import cryptography.fernet  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            "Caching sessions requires the `cryptography` package "
+            "(`pip install cryptography`)."
+        )
+
+
+class SessionCache:
+    def __init__(
+        self, utility_name, user, password, cache_dir=None, max_age=DEFAULT_MAX_AGE
+    ):
+        _require_cryptography()
+        self._password = password or ""
+        self._max_age = max_age
+        account = hashlib.sha256(f"{utility_name}\0{user}".encode()).hexdigest()
+        self._path = os.path.join(cache_dir or default_cache_dir(), account + ".bin")
+
+    @property
+    def path(self):
+        return self._path
+
+    def _fernet(self, salt):
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=KDF_ITERATIONS,
+        )
+        return Fernet(base64.urlsafe_b64encode(kdf.derive(self._password.encode())))
+
+    def load(self):
+        """Return the cached cookies, or None if there is no valid cached
+        session."""
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self._path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        salt, token = data[:SALT_SIZE], data[SALT_SIZE:]
+        try:
+            return json.loads(self._fernet(salt).decrypt(token, ttl=self._max_age))
+        except (InvalidToken, ValueError):
+            # Expired, corrupt or encrypted with a different password.
+            return None
+
+    def save(self, cookies):
+        salt = os.urandom(SALT_SIZE)
+        token = self._fernet(salt).encrypt(json.dumps(cookies).encode())
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # Only the current user can read the file.
+        fd = os.open(self._path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(salt + token)
+        os.replace(self._path + ".tmp", self._path)
+
+    def clear(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
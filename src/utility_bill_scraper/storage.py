@@ -0,0 +1,404 @@
+"""Storage backends for the history files and statements behind `data_path`.
+
+Objects are addressed by "/"-separated paths relative to `data_path`, e.g.,
+`"Kitchener Utilities/statements/2021-10-18 - Kitchener Utilities - $102.30.pdf"`.
+The backend is picked from the form of `data_path`:
+
+ * `https://drive.google.com/drive/.../folders/<folder id>`: google drive
+ * `s3://<bucket>/<prefix>`: S3 (or an S3-compatible store like MinIO; set
+   `S3_ENDPOINT_URL` to point at it)
+ * anything else: the local file system
+"""
+
+import fnmatch
+import glob
+import os
+import shutil
+import threading
+
+from .request_executor import RequestExecutor
+
+
+def is_gdrive_path(path):
+    if path:
+        return path.startswith("https://drive.google.com/drive")
+    else:
+        return False
+
+
+def is_s3_path(path):
+    if path:
+        return path.startswith("s3://")
+    else:
+        return False
+
+
+def join(*parts):
+    return "/".join(x.strip("/") for x in parts if x)
+
+
+def split(path):
+    head, _, tail = path.rpartition("/")
+    return head, tail
+
+
+class StorageBackend:
+    # True if objects need to be transferred over the network (in which case
+    # history is stored as partitions; see `partitions.py`).
+    is_remote = True
+
+    def __init__(self, executor=None):
+        self._executor = executor or RequestExecutor()
+
+    @property
+    def executor(self):
+        return self._executor
+
+    def stats(self):
+        return self._executor.stats()
+
+    def map(self, func, items):
+        """Apply `func` to each item in parallel (bounded by the executor's
+        concurrency limit)."""
+        return self._executor.map(func, items)
+
+    def read(self, path):
+        """Return the contents of `path`; raise `FileNotFoundError` if it
+        doesn't exist."""
+        raise NotImplementedError
+
+    def read_range(self, path, start, end=None):
+        """Return bytes `[start, end)` of `path`."""
+        return self.read(path)[start:end]
+
+    def write(self, path, data, mimetype="application/octet-stream"):
+        raise NotImplementedError
+
+    def upload(self, local_path, path, mimetype="application/octet-stream"):
+        with open(local_path, "rb") as f:
+            self.write(path, f.read(), mimetype)
+
+    def download(self, path, local_path):
+        data = self.read(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(data)
+
+    def list(self, path, pattern="*"):
+        """Return the names of the objects in the folder `path` that match
+        `pattern`."""
+        raise NotImplementedError
+
+    def exists(self, path):
+        folder, name = split(path)
+        return name in self.list(folder)
+
+
+class LocalStorage(StorageBackend):
+    is_remote = False
+
+    def __init__(self, root, executor=None):
+        super().__init__(executor)
+        self._root = root
+
+    def local_path(self, path):
+        return os.path.join(self._root, *path.split("/"))
+
+    def read(self, path):
+        with open(self.local_path(path), "rb") as f:
+            return f.read()
+
+    def read_range(self, path, start, end=None):
+        with open(self.local_path(path), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start)
+
+    def write(self, path, data, mimetype="application/octet-stream"):
+        local_path = self.local_path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(data)
+
+    def upload(self, local_path, path, mimetype="application/octet-stream"):
+        os.makedirs(os.path.dirname(self.local_path(path)), exist_ok=True)
+        shutil.copyfile(local_path, self.local_path(path))
+
+    def list(self, path, pattern="*"):
+        return sorted(
+            os.path.basename(x)
+            for x in glob.glob(
+                os.path.join(glob.escape(self.local_path(path)), pattern)
+            )
+        )
+
+    def exists(self, path):
+        return os.path.exists(self.local_path(path))
+
+
+class GoogleDriveStorage(StorageBackend):
+    def __init__(self, folder_id, gdh):
+        super().__init__(gdh.executor)
+        self._gdh = gdh
+        self._lock = threading.Lock()
+        # Held while looking up (or creating) a folder, so that concurrent
+        # writes to a new folder don't each create their own copy of it.
+        self._folder_lock = threading.RLock()
+        # Cache folder and file ids so that each folder only needs to be
+        # looked up (or listed) once.
+        self._folder_ids = {"": folder_id}
+        self._file_ids = {}
+        # Folders whose full contents are in the cache (files missing from
+        # the cache don't exist and don't need to be looked up).
+        self._listed_folders = set()
+
+    @property
+    def gdh(self):
+        return self._gdh
+
+    def _folder_id(self, path, create=True):
+        """Return the id of the folder at `path`. Missing folders (and their
+        parents) are created if `create` is True; otherwise
+        `FileNotFoundError` is raised."""
+        with self._lock:
+            if path in self._folder_ids:
+                return self._folder_ids[path]
+        with self._folder_lock:
+            # Another thread may have found (or created) the folder while we
+            # were waiting.
+            with self._lock:
+                if path in self._folder_ids:
+                    return self._folder_ids[path]
+            parent, name = split(path)
+            parent_id = self._folder_id(parent, create)
+            try:
+                folder = self._gdh.get_file_in_folder(parent_id, name)
+            except IndexError:  # Folder doesn't exist
+                if not create:
+                    raise FileNotFoundError(path)
+                folder = self._gdh.create_subfolder(parent_id, name)
+                with self._lock:
+                    self._listed_folders.add(path)
+            with self._lock:
+                self._folder_ids[path] = folder["id"]
+            return folder["id"]
+
+    def _file_id(self, path):
+        with self._lock:
+            if path in self._file_ids:
+                return self._file_ids[path]
+            folder, name = split(path)
+            if folder in self._listed_folders:
+                raise FileNotFoundError(path)
+        try:
+            file = self._gdh.get_file_in_folder(self._folder_id(folder, False), name)
+        except IndexError:
+            raise FileNotFoundError(path)
+        with self._lock:
+            self._file_ids[path] = file["id"]
+        return file["id"]
+
+    def read(self, path):
+        return self._gdh.download_bytes(self._file_id(path))
+
+    def read_range(self, path, start, end=None):
+        return self._gdh.download_bytes(self._file_id(path), start, end)
+
+    def write(self, path, data, mimetype="application/octet-stream"):
+        try:
+            file_id = self._file_id(path)
+        except FileNotFoundError:
+            folder, name = split(path)
+            file = self._gdh.create_file_from_bytes(
+                self._folder_id(folder), name, data, mimetype
+            )
+            with self._lock:
+                self._file_ids[path] = file["id"]
+        else:
+            self._gdh.update_file_from_bytes(file_id, data, mimetype)
+
+    def list(self, path, pattern="*"):
+        try:
+            files = self._gdh.get_files_in_folder(self._folder_id(path, False))
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            self._listed_folders.add(path)
+            for file in files:
+                if file.get("mimeType") == "application/vnd.google-apps.folder":
+                    self._folder_ids[join(path, file["name"])] = file["id"]
+                else:
+                    self._file_ids[join(path, file["name"])] = file["id"]
+        return sorted(
+            file["name"] for file in files if fnmatch.fnmatch(file["name"], pattern)
+        )
+
+    def exists(self, path):
+        try:
+            self._file_id(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+# S3 error codes for transient errors that should be retried.
+S3_RETRY_CODES = ["SlowDown", "Throttling", "RequestTimeout"]
+
+
+def is_retryable_s3_error(error):
+    from botocore.exceptions import ClientError, EndpointConnectionError
+
+    if isinstance(error, EndpointConnectionError):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error.response.get("Error", {}).get("Code")
+        return status >= 500 or code in S3_RETRY_CODES
+    return False
+
+
+class S3Storage(StorageBackend):
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        client=None,
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=4,
+    ):
+        super().__init__(
+            RequestExecutor(
+                is_retryable=is_retryable_s3_error, max_concurrency=max_concurrency
+            )
+        )
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise RuntimeError(
+                "`data_path` looks like an S3 path, but `boto3` is not installed "
+                "(`pip install boto3`)."
+            )
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+        self._client = client or boto3.client(
+            "s3", endpoint_url=os.getenv("S3_ENDPOINT_URL")
+        )
+        # Files larger than `multipart_threshold` are uploaded/downloaded in
+        # parallel parts.
+        self._transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+
+    def _key(self, path):
+        return join(self._prefix, path)
+
+    def _get_object(self, path, **kwargs):
+        try:
+            return self._executor.execute(
+                "get_object",
+                lambda: self._client.get_object(
+                    Bucket=self._bucket, Key=self._key(path), **kwargs
+                )["Body"].read(),
+            )
+        except self._client.exceptions.NoSuchKey:
+            raise FileNotFoundError(path)
+
+    def read(self, path):
+        return self._get_object(path)
+
+    def read_range(self, path, start, end=None):
+        return self._get_object(
+            path, Range="bytes=%d-%s" % (start, "" if end is None else end - 1)
+        )
+
+    def write(self, path, data, mimetype="application/octet-stream"):
+        self._executor.execute(
+            "put_object",
+            lambda: self._client.put_object(
+                Bucket=self._bucket,
+                Key=self._key(path),
+                Body=data,
+                ContentType=mimetype,
+            ),
+        )
+
+    def upload(self, local_path, path, mimetype="application/octet-stream"):
+        self._executor.execute(
+            "upload_file",
+            lambda: self._client.upload_file(
+                local_path,
+                self._bucket,
+                self._key(path),
+                ExtraArgs={"ContentType": mimetype},
+                Config=self._transfer_config,
+            ),
+        )
+
+    def download(self, path, local_path):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        self._executor.execute(
+            "download_file",
+            lambda: self._client.download_file(
+                self._bucket, self._key(path), local_path, Config=self._transfer_config
+            ),
+        )
+
+    def list(self, path, pattern="*"):
+        prefix = self._key(path) + "/" if self._key(path) else ""
+
+        def list_objects():
+            names = []
+            paginator = self._client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(
+                Bucket=self._bucket, Prefix=prefix, Delimiter="/"
+            ):
+                names += [x["Key"][len(prefix) :] for x in page.get("Contents", [])]
+            return names
+
+        names = self._executor.execute("list_objects_v2", list_objects)
+        return sorted(x for x in names if fnmatch.fnmatch(x, pattern))
+
+    def exists(self, path):
+        from botocore.exceptions import ClientError
+
+        try:
+            self._executor.execute(
+                "head_object",
+                lambda: self._client.head_object(
+                    Bucket=self._bucket, Key=self._key(path)
+                ),
+            )
+            return True
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ["404", "NoSuchKey"]:
+                return False
+            raise
+
+
+def get_storage(data_path, google_sa_credentials=None):
+    """Return the storage backend for `data_path`.
+
+    `google_sa_credentials` may be service account credentials or a
+    `GoogleDriveHelper`.
+    """
+    if is_gdrive_path(data_path):
+        if google_sa_credentials is None:
+            raise RuntimeError(
+                "`data_path` looks like a google drive folder, but `google_sa_credentials` is None."
+            )
+        from .google_drive_helpers import GoogleDriveHelper
+
+        # An existing helper (e.g., one wrapping a fake drive service) can be
+        # passed in place of the credentials.
+        if isinstance(google_sa_credentials, GoogleDriveHelper):
+            gdh = google_sa_credentials
+        else:
+            gdh = GoogleDriveHelper(google_sa_credentials)
+        return GoogleDriveStorage(data_path.split("/")[-1], gdh)
+    elif is_s3_path(data_path):
+        bucket, _, prefix = data_path[len("s3://") :].partition("/")
+        return S3Storage(bucket, prefix)
+    return LocalStorage(data_path)
@@ -0,0 +1,180 @@
+"""Timing spans for the phases of a run, and run reports.
+
+Each `UtilityAPI` records the phases of its work (starting the browser,
+logging in, navigating the portal, each download, converting pdfs to text,
+extracting data, storage operations and writing the history) as spans in a
+`Timings` object. For each phase, it keeps the number of spans, how many
+failed, their total and maximum duration and the number of bytes they
+transferred, plus a histogram of the durations (see `BUCKETS`).
+`UtilityAPI.run_report()` combines these with the run's counts into a
+JSON-friendly report.
+
+Code that doesn't have a `UtilityAPI` at hand (e.g., `pdf_to_html`) records
+spans with the module-level `span()`, which goes to the `Timings` that is
+`recording()` in the current thread (and is a no-op otherwise).
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+# Upper bounds (in seconds) of the buckets of each phase's duration histogram.
+BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Span:
+    def __init__(self):
+        # Set by the code in the span once it knows how much it transferred.
+        self.bytes = 0
+
+
+class Timings:
+    """Number, duration and bytes transferred of the spans of each phase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counts = {}
+
+    @contextlib.contextmanager
+    def span(self, name, bytes=0):
+        """Time the code in the `with` block as a span of phase `name`."""
+        span = Span()
+        span.bytes = bytes
+        t_start = time.time()
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(name, time.time() - t_start, failed, span.bytes)
+
+    def record(self, name, seconds, failed=False, bytes=0):
+        with self._lock:
+            phase = self._phases.setdefault(
+                name,
+                {
+                    "count": 0,
+                    "failed": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "bytes": 0,
+                    # Number of spans no longer than each of `BUCKETS`.
+                    "buckets": [0] * len(BUCKETS),
+                },
+            )
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    phase["buckets"][i] += 1
+            phase["count"] += 1
+            phase["failed"] += int(failed)
+            phase["total_seconds"] += seconds
+            phase["max_seconds"] = max(phase["max_seconds"], seconds)
+            phase["bytes"] += bytes
+
+    def count(self, name, n=1):
+        """Add `n` to the counter `name` (e.g., the number of new rows)."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def phases(self):
+        with self._lock:
+            return {
+                name: dict(phase, buckets=list(phase["buckets"]))
+                for name, phase in self._phases.items()
+            }
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}
+            self._counts = {}
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def recording(timings):
+    """Send the spans recorded with `span()` in this thread to `timings`."""
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+@contextlib.contextmanager
+def span(name, bytes=0):
+    """Time the code in the `with` block as a span of phase `name` of the
+    `Timings` that is recording in this thread (if any)."""
+    timings = getattr(_local, "timings", None)
+    if timings is None:
+        yield Span()
+        return
+    with timings.span(name, bytes) as s:
+        yield s
+
+
+class TimedStorage:
+    """Wraps a storage backend (see `storage.py`), recording a span for each
+    read, write, upload, download and listing."""
+
+    def __init__(self, backend, timings):
+        self._backend = backend
+        self._timings = timings
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def read(self, path):
+        with self._timings.span("storage_read") as s:
+            data = self._backend.read(path)
+            s.bytes = len(data)
+        return data
+
+    def read_range(self, path, start, end=None):
+        with self._timings.span("storage_read") as s:
+            data = self._backend.read_range(path, start, end)
+            s.bytes = len(data)
+        return data
+
+    def write(self, path, data, mimetype="application/octet-stream"):
+        with self._timings.span("storage_write", len(data)):
+            return self._backend.write(path, data, mimetype)
+
+    def upload(self, local_path, path, mimetype="application/octet-stream"):
+        with self._timings.span("storage_write", _file_size(local_path)):
+            return self._backend.upload(local_path, path, mimetype)
+
+    def download(self, path, local_path):
+        with self._timings.span("storage_read") as s:
+            result = self._backend.download(path, local_path)
+            s.bytes = _file_size(local_path)
+        return result
+
+    def list(self, path, pattern="*"):
+        with self._timings.span("storage_list"):
+            return self._backend.list(path, pattern)
+
+    def exists(self, path):
+        with self._timings.span("storage_list"):
+            return self._backend.exists(path)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
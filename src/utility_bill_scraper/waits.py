@@ -0,0 +1,126 @@
+"""Waits used by the scrapers.
+
+ * `until` waits for a condition in the browser using selenium's
+   `WebDriverWait`, which sleeps between polls rather than spinning.
+ * `poll` waits for a condition outside of the browser (e.g., a file
+   appearing in the download directory), backing off exponentially between
+   checks.
+
+Every wait records how long it took (and whether it timed out) in a
+`WaitStats` object.
+"""
+
+import threading
+import time
+
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+
+# Exceptions raised while the page is still rendering; conditions that raise
+# them are retried until the wait times out.
+IGNORED_EXCEPTIONS = (NoSuchElementException, StaleElementReferenceException)
+
+
+class Timeout(Exception):
+    pass
+
+
+class WaitStats:
+    """Count and duration of the waits for each name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, seconds, timed_out=False):
+        with self._lock:
+            stats = self._stats.setdefault(
+                name,
+                {"waits": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            )
+            stats["waits"] += 1
+            stats["timeouts"] += int(timed_out)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# Used when a wait isn't given its own `WaitStats` (e.g., by the
+# `wait_for_element` decorator).
+default_stats = WaitStats()
+
+
+def until(
+    driver,
+    condition,
+    timeout,
+    name=None,
+    poll_frequency=0.25,
+    ignored_exceptions=IGNORED_EXCEPTIONS,
+    stats=None,
+):
+    """Wait until `condition(driver)` returns a truthy value and return it.
+
+    Raises `Timeout` if the condition isn't met within `timeout` seconds.
+    """
+    # Importing `WebDriverWait` pulls in the rest of selenium's webdriver.
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    name = name or getattr(condition, "__name__", "until")
+    t_start = time.time()
+    timed_out = False
+    try:
+        return WebDriverWait(
+            driver,
+            timeout,
+            poll_frequency=poll_frequency,
+            ignored_exceptions=ignored_exceptions,
+        ).until(condition)
+    except TimeoutException:
+        timed_out = True
+        raise Timeout(f"Timed out after {timeout}s waiting for {name}.")
+    finally:
+        (stats or default_stats).record(name, time.time() - t_start, timed_out)
+
+
+def poll(
+    condition,
+    timeout,
+    name=None,
+    initial_delay=0.05,
+    max_delay=1.0,
+    ignored_exceptions=(),
+    stats=None,
+):
+    """Wait until `condition()` returns a truthy value and return it.
+
+    The delay between checks starts at `initial_delay` and doubles up to
+    `max_delay`. Raises `Timeout` if the condition isn't met within `timeout`
+    seconds.
+    """
+    name = name or getattr(condition, "__name__", "poll")
+    t_start = time.time()
+    delay = initial_delay
+    timed_out = False
+    try:
+        while True:
+            try:
+                result = condition()
+                if result:
+                    return result
+            except ignored_exceptions:
+                pass
+            remaining = timeout - (time.time() - t_start)
+            if remaining <= 0:
+                timed_out = True
+                raise Timeout(f"Timed out after {timeout}s waiting for {name}.")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+    finally:
+        (stats or default_stats).record(name, time.time() - t_start, timed_out)
@@ -0,0 +1,88 @@
+"""Temporary directories for browser downloads.
+
+Each `UtilityAPI` gets its own `DownloadWorkspace`: a session directory
+(`ubs-<random>`) in the system temp directory containing the browser's
+default download directory and a fresh subdirectory for every download (or
+batch of statements). Nothing is shared between workspaces, so several
+sessions can download at once on the same machine.
+
+A workspace is removed when it is closed (or garbage collected, or when the
+interpreter exits). Workspaces left behind by processes that were killed are
+removed the next time a workspace is created.
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import weakref
+
+PREFIX = "ubs-"
+PID_FILE = "pid"
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Owned by another user
+    return True
+
+
+def remove_stale_workspaces(root=None):
+    """Remove workspaces whose process is no longer running."""
+    # Checking for a process with `os.kill(pid, 0)` only works on posix.
+    if os.name != "posix":
+        return
+    for path in glob.glob(os.path.join(root or tempfile.gettempdir(), PREFIX + "*")):
+        try:
+            with open(os.path.join(path, PID_FILE)) as f:
+                pid = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if not _process_exists(pid):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class DownloadWorkspace:
+    def __init__(self, root=None):
+        remove_stale_workspaces(root)
+        self._path = tempfile.mkdtemp(prefix=PREFIX, dir=root)
+        with open(os.path.join(self._path, PID_FILE), "w") as f:
+            f.write(str(os.getpid()))
+        self._browser_dir = os.path.join(self._path, "browser")
+        os.makedirs(self._browser_dir)
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self._path, ignore_errors=True
+        )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def browser_dir(self):
+        """The browser's default download directory."""
+        return self._browser_dir
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def new_dir(self, prefix="download-"):
+        """Create and return a new, empty directory in the workspace."""
+        if self.closed:
+            raise RuntimeError("The download workspace has been closed.")
+        return tempfile.mkdtemp(prefix=prefix, dir=self._path)
+
+    def close(self):
+        """Remove the workspace and everything in it."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,84 @@
+"""A minimal `UtilityAPI` for tests.
+
+Its "portal" serves the statements in `available_statements`, named like real
+statements (`<date> - Example Utility - $<total>.pdf`) and filled with random
+bytes, and `extract_data()` reads the date and total back from the file name,
+so no browser or pdf tools are needed.
+"""
+
+import os
+import threading
+import time
+
+from utility_bill_scraper import UtilityAPI
+
+
+def monthly_statements(n_months, year=2021):
+    """Return `(date, total)` for `n_months` monthly statements starting in
+    January of `year`."""
+    return [
+        ("%d-%02d-15" % (year + i // 12, i % 12 + 1), 51.0 + i) for i in range(n_months)
+    ]
+
+
+def write_statements(path, statements, size=1024):
+    """Write fake statements to the folder `path` and return their paths."""
+    os.makedirs(path, exist_ok=True)
+    paths = []
+    for date, total in statements:
+        filepath = os.path.join(
+            path, "%s - %s - $%.2f.pdf" % (date, ExampleAPI.name, total)
+        )
+        with open(filepath, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(filepath)
+    return paths
+
+
+class ExampleAPI(UtilityAPI):
+    name = "Example Utility"
+
+    # (date, total) for each statement available from the "portal".
+    available_statements = []
+    statement_size = 1024
+    # Simulated time to download and extract each statement (in seconds).
+    download_seconds = 0
+    extract_seconds = 0
+    # Raise an error after downloading this many statements.
+    fail_after = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # `(event, date)` tuples, e.g., `("downloaded", "2021-01-15")`.
+        self.events = []
+        self._events_lock = threading.Lock()
+
+    def _log(self, event, date):
+        with self._events_lock:
+            self.events.append((event, date))
+
+    def download_statements(self, start_date=None, end_date=None, max_downloads=None):
+        download_path = self._workspace.new_dir("statements-")
+        downloaded_files = []
+        for date, total in self.available_statements:
+            if start_date and date < start_date:
+                continue
+            if self.fail_after is not None and len(downloaded_files) == self.fail_after:
+                raise RuntimeError("The portal is down.")
+            time.sleep(self.download_seconds)
+            filepath = write_statements(
+                download_path, [(date, total)], self.statement_size
+            )[0]
+            self._log("downloaded", date)
+            downloaded_files.append(filepath)
+            self._statement_ready(filepath)
+
+        if self._save_statements:
+            downloaded_files = self._copy_statements_to_data_path(downloaded_files)
+        return downloaded_files
+
+    def extract_data(self, pdf_file):
+        date, _, total = os.path.splitext(os.path.basename(pdf_file))[0].split(" - ")
+        self._log("extracting", date)
+        time.sleep(self.extract_seconds)
+        return {"Date": date, "Total": float(total[1:])}
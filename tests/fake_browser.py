@@ -0,0 +1,221 @@
+"""A fake WebDriver backed by static HTML.
+
+Pages are parsed into `FakeElement`s that support the small part of the
+WebElement API the scrapers use (`find_element(s)`, `.text`, `.click()`).
+`execute_script()` runs the script with node against a minimal DOM built from
+the same HTML, so scripts like `dom.READ_TABLE_SCRIPT` are tested for real
+(and the elements they return map back to `FakeElement`s).
+"""
+
+import json
+import re
+import shutil
+import subprocess
+from html.parser import HTMLParser
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+VOID_TAGS = ["area", "br", "col", "hr", "img", "input", "link", "meta"]
+
+# Builds a minimal DOM (`tagName`, attributes, `getElementsByTagName()` and
+# `innerText`) from the json tree on stdin, runs the script with the target
+# element as `arguments[0]` and prints the result as json, with elements
+# replaced by `{"$element": <index>}`.
+NODE_SCRIPT = """
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const elements = [];
+
+function build(data) {
+    const element = Object.assign({href: "", title: "", alt: "", src: ""}, data.attrs);
+    element.tagName = data.tag.toUpperCase();
+    element.$index = elements.length;
+    elements.push(element);
+    element.childNodes = data.children.map(x => typeof x === "string" ? x : build(x));
+    element.getElementsByTagName = function (name) {
+        const found = [];
+        (function walk(node) {
+            for (const child of node.childNodes) {
+                if (typeof child === "string") continue;
+                if (child.tagName === name.toUpperCase()) found.push(child);
+                walk(child);
+            }
+        })(element);
+        return found;
+    };
+    Object.defineProperty(element, "innerText", {
+        get: function () {
+            return this.childNodes.map(x => typeof x === "string" ? x : x.innerText).join("");
+        },
+    });
+    return element;
+}
+
+build(input.root);
+const result = new Function(input.script).apply(null, [elements[input.target]]);
+process.stdout.write(JSON.stringify(result === undefined ? null : result, function (key, value) {
+    return value && value.$index !== undefined ? {"$element": value.$index} : value;
+}));
+"""
+
+
+def node_available():
+    return shutil.which("node") is not None
+
+
+class FakeElement:
+    def __init__(self, tag, attrs, parent=None):
+        self.tag_name = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.clicks = 0
+
+    def iter(self):
+        """Yield this element and its descendants (in document order)."""
+        yield self
+        for child in self.children:
+            if isinstance(child, FakeElement):
+                yield from child.iter()
+
+    @property
+    def text(self):
+        return re.sub(r"\s+", " ", self.text_content().replace("\xa0", " ")).strip()
+
+    def text_content(self):
+        return "".join(
+            x if isinstance(x, str) else x.text_content() for x in self.children
+        )
+
+    def get_attribute(self, name):
+        return self.attrs.get(name)
+
+    @property
+    def location_once_scrolled_into_view(self):
+        return {"x": 0, "y": 0}
+
+    def click(self):
+        self.clicks += 1
+
+    def _matches(self, by, value):
+        if by == By.ID:
+            return self.attrs.get("id") == value
+        elif by == By.TAG_NAME:
+            return self.tag_name == value.lower()
+        elif by == By.LINK_TEXT:
+            return self.tag_name == "a" and self.text == value
+        raise NotImplementedError(by)
+
+    def find_elements(self, by, value):
+        if by == By.CSS_SELECTOR:
+            # Only descendant selectors of ids (e.g., "#a #b") are supported.
+            elements = [self]
+            for part in value.split():
+                assert part.startswith("#"), value
+                elements = [
+                    x
+                    for element in elements
+                    for x in element.find_elements(By.ID, part[1:])
+                ]
+            return elements
+        return [x for x in list(self.iter())[1:] if x._matches(by, value)]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"{by}={value}")
+        return elements[0]
+
+    def to_json(self):
+        return {
+            "tag": self.tag_name,
+            "attrs": self.attrs,
+            "children": [
+                x if isinstance(x, str) else x.to_json() for x in self.children
+            ],
+        }
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.root = FakeElement("html", {})
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        element = FakeElement(tag, {k: v or "" for k, v in attrs}, self._stack[-1])
+        self._stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self._stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self._stack.pop()
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag_name == tag:
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+
+def parse(html):
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+class FakeSwitchTo:
+    def default_content(self):
+        pass
+
+    def frame(self, frame):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, html):
+        self.root = parse(html)
+        self.switch_to = FakeSwitchTo()
+        self.scripts = []
+        self.quit_called = False
+
+    def find_element(self, by, value):
+        return self.root.find_element(by, value)
+
+    def find_elements(self, by, value):
+        return self.root.find_elements(by, value)
+
+    def execute_script(self, script, *args):
+        self.scripts.append(script)
+        if script.strip() == "return 1;":
+            return 1
+        elements = list(self.root.iter())
+        process = subprocess.run(
+            ["node", "-e", NODE_SCRIPT],
+            input=json.dumps(
+                {
+                    "root": self.root.to_json(),
+                    "script": script,
+                    "target": elements.index(args[0]),
+                }
+            ),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        def to_element(value):
+            if isinstance(value, dict) and list(value) == ["$element"]:
+                return elements[value["$element"]]
+            return value
+
+        return json.loads(process.stdout, object_hook=to_element)
+
+    def quit(self):
+        self.quit_called = True
@@ -0,0 +1,271 @@
+"""An in-memory fake of the google drive v3 `files()` resource.
+
+Inject it with `GoogleDriveHelper(service=FakeDriveService())`. It implements
+the subset of `files().list/get/create/update/get_media` used by
+`GoogleDriveHelper` (including pagination, `md5Checksum` and ranged media
+downloads) and counts calls and bytes transferred so that tests can check
+how much drive traffic an operation generates.
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+
+
+def http_error(status, reason=""):
+    content = json.dumps({"error": {"code": status, "message": reason}})
+    return HttpError(httplib2.Response({"status": status}), content.encode())
+
+
+class FakeRequest:
+    def __init__(self, service, method, func):
+        self._service = service
+        self._method = method
+        self._func = func
+        self.headers = {}
+
+    def execute(self, num_retries=0):
+        return self._service._call(self._method, lambda: self._func(self.headers))
+
+
+class FakeMediaHttp:
+    """Stands in for the `httplib2.Http` object used by
+    `MediaIoBaseDownload`."""
+
+    def __init__(self, service, file_id):
+        self._service = service
+        self._file_id = file_id
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        def get():
+            data = self._service._get_content(self._file_id)
+            start, end = _parse_range(headers or {}, len(data))
+            if start >= len(data) and len(data) == 0:
+                resp = httplib2.Response({"status": 416, "content-range": "bytes */0"})
+                return resp, b""
+            content = data[start:end]
+            self._service.bytes_downloaded += len(content)
+            resp = httplib2.Response(
+                {
+                    "status": 206,
+                    "content-range": "bytes %d-%d/%d"
+                    % (start, start + len(content) - 1, len(data)),
+                }
+            )
+            return resp, content
+
+        return self._service._call("files.get_media", get)
+
+
+def _parse_range(headers, size):
+    headers = {k.lower(): v for k, v in headers.items()}
+    match = re.match(r"bytes=(\d+)-(\d*)", headers.get("range", ""))
+    if not match:
+        return 0, size
+    start = int(match.group(1))
+    end = int(match.group(2)) + 1 if match.group(2) else size
+    return start, min(end, size)
+
+
+class FakeFiles:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, q=None, fields=None, pageToken=None, pageSize=None):
+        return FakeRequest(
+            self._service,
+            "files.list",
+            lambda headers: self._service._list(q, pageToken, pageSize),
+        )
+
+    def get(self, fileId, fields=None):
+        return FakeRequest(
+            self._service, "files.get", lambda headers: self._service._metadata(fileId)
+        )
+
+    def create(self, body, media_body=None, fields=None):
+        return FakeRequest(
+            self._service,
+            "files.create",
+            lambda headers: self._service._create(body, media_body),
+        )
+
+    def update(self, fileId, body=None, media_body=None, fields=None):
+        return FakeRequest(
+            self._service,
+            "files.update",
+            lambda headers: self._service._update(fileId, body, media_body),
+        )
+
+    def get_media(self, fileId):
+        def execute(headers):
+            data = self._service._get_content(fileId)
+            start, end = _parse_range(headers, len(data))
+            self._service.bytes_downloaded += end - start
+            return data[start:end]
+
+        request = FakeRequest(self._service, "files.get_media", execute)
+        request.uri = f"https://fake.googleapis.com/drive/v3/files/{fileId}?alt=media"
+        request.http = FakeMediaHttp(self._service, fileId)
+        return request
+
+
+class FakeDriveService:
+    def __init__(self, page_size=100, list_latency=0):
+        self.page_size = page_size
+        # Simulated time (in seconds) for each `files.list` response to
+        # arrive (the listing is as of when the request was made).
+        self.list_latency = list_latency
+        self.files_by_id = {}
+        self.calls = {}
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._failures = []
+
+    def files(self):
+        return FakeFiles(self)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = {}
+            self.bytes_uploaded = 0
+            self.bytes_downloaded = 0
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def fail_next(self, count=1, status=503):
+        """Make the next `count` requests fail with an HTTP `status` error."""
+        with self._lock:
+            self._failures += [status] * count
+
+    def add_folder(self, name, parent_id=None):
+        return self._add(name, FOLDER_MIMETYPE, parent_id, None)["id"]
+
+    def add_file(self, name, parent_id, data, mimetype="text/csv"):
+        return self._add(name, mimetype, parent_id, data)["id"]
+
+    def find(self, name, parent_id=None):
+        """Return the ids of the (non-trashed) files named `name`."""
+        return [
+            file["id"]
+            for file in self.files_by_id.values()
+            if file["name"] == name
+            and not file["trashed"]
+            and (parent_id is None or parent_id in file["parents"])
+        ]
+
+    def content(self, file_id):
+        return self.files_by_id[file_id]["content"]
+
+    def _call(self, method, func):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if self._failures:
+                raise http_error(self._failures.pop(0), "Injected failure")
+            result = func()
+        if method == "files.list":
+            time.sleep(self.list_latency)
+        return result
+
+    def _add(self, name, mimetype, parent_id, data):
+        file_id = "fake%04d" % next(self._ids)
+        file = {
+            "id": file_id,
+            "name": name,
+            "mimeType": mimetype,
+            "parents": [parent_id] if parent_id else [],
+            "trashed": False,
+            "content": None,
+        }
+        self.files_by_id[file_id] = file
+        if data is not None:
+            self._set_content(file, data)
+        return file
+
+    def _set_content(self, file, data):
+        file["content"] = data
+        file["md5Checksum"] = hashlib.md5(data).hexdigest()
+        file["size"] = str(len(data))
+
+    def _get_file(self, file_id):
+        if file_id not in self.files_by_id:
+            raise http_error(404, f"File not found: {file_id}.")
+        return self.files_by_id[file_id]
+
+    def _get_content(self, file_id):
+        file = self._get_file(file_id)
+        if file["content"] is None:
+            raise http_error(403, "Only files with binary content can be downloaded.")
+        return file["content"]
+
+    def _metadata(self, file_id):
+        file = self._get_file(file_id)
+        return {k: v for k, v in file.items() if k not in ["content", "trashed"]}
+
+    def _matches(self, file, q):
+        for clause in re.split(r"\s+and\s+", q.strip()) if q else []:
+            match = re.match(r"'([^']+)' in parents$", clause)
+            if match:
+                if match.group(1) not in file["parents"]:
+                    return False
+                continue
+            match = re.match(r"(name|mimeType)\s*=\s*'((?:[^'\\]|\\.)*)'$", clause)
+            if match:
+                value = re.sub(r"\\(.)", r"\1", match.group(2))
+                if file[match.group(1)] != value:
+                    return False
+                continue
+            match = re.match(r"trashed\s*=\s*(true|false)$", clause)
+            if match:
+                if file["trashed"] != (match.group(1) == "true"):
+                    return False
+                continue
+            raise http_error(400, f"Invalid query: {q}")
+        return True
+
+    def _list(self, q, page_token, page_size):
+        page_size = page_size or self.page_size
+        matches = [
+            self._metadata(file["id"])
+            for file in self.files_by_id.values()
+            if self._matches(file, q)
+        ]
+        start = int(page_token or 0)
+        response = {"files": matches[start : start + page_size]}
+        if start + page_size < len(matches):
+            response["nextPageToken"] = str(start + page_size)
+        return response
+
+    def _read_media(self, media_body):
+        data = media_body.getbytes(0, media_body.size())
+        self.bytes_uploaded += len(data)
+        return data
+
+    def _create(self, body, media_body):
+        data = self._read_media(media_body) if media_body is not None else None
+        mimetype = body.get("mimeType") or (
+            media_body.mimetype() if media_body is not None else None
+        )
+        parents = body.get("parents", [])
+        file = self._add(body["name"], mimetype, parents[0] if parents else None, data)
+        return {"id": file["id"]}
+
+    def _update(self, file_id, body, media_body):
+        file = self._get_file(file_id)
+        if body:
+            file.update({k: v for k, v in body.items() if k in ["name", "mimeType"]})
+        if media_body is not None:
+            self._set_content(file, self._read_media(media_body))
+        return {"id": file["id"]}
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI, monthly_statements
+from fake_drive import FakeDriveService
+from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper
+
+
+class SlowAPI(ExampleAPI):
+    available_statements = monthly_statements(6)
+    download_seconds = 0.05
+    extract_seconds = 0.05
+
+
+def test_aupdate_overlaps_stages():
+    data_path = tempfile.mkdtemp()
+    api = SlowAPI(data_path=data_path)
+    t_start = time.time()
+    df = asyncio.run(api.aupdate())
+    seconds = time.time() - t_start
+
+    assert sorted(df["Total"]) == [51.0, 52.0, 53.0, 54.0, 55.0, 56.0]
+    assert len(api.history()) == 6
+
+    # The first statement is extracted before the last one is downloaded.
+    events = api.events
+    assert events.index(("extracting", "2021-01-15")) < events.index(
+        ("downloaded", "2021-06-15")
+    )
+    # Running the stages one after the other would take at least 0.6 s.
+    assert seconds < 0.55
+
+    # Every statement is archived in `data_path`.
+    assert sorted(os.listdir(os.path.join(data_path, api.name, "statements"))) == [
+        "2021-%02d-15 - Example Utility - $%.2f.pdf" % (month, 50.0 + month)
+        for month in range(1, 7)
+    ]
+
+    # The history is written, so a new instance doesn't extract anything.
+    api = SlowAPI(data_path=data_path)
+    assert len(api.history()) == 6
+    assert len(asyncio.run(api.aupdate())) == 0
+    assert not [x for x in api.events if x[0] == "extracting"]
+
+
+def test_aupdate_matches_update():
+    drive = FakeDriveService()
+    folder_ids = [drive.add_folder("sync"), drive.add_folder("async")]
+    apis = [
+        SlowAPI(
+            data_path=f"https://drive.google.com/drive/u/0/folders/{folder_id}",
+            google_sa_credentials=GoogleDriveHelper(service=drive),
+            compression="gzip",
+        )
+        for folder_id in folder_ids
+    ]
+    df_sync = apis[0].update()
+    df_async = asyncio.run(apis[1].aupdate(max_pending=1, extract_workers=1))
+    assert df_async.sort_index().equals(df_sync.sort_index())
+    assert apis[0].history().equals(apis[1].history())
+    statements = [
+        sorted(x["name"] for x in drive.files_by_id.values() if x["parents"] == [y])
+        for y in drive.find("statements")
+    ]
+    assert statements[0] == statements[1]
+    assert len(statements[0]) == 6
+
+
+def test_aupdate_raises_download_errors(monkeypatch):
+    monkeypatch.setattr(SlowAPI, "fail_after", 3)
+    api = SlowAPI(data_path=tempfile.mkdtemp())
+    with pytest.raises(RuntimeError, match="The portal is down."):
+        asyncio.run(api.aupdate(max_pending=1))
+    assert api._statement_sink is None
+    # Nothing is added to the history.
+    assert len(api.history()) == 0
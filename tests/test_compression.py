@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import compression
+
+
+@pytest.mark.parametrize("codec", [None, "gzip", "zstd"])
+def test_round_trip(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    data = b"Date,Total\n" + b"2021-01-15,51.0\n" * 100
+    compressed = compression.compress(data, codec)
+    if codec:
+        assert len(compressed) < len(data)
+        # Identical inputs produce identical outputs (so checksums are stable).
+        assert compression.compress(data, codec) == compressed
+    assert compression.decompress(compressed, codec) == data
+
+
+def test_suffixes():
+    name = "2021-10-18 - Kitchener Utilities - $102.30.pdf"
+    assert compression.add_suffix(name, None) == name
+    assert compression.add_suffix(name, "zstd") == name + ".zst"
+    assert compression.codec_from_name(name + ".gz") == "gzip"
+    assert compression.codec_from_name(name) is None
+    assert compression.strip_suffix(name + ".zst") == name
+    assert compression.strip_suffix(name) == name
+
+
+def test_validate():
+    assert compression.validate("gzip") == "gzip"
+    assert compression.validate(None) is None
+    with pytest.raises(compression.UnsupportedCompression):
+        compression.validate("bzip2")
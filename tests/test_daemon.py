@@ -0,0 +1,199 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import daemon, timing
+
+
+class FakeAPI:
+    _uses_browser = True
+    instances = []
+
+    def __init__(self, utility_name, user=None, password=None):
+        self.utility_name = utility_name
+        self.user = user
+        self.updates = 0
+        self.sessions_opened = 0
+        self.session_depth = 0
+        self.fail_next_update = False
+        # If set, updates wait for this event.
+        self.gate = None
+        self.closed = False
+        self._timings = timing.Timings()
+        self._monthly_history = pd.DataFrame(
+            {"Total": [1.0]}, index=pd.to_datetime(["2022-01-31"])
+        )
+        self._monthly_history.index.name = "Date"
+        type(self).instances.append(self)
+
+    @contextlib.contextmanager
+    def session(self):
+        if self.session_depth == 0:
+            self.sessions_opened += 1
+        self.session_depth += 1
+        try:
+            yield
+        finally:
+            self.session_depth -= 1
+
+    def update(self, max_downloads=None):
+        with self.session(), self._timings.span("update"):
+            self.updates += 1
+            if self.gate is not None:
+                self.gate.wait()
+            if self.fail_next_update:
+                self.fail_next_update = False
+                raise RuntimeError("The portal is down")
+            date = pd.Timestamp("2022-01-31") + pd.offsets.MonthEnd(self.updates)
+            self._monthly_history.loc[date] = float(self.updates + 1)
+            return [date]
+
+    def history(self, resolution="monthly"):
+        if resolution != "monthly":
+            raise RuntimeError("resolution must be one of: monthly.")
+        return self._monthly_history
+
+    def run_report(self):
+        return {
+            "utility_name": self.utility_name,
+            "phases": self._timings.phases(),
+            "counts": {"monthly_rows": len(self._monthly_history)},
+            "storage_requests": {},
+        }
+
+    def close(self):
+        self.closed = True
+
+
+def wait_until(condition, timeout=5):
+    t_start = time.time()
+    while not condition():
+        assert time.time() - t_start < timeout, "timed out"
+        time.sleep(0.01)
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read().decode()
+
+
+@pytest.fixture
+def server():
+    FakeAPI.instances = []
+    server = daemon.Daemon(
+        [
+            dict(utility_name="Portal A", user="a", name="home"),
+            dict(utility_name="Portal B", user="b", interval=3600),
+        ],
+        FakeAPI,
+        interval=0.2,
+        jitter=0.5,
+    )
+    yield server
+    server.stop()
+
+
+def test_jittered():
+    delays = [daemon.jittered(100, 0.1) for i in range(100)]
+    assert all(90 <= x <= 110 for x in delays)
+    assert len(set(delays)) > 1
+
+
+def test_refresh_and_serve(server):
+    host, port = server.serve("127.0.0.1", 0)
+    url = f"http://{host}:{port}"
+
+    # Nothing has been loaded before the first refresh.
+    with pytest.raises(urllib.error.HTTPError) as e:
+        get(f"{url}/accounts/home/history.csv")
+    assert e.value.code == 503
+
+    server.start(startup_spread=0)
+    wait_until(lambda: len(FakeAPI.instances) == 2)
+    home, other = server.accounts["home"], server.accounts["1"]
+    wait_until(lambda: home.api.updates >= 3)
+
+    # The browser session is only opened once and the history stays in
+    # memory.
+    assert home.api.sessions_opened == 1
+    assert len(FakeAPI.instances) == 2
+    # The other account is refreshed on its own schedule.
+    assert other.api.updates == 1
+
+    accounts = json.loads(get(f"{url}/accounts"))
+    assert [x["id"] for x in accounts] == ["home", "1"]
+    assert accounts[0]["status"] == "ok"
+
+    history = json.loads(get(f"{url}/accounts/home/history.json"))
+    assert history[0] == {"Date": "2022-01-31T00:00:00.000", "Total": 1.0}
+    assert get(f"{url}/accounts/1/history.csv").splitlines()[:2] == [
+        "Date,Total",
+        "2022-01-31,1.0",
+    ]
+    with pytest.raises(urllib.error.HTTPError) as e:
+        get(f"{url}/accounts/1/history.csv?resolution=hourly")
+    assert e.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as e:
+        get(f"{url}/accounts/missing/history.csv")
+    assert e.value.code == 404
+
+    # Refresh on demand.
+    request = urllib.request.Request(f"{url}/accounts/1/refresh", method="POST")
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 202
+    wait_until(lambda: other.api.updates == 2)
+
+    # Metrics for every account.
+    text = get(f"{url}/metrics")
+    assert text.endswith("# EOF\n")
+    assert 'ubs_account_refresh_failures_total{utility="Portal B",' in text
+    assert (
+        'ubs_phase_duration_seconds_count{utility="Portal B",'
+        'account="1",phase="update"} 2'
+    ) in text
+    assert 'ubs_history_rows{utility="Portal B",account="1",' in text
+
+
+def test_failed_refresh_restarts_session(server):
+    server.start(startup_spread=0)
+    wait_until(lambda: len(FakeAPI.instances) == 2)
+    home = server.accounts["home"]
+    wait_until(lambda: home.api.updates >= 1)
+    home.api.fail_next_update = True
+    n_updates = home.api.updates
+    wait_until(lambda: home.api.updates >= n_updates + 2)
+    assert home.api.sessions_opened == 2
+
+    server.stop()
+    assert all(x.closed and x.session_depth == 0 for x in FakeAPI.instances)
+
+
+def test_refresh_requested_during_a_refresh(server):
+    server.start(startup_spread=0)
+    wait_until(lambda: len(FakeAPI.instances) == 2)
+    other = server.accounts["1"]
+    wait_until(lambda: other.api.updates == 1 and not other.running)
+
+    other.api.gate = threading.Event()
+    server.refresh_now("1")
+    wait_until(lambda: other.api.updates == 2)
+    # Requested while the refresh is still running.
+    server.refresh_now("1")
+    other.api.gate.set()
+    wait_until(lambda: other.api.updates == 3)
+
+    # Only one more refresh was queued.
+    time.sleep(0.3)
+    assert other.api.updates == 3
+    assert other.next_refresh > time.time() + 1000
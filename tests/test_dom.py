@@ -0,0 +1,216 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from fake_browser import FakeDriver, node_available
+from selenium.common.exceptions import InvalidSessionIdException
+from selenium.webdriver.common.by import By
+from utility_bill_scraper.canada.on.enova_power import EnovaPowerAPI
+from utility_bill_scraper.canada.on.kitchener_utilities import KitchenerUtilitiesAPI
+from utility_bill_scraper.dom import READ_TABLE_SCRIPT, read_table
+
+requires_node = pytest.mark.skipif(
+    not node_available(), reason="running page scripts requires node"
+)
+
+TABLE_HTML = """
+<table id="bills">
+  <thead><tr><th>Statement</th><th>Date</th><th>Amount</th></tr></thead>
+  <tbody>
+    <tr>
+      <td><a href="/bills/1.pdf">View <b>bill</b></a></td>
+      <td> 10/18/2021&nbsp;</td>
+      <td><img title="PDF" alt="Download" src="/pdf.png"><span>$102.30</span></td>
+    </tr>
+    <tr><td>&nbsp;</td><td></td><td></td></tr>
+  </tbody>
+</table>
+<table id="no-body"><tr><td>Gas</td></tr><tr><td>Water</td></tr></table>
+"""
+
+
+def make_api(cls, driver, **kwargs):
+    api = cls(data_path=tempfile.mkdtemp(), **kwargs)
+    # Use the fake browser as an already logged-in session.
+    api._driver = driver
+    api._logged_in = True
+    return api
+
+
+@requires_node
+def test_read_table():
+    driver = FakeDriver(TABLE_HTML)
+    table = driver.find_element(By.ID, "bills")
+    rows = read_table(driver, table)
+    # A single round trip reads the whole table.
+    assert driver.scripts == [READ_TABLE_SCRIPT]
+
+    # Only the body's rows are read, and text is trimmed (including &nbsp;).
+    assert [[x["text"] for x in row] for row in rows] == [
+        ["View bill", "10/18/2021", "$102.30"],
+        ["", "", ""],
+    ]
+    cells = rows[0]
+    assert cells[0]["element"] is table.find_elements(By.TAG_NAME, "td")[0]
+    assert [(x["href"], x["text"]) for x in cells[0]["links"]] == [
+        ("/bills/1.pdf", "View bill")
+    ]
+    assert cells[0]["links"][0]["element"].tag_name == "a"
+    assert cells[1]["links"] == [] and cells[1]["imgs"] == []
+    img = cells[2]["imgs"][0]
+    assert (img["title"], img["alt"], img["src"]) == ("PDF", "Download", "/pdf.png")
+    assert img["element"].tag_name == "img"
+
+    # Tables without a <tbody> (and <tbody> elements) can be read too.
+    rows = read_table(driver, driver.find_element(By.ID, "no-body"))
+    assert [[x["text"] for x in row] for row in rows] == [["Gas"], ["Water"]]
+    tbody = table.find_element(By.TAG_NAME, "tbody")
+    assert len(read_table(driver, tbody)) == 2
+
+
+KITCHENER_UTILITIES_HTML = """
+<ul id="headerNavigationBar"><li>ACCOUNTS</li><li>BILLING</li><li></li></ul>
+<table id="ContractTable-table"><tbody>
+  <tr><td><span>Gas</span></td><td>Active</td></tr>
+  <tr><td><span>Water and Sewer</span></td><td>Active</td></tr>
+</tbody></table>
+<a id="contractDetailNavigationBarItem2">Consumption History</a>
+<div id="contractConsumptionHistory">
+  <table id="__table1-table">
+    <thead><tr><th>Month</th><th>Consumption</th></tr></thead>
+    <tbody>
+      <tr><td>January 2021</td><td>10.5</td></tr>
+      <tr><td>February 2021</td><td>&nbsp;8.25 </td></tr>
+      <tr><td>February 2021</td><td>1.75</td></tr>
+      <tr><td>&nbsp;</td><td>&nbsp;</td></tr>
+    </tbody>
+  </table>
+  <ul id="__table1-paginator-pages"><li>1</li></ul>
+</div>
+"""
+
+
+@requires_node
+def test_kitchener_utilities_tables():
+    driver = FakeDriver(KITCHENER_UTILITIES_HTML)
+    api = make_api(KitchenerUtilitiesAPI, driver, listing_cache=None)
+
+    contracts = api._get_contracts()
+    assert list(contracts) == ["Gas", "Water and Sewer"]
+    assert contracts["Gas"].text == "Gas"
+
+    # Blank padding rows are dropped and values for the same month are summed.
+    series = api.get_consumption_history("Gas")
+    assert series.to_dict() == {"2021-01-31": 10.5, "2021-02-28": 10.0}
+    assert contracts["Gas"].clicks == 1
+    assert driver.quit_called
+
+
+class CrashingDriver(FakeDriver):
+    """A browser that crashes when the consumption history is opened."""
+
+    def find_element(self, by, value):
+        if value == "contractDetailNavigationBarItem2":
+            raise InvalidSessionIdException("invalid session id")
+        return super().find_element(by, value)
+
+
+class RestartingKitchenerUtilitiesAPI(KitchenerUtilitiesAPI):
+    def _init_driver(self):
+        self.drivers.append(FakeDriver(KITCHENER_UTILITIES_HTML))
+        self._driver = self.drivers[-1]
+
+    def _login(self):
+        self.logins += 1
+
+
+@requires_node
+def test_kitchener_utilities_consumption_history_restarts():
+    driver = CrashingDriver(KITCHENER_UTILITIES_HTML)
+    api = make_api(RestartingKitchenerUtilitiesAPI, driver, listing_cache=None)
+    api.drivers = []
+    api.logins = 0
+
+    # The history is read again from a new browser session.
+    series = api.get_consumption_history("Gas")
+    assert series.to_dict() == {"2021-01-31": 10.5, "2021-02-28": 10.0}
+    assert driver.quit_called
+    assert len(api.drivers) == 1 and api.logins == 1
+
+
+ENOVA_POWER_HTML = """
+<a href="#bills">Bills &amp; Payment</a>
+<table id="billsTable">
+  <thead><tr><th></th><th>Bill Date</th><th>Amount</th></tr></thead>
+  <tbody>
+    <tr><td><img title="View" src="/bill.png"></td><td>Feb 5, 2021</td><td>$ 120.50</td></tr>
+    <tr><td><img title="View" src="/bill.png"></td><td>Jan 6, 2021</td><td>$ 98.10</td></tr>
+    <tr><td><img title="View" src="/bill.png"></td><td>Dec 4, 2020</td><td>$ 101.00</td></tr>
+  </tbody>
+</table>
+"""
+
+
+class OfflineEnovaPowerAPI(EnovaPowerAPI):
+    def download_link(self, link, ext):
+        self.clicked.append(link)
+        path = os.path.join(self._workspace.new_dir(), "statement.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF")
+        return path
+
+
+@requires_node
+def test_enova_power_bills_table():
+    driver = FakeDriver(ENOVA_POWER_HTML)
+    api = make_api(OfflineEnovaPowerAPI, driver, save_statements=False)
+    api.clicked = []
+
+    pdf_files = api.download_statements(start_date="2021-01-01")
+    assert [os.path.basename(x) for x in pdf_files] == [
+        "2021-02-05 - Kitchener-Wilmot Hydro - $120.50.pdf",
+        "2021-01-06 - Kitchener-Wilmot Hydro - $98.10.pdf",
+    ]
+    # Each statement is downloaded by clicking the image in its row.
+    images = driver.find_elements(By.TAG_NAME, "img")
+    assert api.clicked == images[:2]
+
+
+def cells(*texts):
+    return [{"text": x, "element": None, "links": [], "imgs": []} for x in texts]
+
+
+def test_iter_pages_waits_for_the_table():
+    api = KitchenerUtilitiesAPI(data_path=tempfile.mkdtemp(), timeout=1)
+    # Blank rows are shown while the table loads.
+    reads = [[cells("", "")], [cells("", "")], [cells("January 2021", "10.5")]]
+    pages = api._iter_pages(lambda: reads.pop(0), first_page=False)
+    assert next(pages) == [cells("January 2021", "10.5")]
+
+    # Empty tables (with the portal's "no data" row, or no rows at all)
+    # yield a single empty page.
+    for rows in [[cells("No data", "")], []]:
+        pages = api._iter_pages(lambda: rows, first_page=False)
+        assert list(pages) == [[]]
+
+
+EMPTY_BILLING_HTML = """
+<ul id="headerNavigationBar"><li>ACCOUNTS</li><li>BILLING</li></ul>
+<a id="__table1-paginator--firstPageLink">First</a>
+<table id="__table1-table">
+  <thead><tr><th></th><th>Invoice</th><th>Date</th><th>Due</th><th>Amount</th></tr></thead>
+  <tbody><tr><td colspan="5">No data</td></tr></tbody>
+</table>
+"""
+
+
+@requires_node
+def test_kitchener_utilities_without_statements():
+    driver = FakeDriver(EMPTY_BILLING_HTML)
+    api = make_api(KitchenerUtilitiesAPI, driver, listing_cache=None)
+    assert api.download_statements() == []
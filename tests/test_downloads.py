@@ -0,0 +1,135 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI
+from utility_bill_scraper import Timeout, downloads
+
+
+def event(method, **params):
+    return {"message": json.dumps({"message": {"method": method, "params": params}})}
+
+
+class FakeChrome:
+    def __init__(self):
+        self.log = []
+        self.commands = []
+
+    def get_log(self, log_type):
+        log, self.log = self.log, []
+        return log
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.commands.append((cmd, params))
+
+
+class FakeFirefox:
+    CONTEXT_CHROME = "chrome"
+
+    def __init__(self, allow_chrome_context=True):
+        self.allow_chrome_context = allow_chrome_context
+        self.download_dir = None
+
+    @contextlib.contextmanager
+    def context(self, context):
+        if not self.allow_chrome_context:
+            raise WebDriverException("System access is required")
+        yield
+
+    def execute_script(self, script, *args):
+        self.download_dir = args[0]
+
+
+def test_chrome_download_events():
+    driver = FakeChrome()
+    directory = tempfile.mkdtemp()
+    download = downloads.Download(driver, "Chrome", directory)
+    driver.log = [event("Page.downloadProgress", guid="old", state="completed")]
+    download.prepare()
+    assert driver.commands[-1][1]["downloadPath"] == directory
+
+    def browser():
+        # The final file is written before the event arrives.
+        with open(os.path.join(directory, "statement.pdf"), "wb") as f:
+            f.write(b"%PDF")
+        driver.log = [
+            event(
+                "Page.downloadWillBegin", guid="1", suggestedFilename="statement.pdf"
+            ),
+            event("Page.downloadProgress", guid="1", state="completed"),
+        ]
+
+    browser()
+    assert download.wait("*.pdf", 5) == os.path.join(directory, "statement.pdf")
+
+
+def test_chrome_download_canceled():
+    driver = FakeChrome()
+    download = downloads.Download(driver, "Chrome", tempfile.mkdtemp())
+    download.prepare()
+    driver.log = [
+        event("Page.downloadWillBegin", guid="1", suggestedFilename="a.pdf"),
+        event("Page.downloadProgress", guid="1", state="canceled"),
+    ]
+    with pytest.raises(downloads.DownloadFailed):
+        download.wait("*.pdf", 5)
+
+
+def test_firefox_partial_downloads():
+    driver = FakeFirefox()
+    directory = tempfile.mkdtemp()
+    download = downloads.Download(driver, "Firefox", directory)
+    download.prepare()
+    assert driver.download_dir == directory
+
+    filepath = os.path.join(directory, "usage.csv")
+
+    def browser():
+        # Firefox creates an empty placeholder and writes to a `.part` file.
+        open(filepath, "wb").close()
+        with open(filepath + ".part", "wb") as f:
+            f.write(b"x" * 100)
+        time.sleep(0.3)
+        os.replace(filepath + ".part", filepath)
+
+    thread = threading.Thread(target=browser)
+    thread.start()
+    t_start = time.time()
+    assert download.wait("*.csv", 5) == filepath
+    assert time.time() - t_start >= 0.2
+    thread.join()
+
+    with pytest.raises(Timeout):
+        downloads.Download(driver, "Firefox", tempfile.mkdtemp()).wait("*.csv", 0.2)
+
+
+@pytest.mark.parametrize("allow_chrome_context", [True, False])
+def test_each_download_gets_its_own_directory(allow_chrome_context):
+    api = ExampleAPI(data_path=tempfile.mkdtemp())
+    api._driver = FakeFirefox(allow_chrome_context)
+
+    def start():
+        directory = api._driver.download_dir or api._temp_download_dir
+        with open(os.path.join(directory, "statement.pdf"), "wb") as f:
+            f.write(b"%PDF")
+
+    first = api._download(start, "pdf")
+    api._driver.download_dir = None
+    second = api._download(start, "pdf")
+    if allow_chrome_context:
+        assert os.path.dirname(first) != os.path.dirname(second)
+        assert os.path.exists(first)
+    else:
+        # Falls back to the browser's default directory.
+        assert os.path.dirname(second) == api._temp_download_dir
+    api._driver = None
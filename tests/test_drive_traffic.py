@@ -0,0 +1,109 @@
+"""Benchmarks for the google drive traffic generated by `UtilityAPI.update()`.
+
+Each scenario runs against an in-memory fake drive and checks the number of
+API calls and bytes transferred against a budget, so that changes which
+increase drive traffic get caught.
+"""
+
+import os
+import sys
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI, monthly_statements
+from fake_drive import FakeDriveService
+from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper
+
+STATEMENT_SIZE = 50 * 1024
+
+# Maximum number of drive API calls and bytes uploaded/downloaded for each
+# scenario.
+BUDGETS = {
+    "construct_empty": dict(calls=5, uploaded=0, downloaded=0),
+    "first_update": dict(calls=40, uploaded=25 * STATEMENT_SIZE, downloaded=0),
+    "construct": dict(calls=12, uploaded=0, downloaded=4 * 1024),
+    "noop_update": dict(calls=3, uploaded=0, downloaded=0),
+    "one_new_statement": dict(calls=6, uploaded=STATEMENT_SIZE + 2048, downloaded=0),
+}
+
+
+def traffic(drive):
+    return dict(
+        calls=drive.total_calls,
+        uploaded=drive.bytes_uploaded,
+        downloaded=drive.bytes_downloaded,
+    )
+
+
+def check_budget(scenario, drive):
+    measured = traffic(drive)
+    print(f"{scenario}: {measured} (budget: {BUDGETS[scenario]})")
+    for key, limit in BUDGETS[scenario].items():
+        assert measured[key] <= limit, f"{scenario}: {key}={measured[key]} > {limit}"
+    drive.reset_counters()
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    monkeypatch.setattr(ExampleAPI, "statement_size", STATEMENT_SIZE)
+    return FakeDriveService()
+
+
+def make_api(drive, folder_id):
+    return ExampleAPI(
+        data_path=f"https://drive.google.com/drive/u/0/folders/{folder_id}",
+        google_sa_credentials=GoogleDriveHelper(service=drive),
+    )
+
+
+def test_update_traffic(drive, monkeypatch):
+    folder_id = drive.add_folder("data")
+    monkeypatch.setattr(
+        ExampleAPI, "available_statements", monthly_statements(24, year=2020)
+    )
+
+    api = make_api(drive, folder_id)
+    check_budget("construct_empty", drive)
+
+    assert len(api.update()) == 24
+    check_budget("first_update", drive)
+    statements_folder = drive.find("statements")[0]
+    assert len(drive.find("manifest.json")) == 1
+    assert (
+        len(
+            [x for x in drive.files_by_id.values() if statements_folder in x["parents"]]
+        )
+        == 24
+    )
+
+    # A new run with nothing new shouldn't upload anything.
+    api = make_api(drive, folder_id)
+    check_budget("construct", drive)
+    assert len(api.history()) == 24
+    assert len(api.update()) == 0
+    check_budget("noop_update", drive)
+
+    # One new statement only uploads the pdf, the 2022 partition and the
+    # manifest.
+    monkeypatch.setattr(
+        ExampleAPI, "available_statements", monthly_statements(25, year=2020)
+    )
+    assert len(api.update()) == 1
+    assert drive.calls.get("files.create", 0) + drive.calls.get("files.update", 0) == 3
+    check_budget("one_new_statement", drive)
+
+
+def test_update_recovers_from_transient_errors(drive, monkeypatch):
+    folder_id = drive.add_folder("data")
+    monkeypatch.setattr(
+        ExampleAPI, "available_statements", monthly_statements(3, year=2020)
+    )
+    api = make_api(drive, folder_id)
+    api._gdh.executor._sleep = lambda delay: None
+
+    drive.fail_next(2, status=429)
+    assert len(api.update()) == 3
+    assert api._storage.stats()["files.list"]["retries"] >= 1
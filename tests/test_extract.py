@@ -0,0 +1,137 @@
+import os
+import sys
+import tempfile
+import time
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI, monthly_statements, write_statements
+from fake_drive import FakeDriveService
+from utility_bill_scraper import registry
+from utility_bill_scraper.bin import ubs
+from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper
+
+
+class FixableAPI(ExampleAPI):
+    extract_seconds = 0.05
+    # Added to each total (e.g., to simulate a parser fix).
+    adjustment = 0.0
+
+    def extract_data(self, pdf_file):
+        result = super().extract_data(pdf_file)
+        result["Total"] += self.adjustment
+        return result
+
+
+def test_extract_statements():
+    statements_path = tempfile.mkdtemp()
+    write_statements(statements_path, monthly_statements(6))
+    data_path = tempfile.mkdtemp()
+    api = FixableAPI(data_path=data_path)
+    progress = []
+    t_start = time.time()
+    df = api.extract_statements(
+        ubs.expand_statement_paths([statements_path]),
+        max_workers=6,
+        progress=lambda *args: progress.append(args),
+    )
+    seconds = time.time() - t_start
+
+    assert sorted(df["Total"]) == [51.0, 52.0, 53.0, 54.0, 55.0, 56.0]
+    # Extracting the statements one at a time would take at least 0.3 s.
+    assert seconds < 0.25
+    assert [x[:2] for x in progress] == [(i, 6) for i in range(1, 7)]
+
+    # The history is written, and statements already in it are skipped.
+    api = FixableAPI(data_path=data_path)
+    assert len(api.history()) == 6
+    df = api.extract_statements(ubs.expand_statement_paths([statements_path]))
+    assert len(df) == 0
+    assert not [x for x in api.events if x[0] == "extracting"]
+
+
+def test_extract_statements_force():
+    data_path = tempfile.mkdtemp()
+    # Without any paths, the statements archived in `data_path` are extracted.
+    write_statements(
+        os.path.join(data_path, ExampleAPI.name, "statements"), monthly_statements(6)
+    )
+    api = FixableAPI(data_path=data_path)
+    assert len(api.extract_statements()) == 6
+
+    # After a "parser fix", `force` replaces the existing rows.
+    api = FixableAPI(data_path=data_path)
+    api.adjustment = 1.0
+    df = api.extract_statements(force=True)
+    assert len(df) == 6
+    history = FixableAPI(data_path=data_path).history()
+    assert len(history) == 6
+    assert sorted(history["Total"]) == [52.0, 53.0, 54.0, 55.0, 56.0, 57.0]
+
+
+def test_expand_statement_paths(capsys):
+    path = tempfile.mkdtemp()
+    write_statements(path, monthly_statements(3))
+    assert len(ubs.expand_statement_paths([path])) == 3
+    assert ubs.expand_statement_paths(
+        [os.path.join(path, "2021-0[12]-*.pdf"), os.path.join(path, "2021-01-*.pdf")]
+    ) == [
+        os.path.join(path, "2021-01-15 - Example Utility - $51.00.pdf"),
+        os.path.join(path, "2021-02-15 - Example Utility - $52.00.pdf"),
+    ]
+    assert ubs.expand_statement_paths([os.path.join(path, "missing")]) == []
+    assert "no statements match" in capsys.readouterr().err
+
+
+def test_ubs_extract(monkeypatch, capsys):
+    monkeypatch.setitem(registry.UTILITIES, ExampleAPI.name, f"{__name__}:FixableAPI")
+    statements_path = tempfile.mkdtemp()
+    write_statements(statements_path, monthly_statements(6))
+    data_path = tempfile.mkdtemp()
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "ubs",
+            "--utility-name",
+            ExampleAPI.name,
+            "--data-path",
+            data_path,
+            "extract",
+            "-j",
+            "2",
+            statements_path,
+        ],
+    )
+    ubs.main()
+    output = capsys.readouterr().out
+    assert "[6/6] " in output
+    assert "Added 6 rows in the history" in output
+    assert len(FixableAPI(data_path=data_path).history()) == 6
+
+
+def test_ubs_extract_compressed_history(monkeypatch):
+    monkeypatch.setitem(registry.UTILITIES, ExampleAPI.name, f"{__name__}:FixableAPI")
+    statements = monthly_statements(18)
+    old_statements, new_statements = tempfile.mkdtemp(), tempfile.mkdtemp()
+    write_statements(old_statements, statements[:12])
+    write_statements(new_statements, statements[12:])
+    drive = FakeDriveService()
+    data_path = "https://drive.google.com/drive/u/0/folders/" + drive.add_folder("ubs")
+    gdh = GoogleDriveHelper(service=drive)
+    api = FixableAPI(data_path=data_path, google_sa_credentials=gdh, compression="gzip")
+    api.extract_statements(ubs.expand_statement_paths([old_statements]))
+
+    drive.reset_counters()
+    ubs.extract(ExampleAPI.name, data_path, [new_statements], gdh, compression="gzip")
+
+    # Only the new (compressed) partition and the manifest are uploaded.
+    api = FixableAPI(data_path=data_path, google_sa_credentials=gdh)
+    assert api._storage.list("Example Utility/monthly") == [
+        "2021.csv.gz",
+        "2022.csv.gz",
+        "manifest.json",
+    ]
+    assert len(api.history()) == 18
+    assert drive.bytes_uploaded < 2048
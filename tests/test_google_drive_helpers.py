@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+import pytest
+from googleapiclient.errors import HttpError
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from fake_drive import FakeDriveService
+from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper, is_retryable
+from utility_bill_scraper.request_executor import RequestExecutor
+
+
+def make_helper(**kwargs):
+    drive = FakeDriveService(**kwargs)
+    executor = RequestExecutor(is_retryable=is_retryable, sleep=lambda delay: None)
+    return drive, GoogleDriveHelper(service=drive, executor=executor)
+
+
+def test_list_follows_pagination():
+    drive, gdh = make_helper(page_size=2)
+    folder_id = drive.add_folder("data")
+    for i in range(5):
+        drive.add_file(f"{i}.csv", folder_id, b"x")
+    drive.add_file("other.pdf", folder_id, b"x")
+
+    assert len(gdh.get_files_in_folder(folder_id)) == 6
+    assert len(gdh.get_files_in_folder(folder_id, "*.csv")) == 5
+    assert drive.calls["files.list"] == 6
+
+
+def test_get_file_in_folder():
+    drive, gdh = make_helper()
+    folder_id = drive.add_folder("data")
+    file_id = drive.add_file("Bob's file.csv", folder_id, b"x")
+
+    assert gdh.get_file_in_folder(folder_id, "Bob's file.csv")["id"] == file_id
+    assert gdh.file_exists_in_folder(folder_id, "Bob's file.csv")
+    assert not gdh.file_exists_in_folder(folder_id, "missing.csv")
+    with pytest.raises(IndexError):
+        gdh.get_file_in_folder(folder_id, "missing.csv")
+
+
+def test_upload_and_download():
+    drive, gdh = make_helper()
+    folder_id = drive.add_folder("data")
+    local_path = os.path.join(tempfile.mkdtemp(), "monthly.csv")
+    with open(local_path, "wb") as f:
+        f.write(b"Date,Total\n2023-01-31,1.0\n")
+
+    file_id = gdh.create_file_in_folder(folder_id, local_path)["id"]
+    assert drive.content(file_id) == b"Date,Total\n2023-01-31,1.0\n"
+    assert (
+        gdh.get_file(file_id)["md5Checksum"]
+        == hashlib.md5(drive.content(file_id)).hexdigest()
+    )
+
+    gdh.update_file_from_bytes(file_id, b"0123456789", "text/csv")
+    assert gdh.download_bytes(file_id) == b"0123456789"
+    assert gdh.download_bytes(file_id, 2, 5) == b"234"
+    assert gdh.download_bytes(file_id, 7) == b"789"
+
+    download_path = os.path.join(tempfile.mkdtemp(), "sub", "monthly.csv")
+    gdh.download_file(file_id, download_path)
+    with open(download_path, "rb") as f:
+        assert f.read() == b"0123456789"
+
+
+def test_transient_errors_are_retried():
+    drive, gdh = make_helper()
+    folder_id = drive.add_folder("data")
+    drive.fail_next(2, status=503)
+    assert gdh.get_files_in_folder(folder_id) == []
+    assert gdh.stats()["files.list"]["retries"] == 2
+
+    drive.fail_next(1, status=404)
+    with pytest.raises(HttpError):
+        gdh.get_files_in_folder(folder_id)
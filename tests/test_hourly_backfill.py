@@ -0,0 +1,112 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import Timeout
+from utility_bill_scraper.canada.on.enova_power import (
+    HOURLY_CHECKPOINT_NAME,
+    EnovaPowerAPI,
+)
+
+
+class FakeEnovaAPI(EnovaPowerAPI):
+    # Months without any data on the "portal".
+    missing_months = ["2021-06"]
+    # Last hour of data published on the "portal" (if set).
+    published_until = None
+
+    def __init__(self, *args, fail_on=None, failures=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Fail `failures` times (or always) when downloading `fail_on`.
+        self.fail_on = fail_on
+        self.failures = failures
+        self.downloaded = []
+        self.restarts = 0
+
+    @contextlib.contextmanager
+    def session(self):
+        yield None
+
+    def _restart_session(self):
+        self.restarts += 1
+
+    def _download_hourly_month(self, date):
+        month = "%d-%02d" % (date.year, date.month)
+        if month == self.fail_on and self.failures != 0:
+            if self.failures:
+                self.failures -= 1
+            raise Timeout("Timed out after 10s waiting for download.")
+        self.downloaded.append(month)
+        if month in self.missing_months:
+            return None
+        index = pd.date_range(
+            "%s-01 01:00" % month, "%s 00:00" % (date + pd.Timedelta(days=1)), freq="h"
+        )
+        if self.published_until:
+            index = index[index <= pd.Timestamp(self.published_until)]
+        df = pd.DataFrame({"kWh": 1.0}, index=index)
+        df.index.name = "Datetime"
+        return df
+
+
+def test_resume_backfill():
+    data_path = tempfile.mkdtemp()
+    api = FakeEnovaAPI(data_path=data_path, fail_on="2021-04")
+    with pytest.raises(Timeout):
+        api.download_hourly_data("2021-01-01", "2021-06-30")
+    assert api.restarts == api._max_session_restarts
+    assert api.downloaded == ["2021-01", "2021-02", "2021-03"]
+
+    # The completed months were committed as they arrived.
+    api = FakeEnovaAPI(data_path=data_path)
+    history = api.history("hourly")
+    assert history.index[-1] == pd.Timestamp("2021-04-01 00:00")
+    assert len(history) == (31 + 28 + 31) * 24
+    with open(os.path.join(data_path, api.name, HOURLY_CHECKPOINT_NAME)) as f:
+        assert json.load(f)["completed"] == ["2021-01", "2021-02", "2021-03"]
+
+    # A restarted run resumes from the first incomplete month.
+    df = api.download_hourly_data("2021-01-01", "2021-06-30")
+    assert api.downloaded == ["2021-04", "2021-05", "2021-06"]
+    assert len(df) == (30 + 31) * 24
+
+    # Months without data are checkpointed too, so they aren't retried.
+    api = FakeEnovaAPI(data_path=data_path)
+    assert len(api.download_hourly_data("2021-01-01", "2021-06-30")) == 0
+    assert api.downloaded == []
+
+
+def test_retry_month_after_session_restart():
+    api = FakeEnovaAPI(data_path=tempfile.mkdtemp(), fail_on="2021-02", failures=2)
+    df = api.download_hourly_data("2021-01-01", "2021-03-31")
+    assert api.restarts == 2
+    assert api.downloaded == ["2021-01", "2021-02", "2021-03"]
+    assert len(df) == (31 + 28 + 31) * 24
+
+
+def test_short_month_is_not_checkpointed():
+    data_path = tempfile.mkdtemp()
+    api = FakeEnovaAPI(data_path=data_path)
+    # The last days of February haven't been published yet.
+    api.published_until = "2021-02-20 00:00"
+    df = api.download_hourly_data("2021-01-01", "2021-02-28")
+    assert len(df) == (31 + 19) * 24
+    with open(os.path.join(data_path, api.name, HOURLY_CHECKPOINT_NAME)) as f:
+        assert json.load(f)["completed"] == ["2021-01"]
+
+    # A later run downloads the rest of the month.
+    api = FakeEnovaAPI(data_path=data_path)
+    df = api.download_hourly_data("2021-01-01", "2021-02-28")
+    assert api.downloaded == ["2021-02"]
+    assert len(df) == 9 * 24
+    assert api.history("hourly").index[-1] == pd.Timestamp("2021-03-01 00:00")
+    with open(os.path.join(data_path, api.name, HOURLY_CHECKPOINT_NAME)) as f:
+        assert json.load(f)["completed"] == ["2021-01", "2021-02"]
@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI
+from utility_bill_scraper import lean_profile
+
+
+def test_firefox_options():
+    api = ExampleAPI(data_path=tempfile.mkdtemp(), browser="Firefox", lean=True)
+    prefs = api._driver_options().preferences
+    assert prefs["permissions.default.image"] == 2
+    assert prefs["browser.download.dir"] == api._temp_download_dir
+
+    api = ExampleAPI(data_path=tempfile.mkdtemp(), browser="Firefox")
+    assert "permissions.default.image" not in api._driver_options().preferences
+
+
+def test_chrome_options():
+    api = ExampleAPI(data_path=tempfile.mkdtemp(), browser="Chrome", lean=True)
+    prefs = api._driver_options().experimental_options["prefs"]
+    assert prefs["profile.managed_default_content_settings.images"] == 2
+    assert prefs["download.default_directory"] == api._temp_download_dir
+
+
+def test_apply_chrome_blocking():
+    class FakeDriver:
+        commands = []
+
+        def execute_cdp_cmd(self, cmd, params):
+            self.commands.append((cmd, params))
+
+    driver = FakeDriver()
+    lean_profile.apply_chrome_blocking(driver)
+    cmd, params = driver.commands[-1]
+    assert cmd == "Network.setBlockedURLs"
+    assert "*.woff2" in params["urls"]
+    assert "*://*.google-analytics.com/*" in params["urls"]
@@ -0,0 +1,171 @@
+import contextlib
+import os
+import sys
+import tempfile
+
+from selenium.common.exceptions import InvalidSessionIdException
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+import utility_bill_scraper.canada.on.kitchener_utilities as ku
+from utility_bill_scraper.listing_cache import ListingCache
+
+PAGE_SIZE = 3
+
+
+def make_listing(n_months):
+    """Return billing table rows for `n_months` of statements (newest
+    first)."""
+    rows = []
+    for i in reversed(range(n_months)):
+        year, month = 2021 + i // 12, i % 12 + 1
+        date = "%02d/15/%d" % (month, year)
+        rows.append(
+            [
+                {"text": "", "imgs": [{"title": "PDF", "element": "%d" % i}]},
+                {"text": "1000%02d" % i, "imgs": []},
+                {"text": date, "imgs": []},
+                {"text": date, "imgs": []},
+                {"text": "%.2f" % (50 + i), "imgs": []},
+            ]
+        )
+    return rows
+
+
+class FakePortalAPI(ku.KitchenerUtilitiesAPI):
+    listing = []
+
+    def __init__(self, *args, crash_on_page=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages_read = 0
+        self.downloads = []
+        self.restarts = 0
+        self.crash_on_page = crash_on_page
+
+    @contextlib.contextmanager
+    def session(self):
+        yield None
+
+    def _get_header_nav_bar(self):
+        return {"BILLING": type("Link", (), {"click": lambda self: None})()}
+
+    def _iter_pages(self, read_rows, first_page=True):
+        for i in range(0, len(self.listing), PAGE_SIZE):
+            self.pages_read += 1
+            if self.pages_read == self.crash_on_page:
+                raise InvalidSessionIdException("invalid session id")
+            yield self.listing[i : i + PAGE_SIZE]
+
+    def _restart_session(self):
+        self.restarts += 1
+
+    def download_link(self, link, ext):
+        self.downloads.append(link)
+        filepath = os.path.join(self._workspace.new_dir(), "statement.pdf")
+        with open(filepath, "wb") as f:
+            f.write(b"%PDF-1.4 " + link.encode())
+        return filepath
+
+
+def make_api(data_path, cache_dir):
+    return FakePortalAPI(
+        "user", "password", data_path=data_path, listing_cache=cache_dir
+    )
+
+
+def test_listing_cache():
+    cache = ListingCache("Example Utility", "user", tempfile.mkdtemp())
+    assert cache.load() == []
+    rows = [
+        {"id": "b", "date": "2022-02-15", "amount": "2.00"},
+        {"id": "a", "date": "2022-01-15", "amount": "1.00"},
+    ]
+    cache.update(rows[1:])
+    assert cache.update(rows[:1]) == rows
+    assert cache.load() == rows
+    assert oct(os.stat(cache.path).st_mode & 0o777) == "0o600"
+    cache.clear()
+    assert cache.load() == []
+
+
+def test_stop_paging_at_cached_rows(monkeypatch):
+    data_path, cache_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    monkeypatch.setattr(FakePortalAPI, "listing", make_listing(12))
+    api = make_api(data_path, cache_dir)
+    files = api.download_statements()
+    assert len(files) == 12
+    assert api.pages_read == 4
+    assert len(api.downloads) == 12
+
+    # Two new statements: only the first page is read, and only the new
+    # statements are downloaded.
+    monkeypatch.setattr(FakePortalAPI, "listing", make_listing(14))
+    api = make_api(data_path, cache_dir)
+    files = api.download_statements()
+    assert [os.path.basename(x) for x in files[:3]] == [
+        "2022-02-15 - Kitchener Utilities - $63.00.pdf",
+        "2022-01-15 - Kitchener Utilities - $62.00.pdf",
+        "2021-12-15 - Kitchener Utilities - $61.00.pdf",
+    ]
+    assert len(files) == 14
+    assert api.pages_read == 1
+    assert api.downloads == ["13", "12"]
+
+    # Nothing new.
+    api = make_api(data_path, cache_dir)
+    assert len(api.download_statements(start_date="2022-01-01")) == 2
+    assert api.pages_read == 1
+    assert api.downloads == []
+
+
+def test_keep_paging_for_statements_that_are_not_archived(monkeypatch):
+    data_path, cache_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    monkeypatch.setattr(FakePortalAPI, "listing", make_listing(12))
+    api = make_api(data_path, cache_dir)
+    api.download_statements()
+
+    # A statement that was listed (but is no longer archived) is downloaded
+    # again.
+    os.remove(
+        os.path.join(
+            api._storage.local_path(api._statements_path()),
+            "2021-02-15 - Kitchener Utilities - $51.00.pdf",
+        )
+    )
+    api = make_api(data_path, cache_dir)
+    assert len(api.download_statements()) == 12
+    assert api.pages_read == 4
+    assert api.downloads == ["1"]
+
+
+def test_resume_after_session_restart(monkeypatch):
+    monkeypatch.setattr(FakePortalAPI, "listing", make_listing(12))
+    api = FakePortalAPI(
+        "user",
+        "password",
+        data_path=tempfile.mkdtemp(),
+        listing_cache=tempfile.mkdtemp(),
+        crash_on_page=3,
+    )
+    files = api.download_statements()
+    assert api.restarts == 1
+    assert len(files) == 12
+    # Nothing is downloaded twice.
+    assert sorted(api.downloads, key=int) == [str(i) for i in range(12)]
+
+
+def test_listing_cache_is_opt_in():
+    api = ku.KitchenerUtilitiesAPI(data_path=tempfile.mkdtemp())
+    assert api._listing_cache is None
+
+    from utility_bill_scraper.bin.ubs import make_api, parse_cache_option
+
+    cache_dir = tempfile.mkdtemp()
+    api = make_api(ku.NAME, data_path=tempfile.mkdtemp(), listing_cache=cache_dir)
+    assert api._listing_cache is not None
+    # Utilities without a listing cache ignore the option.
+    make_api("Kitchener-Wilmot Hydro", data_path=tempfile.mkdtemp(), listing_cache=True)
+    assert parse_cache_option("True") is True
+    assert parse_cache_option("0") is None
+    assert parse_cache_option(cache_dir) == cache_dir
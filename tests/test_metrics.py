@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import metrics, timing
+
+
+def report(account):
+    timings = timing.Timings()
+    timings.record("download", 0.2, bytes=1000)
+    timings.record("download", 3.0, failed=True)
+    timings.record("extract", 0.05)
+    timings.count("statements_extracted")
+    return {
+        "utility_name": "Example Utility",
+        "account": account,
+        "phases": timings.phases(),
+        "counts": dict(timings.counts(), monthly_rows=12),
+        "storage_requests": {
+            "files.list": {
+                "calls": 3,
+                "errors": 1,
+                "retries": 1,
+                "total_seconds": 0.5,
+                "max_seconds": 0.3,
+            }
+        },
+    }
+
+
+def test_render():
+    text = metrics.render([report("a"), report('b"\\')])
+    lines = text.splitlines()
+    assert lines[-1] == "# EOF"
+
+    # Each family is described once, with all of its samples together.
+    assert lines.count("# TYPE ubs_phase_duration_seconds histogram") == 1
+    assert lines.count("# TYPE ubs_phase_failures counter") == 1
+    families = [x.split()[2] for x in lines if x.startswith("# TYPE")]
+    assert len(families) == len(set(families))
+
+    labels = 'utility="Example Utility",account="a",phase="download"'
+    assert f'ubs_phase_duration_seconds_bucket{{{labels},le="0.1"}} 0' in lines
+    assert f'ubs_phase_duration_seconds_bucket{{{labels},le="0.25"}} 1' in lines
+    assert f'ubs_phase_duration_seconds_bucket{{{labels},le="5.0"}} 2' in lines
+    assert f'ubs_phase_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"ubs_phase_duration_seconds_count{{{labels}}} 2" in lines
+    assert f"ubs_phase_duration_seconds_sum{{{labels}}} 3.2" in lines
+    assert f"ubs_phase_failures_total{{{labels}}} 1" in lines
+    assert f"ubs_phase_bytes_total{{{labels}}} 1000" in lines
+    assert (
+        'ubs_statements_extracted_total{utility="Example Utility",account="a"} 1'
+        in lines
+    )
+    assert (
+        'ubs_history_rows{utility="Example Utility",account="a",'
+        'resolution="monthly"} 12' in lines
+    )
+    assert (
+        'ubs_storage_request_errors_total{utility="Example Utility",account="a",'
+        'method="files.list"} 1' in lines
+    )
+    # Label values are escaped.
+    assert 'account="b\\"\\\\"' in text
+
+
+def test_write_textfile():
+    path = os.path.join(tempfile.mkdtemp(), "ubs.prom")
+    metrics.write_textfile(path, metrics.render([report("a")], openmetrics=False))
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert os.listdir(os.path.dirname(path)) == ["ubs.prom"]
+
+    # The Prometheus text format names counter families after their samples
+    # and has no `# EOF`.
+    assert "# TYPE ubs_phase_failures_total counter" in lines
+    assert "# TYPE ubs_phase_duration_seconds histogram" in lines
+    assert "# EOF" not in lines
+
+
+def sample_values(families):
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in families
+        for sample in family.samples
+    }
+
+
+def test_parse():
+    pytest.importorskip("prometheus_client")
+    from prometheus_client.openmetrics.parser import (
+        text_string_to_metric_families as parse_openmetrics,
+    )
+    from prometheus_client.parser import text_string_to_metric_families
+
+    reports = [report("a"), report('b"\\')]
+    prometheus = list(
+        text_string_to_metric_families(metrics.render(reports, openmetrics=False))
+    )
+    openmetrics = list(parse_openmetrics(metrics.render(reports)))
+
+    # Both formats have the same families and samples.
+    assert {(x.name, x.type) for x in prometheus} == {
+        (x.name, x.type) for x in openmetrics
+    }
+    assert ("ubs_phase_failures", "counter") in {(x.name, x.type) for x in prometheus}
+    values = sample_values(prometheus)
+    assert values == sample_values(openmetrics)
+    labels = (
+        ("account", 'b"\\'),
+        ("method", "files.list"),
+        ("utility", "Example Utility"),
+    )
+    assert values[("ubs_storage_request_errors_total", labels)] == 1
@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import metrics, orchestrator
+from utility_bill_scraper.bin import ubs
+
+
+class FakeAPI:
+    lock = threading.Lock()
+    running = {}
+    max_running = {}
+    total_running = 0
+    max_total_running = 0
+
+    def __init__(self, utility_name, user=None, password=None, data_path=None):
+        if password != "password":
+            raise RuntimeError("Invalid password")
+        self.utility_name = utility_name
+        self.closed = False
+
+    def update(self, max_downloads=None):
+        cls = type(self)
+        with cls.lock:
+            cls.running[self.utility_name] = cls.running.get(self.utility_name, 0) + 1
+            cls.max_running[self.utility_name] = max(
+                cls.max_running.get(self.utility_name, 0),
+                cls.running[self.utility_name],
+            )
+            cls.total_running += 1
+            cls.max_total_running = max(cls.max_total_running, cls.total_running)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.running[self.utility_name] -= 1
+            cls.total_running -= 1
+        return [None] * (max_downloads or 1)
+
+    def run_report(self):
+        return {"utility_name": self.utility_name}
+
+    def close(self):
+        self.closed = True
+
+
+def test_load_config(monkeypatch):
+    monkeypatch.setenv("UBS_TEST_PASSWORD", "secret")
+    path = os.path.join(tempfile.mkdtemp(), "accounts.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "defaults": {"browser": "Chrome"},
+                "accounts": [
+                    {
+                        "utility_name": "Kitchener Utilities",
+                        "user": "a",
+                        "password": "${UBS_TEST_PASSWORD}",
+                    },
+                    {"utility_name": "Kitchener-Wilmot Hydro", "browser": "Firefox"},
+                ],
+            },
+            f,
+        )
+    accounts = orchestrator.load_config(path)["accounts"]
+    assert accounts[0]["password"] == "secret"
+    assert accounts[0]["browser"] == "Chrome"
+    assert accounts[1]["browser"] == "Firefox"
+
+    with open(path, "w") as f:
+        json.dump({"accounts": [{"user": "a"}]}, f)
+    with pytest.raises(RuntimeError):
+        orchestrator.load_config(path)
+
+
+def test_update_all():
+    accounts = [
+        dict(utility_name="Portal A", user=f"a{i}@example.com", password="password")
+        for i in range(6)
+    ] + [
+        dict(utility_name="Portal B", user=f"b{i}@example.com", password="password")
+        for i in range(3)
+    ]
+    accounts[1]["password"] = "wrong"
+    accounts[2]["max_downloads"] = 3
+    accounts[3]["name"] = "a3"
+
+    results = orchestrator.update_all(
+        accounts, FakeAPI, max_workers=3, portal_limits={"Portal A": 2}
+    )
+
+    # Results are in the same order as the accounts.
+    # Accounts are identified by their name, or else by a hash of the login.
+    assert [x["account"] for x in results[:4]] == [
+        metrics.account_hash("Portal A", f"a{i}@example.com") for i in range(3)
+    ] + ["a3"]
+    assert results[1]["status"] == "failed"
+    assert "Invalid password" in results[1]["error"]
+    assert [x["new_statements"] for x in results[2:4]] == [3, 1]
+    assert results[1]["report"] is None
+    assert results[2]["report"] == {
+        "utility_name": "Portal A",
+        "account": results[2]["account"],
+    }
+    assert results[3]["report"] == {"utility_name": "Portal A", "account": "a3"}
+    assert FakeAPI.max_total_running <= 3
+    assert FakeAPI.max_running["Portal A"] <= 2
+    assert FakeAPI.max_running["Portal B"] <= orchestrator.DEFAULT_PORTAL_LIMIT
+
+    summary = orchestrator.format_summary(results)
+    assert summary.splitlines()[0] == (
+        "Updated 9 account(s): 8 ok, 1 failed, 10 new statement(s)"
+    )
+    assert "@example.com" not in summary
+
+
+def test_ubs_update_all_report(monkeypatch, capsys):
+    monkeypatch.setattr(ubs, "make_api", FakeAPI)
+    path = tempfile.mkdtemp()
+    with open(os.path.join(path, "accounts.json"), "w") as f:
+        json.dump(
+            {
+                "accounts": [
+                    {
+                        "utility_name": "Portal A",
+                        "user": "me@example.com",
+                        "password": "password",
+                    }
+                ]
+            },
+            f,
+        )
+    report_path = os.path.join(path, "report.json")
+    ubs.update_all(os.path.join(path, "accounts.json"), report_path=report_path)
+
+    # Logins aren't written to the report (or printed).
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report["accounts"][0]["account"] == metrics.account_hash(
+        "Portal A", "me@example.com"
+    )
+    assert "me@example.com" not in json.dumps(report)
+    assert "me@example.com" not in capsys.readouterr().out
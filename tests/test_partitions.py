@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pandas as pd
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import partitions
+
+
+def monthly_history():
+    return pd.DataFrame(
+        {"Total": [10.0, 20.0, 30.0, 40.0]},
+        index=pd.DatetimeIndex(
+            ["2022-12-15", "2021-11-15", "2022-01-15", "2021-12-15"], name="Date"
+        ),
+    )
+
+
+def test_split_history():
+    parts = partitions.split_history(monthly_history(), "monthly")
+    assert sorted(parts) == ["2021", "2022"]
+    # Each partition is a sorted csv with the same date format.
+    assert parts["2021"].decode().splitlines() == [
+        "Date,Total",
+        "2021-11-15,20.0",
+        "2021-12-15,40.0",
+    ]
+    assert partitions.split_history(monthly_history().iloc[:0], "monthly") == {}
+
+    hourly = pd.DataFrame(
+        {"kWh": [1.0, 2.0]},
+        index=pd.DatetimeIndex(
+            ["2021-01-31 23:00", "2021-02-01 00:00"], name="Datetime"
+        ),
+    )
+    parts = partitions.split_history(hourly, "hourly")
+    assert sorted(parts) == ["2021-01", "2021-02"]
+    assert "2021-02-01 00:00:00,2.0" in parts["2021-02"].decode()
+
+
+def test_changed_partitions():
+    parts = partitions.split_history(monthly_history(), "monthly")
+    manifest = partitions.new_manifest("monthly")
+    # Everything is new.
+    assert partitions.changed_partitions(parts, manifest, ".csv") == ["2021", "2022"]
+
+    manifest["partitions"] = {
+        key: {"md5": partitions.checksum(data), "name": key + ".csv"}
+        for key, data in parts.items()
+    }
+    assert partitions.changed_partitions(parts, manifest, ".csv") == []
+
+    # Only the partition whose content changed is returned.
+    df = monthly_history()
+    df.loc["2022-12-15", "Total"] = 11.0
+    parts = partitions.split_history(df, "monthly")
+    assert partitions.changed_partitions(parts, manifest, ".csv") == ["2022"]
+
+    # Changing the codec changes every partition's name.
+    assert partitions.changed_partitions(parts, manifest, ".csv", "gzip") == [
+        "2021",
+        "2022",
+    ]
+
+
+def test_manifest_round_trip():
+    manifest = partitions.new_manifest("hourly")
+    manifest["partitions"]["2021-01"] = {"md5": "abc", "name": "2021-01.csv.gz"}
+    assert partitions.load_manifest(partitions.dump_manifest(manifest)) == manifest
+    assert partitions.partition_name("2021-01", ".csv", "gzip") == "2021-01.csv.gz"
@@ -0,0 +1,68 @@
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import profiling
+
+
+def spin(seconds):
+    t_end = time.time() + seconds
+    n = 0
+    while time.time() < t_end:
+        n += 1
+    return n
+
+
+def allocate(size):
+    data = bytearray(size)
+    return len(data)
+
+
+def test_profile(capsys):
+    directory = tempfile.mkdtemp()
+    idle = threading.Event()
+    threading.Thread(target=idle.wait, name="idle", daemon=True).start()
+    with profiling.profile(directory, "ubs-update", interval=0.001) as profiler:
+        # Work in an executor thread is sampled too.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(spin, 0.2).result()
+        allocate(20 * 2**20)
+    idle.set()
+
+    assert profiler.samples > 0
+    assert profiler.peak_memory >= 20 * 2**20
+    names = [x[0] for x in profiler.hot_functions()]
+    assert names[0].startswith("spin (tests/test_profiling.py:")
+    # Idle threads are left out of the summary.
+    assert not [x for x in names if x.startswith("wait (")]
+
+    folded = glob.glob(os.path.join(directory, "ubs-update-*.folded"))
+    assert len(folded) == 1
+    with open(folded[0]) as f:
+        lines = f.read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert [x for x in lines if x.startswith("idle;")]
+    assert [x for x in lines if "ThreadPoolExecutor" in x and ";spin (" in x]
+
+    with open(folded[0][: -len(".folded")] + ".json") as f:
+        summary = json.load(f)
+    assert summary["peak_memory"] == profiler.peak_memory
+    assert summary["hot_functions"][0]["function"] == names[0]
+
+    output = capsys.readouterr().out
+    assert "peak memory" in output
+    assert "spin (tests/test_profiling.py:" in output
+
+
+def test_output_dir():
+    assert profiling.output_dir("data") == os.path.join("data", "profiles")
+    assert profiling.output_dir("s3://bucket/data") == os.path.abspath("profiles")
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper.request_executor import RequestExecutor
+
+
+class RateLimited(Exception):
+    pass
+
+
+def failing(errors, result="ok"):
+    """Return a request that raises each of `errors` in turn, then returns
+    `result`."""
+    errors = list(errors)
+
+    def func():
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return func
+
+
+def make_executor(**kwargs):
+    delays = []
+    executor = RequestExecutor(
+        is_retryable=lambda error: isinstance(error, RateLimited),
+        sleep=delays.append,
+        **kwargs,
+    )
+    return executor, delays
+
+
+def test_retries_retryable_errors():
+    executor, delays = make_executor(backoff_base=1.0, backoff_max=3.0)
+    func = failing([RateLimited(), ConnectionError(), RateLimited(), RateLimited()])
+    assert executor.execute("files.get", func) == "ok"
+    assert len(delays) == 4
+    # Delays are jittered within the (capped) exponential backoff.
+    assert all(0 <= delay <= limit for delay, limit in zip(delays, [1, 2, 3, 3]))
+    stats = executor.stats()["files.get"]
+    assert stats["calls"] == 5
+    assert stats["errors"] == 4
+    assert stats["retries"] == 4
+
+
+def test_fatal_errors_are_raised():
+    executor, delays = make_executor()
+    with pytest.raises(ValueError):
+        executor.execute("files.get", failing([ValueError("bad request")]))
+    assert delays == []
+    assert executor.stats()["files.get"]["retries"] == 0
+
+
+def test_gives_up_after_max_retries():
+    executor, delays = make_executor(max_retries=2)
+    with pytest.raises(RateLimited):
+        executor.execute("files.list", failing([RateLimited()] * 5))
+    assert len(delays) == 2
+    stats = executor.stats()["files.list"]
+    assert stats["calls"] == 3
+    assert stats["errors"] == 3
+    assert stats["retries"] == 2
+
+
+def test_concurrency_is_bounded():
+    executor, _ = make_executor(max_concurrency=3)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request(i):
+        with lock:
+            in_flight.append(i)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(i)
+        return i
+
+    # More threads than the limit, all sharing the executor.
+    threads = [
+        threading.Thread(
+            target=executor.execute, args=("files.get", lambda i=i: request(i))
+        )
+        for i in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 3
+    assert executor.stats()["files.get"]["calls"] == 10
+
+    assert executor.map(request, range(10)) == list(range(10))
+    assert max(peak) == 3
@@ -0,0 +1,113 @@
+import datetime as dt
+import os
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip("requests")
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+import utility_bill_scraper.canada.on.kitchener_utilities as ku
+from umc_stub_server import UMCStubServer, invoice_pdf
+from utility_bill_scraper.sap_umc import AuthenticationError, UMCClient, parse_date
+
+
+@pytest.fixture
+def server():
+    server = UMCStubServer(page_size=5, delay=0.05).start()
+    yield server
+    server.stop()
+
+
+def test_parse_date():
+    assert parse_date("/Date(1634515200000)/") == dt.date(2021, 10, 18)
+    assert parse_date("/Date(1634515200000+0000)/") == dt.date(2021, 10, 18)
+    assert parse_date("2021-10-18T00:00:00") == dt.date(2021, 10, 18)
+
+
+def test_client(server):
+    client = UMCClient(server.url, "user", "password")
+    invoices = client.invoices()
+    assert len(invoices) == 14
+    assert invoices[0]["InvoiceDate"] == dt.date(2022, 7, 15)
+    assert invoices[-1]["InvoiceDate"] == dt.date(2021, 6, 15)
+    assert [x["Description"] for x in client.contracts()] == [
+        "Gas",
+        "Water and Sewer",
+        "Stormwater",
+    ]
+    assert len(client.consumption("000010001111")) == 13
+
+    # Login + 3 pages of invoices + contracts + consumption
+    assert client.stats()["Invoices"]["calls"] == 3
+    assert sum(x["calls"] for x in client.stats().values()) == 6
+
+
+def test_bad_credentials(server):
+    client = UMCClient(server.url, "user", "wrong")
+    with pytest.raises(AuthenticationError):
+        client.invoices()
+
+
+def test_download_statements(server, monkeypatch):
+    monkeypatch.setattr(ku, "PORTAL_URL", server.url)
+    data_path = tempfile.mkdtemp()
+    api = ku.KitchenerUtilitiesAPI(
+        "user", "password", data_path=data_path, transport="odata"
+    )
+    files = api.download_statements(start_date="2022-01-01")
+    assert [os.path.basename(x) for x in files[:2]] == [
+        "2022-07-15 - Kitchener Utilities - $95.12.pdf",
+        "2022-06-15 - Kitchener Utilities - $102.30.pdf",
+    ]
+    assert len(files) == 7
+    with open(files[0], "rb") as f:
+        assert f.read() == invoice_pdf("300000100013")
+
+    # PDFs are downloaded in parallel, without starting a browser.
+    assert server.max_concurrent_pdfs > 1
+    assert api._driver is None
+
+    files = api.download_statements(max_downloads=2)
+    assert len(files) == 2
+
+
+def test_download_statements_skips_archived_statements(server, monkeypatch):
+    monkeypatch.setattr(ku, "PORTAL_URL", server.url)
+    data_path = tempfile.mkdtemp()
+    api = ku.KitchenerUtilitiesAPI(
+        "user", "password", data_path=data_path, transport="odata"
+    )
+    files = api.download_statements(start_date="2022-05-01")
+    assert len(files) == 3
+    n_requests = len(server.requests)
+
+    # A new run only lists the invoices; nothing is downloaded again.
+    api = ku.KitchenerUtilitiesAPI(
+        "user", "password", data_path=data_path, transport="odata"
+    )
+    assert api.download_statements(start_date="2022-05-01") == files
+    pdf_requests = [x for x in server.requests[n_requests:] if "InvoicePDFs" in x]
+    assert pdf_requests == []
+
+    # Only statements that haven't been archived are downloaded.
+    files = api.download_statements(start_date="2022-03-01")
+    assert len(files) == 5
+    pdf_requests = [x for x in server.requests[n_requests:] if "InvoicePDFs" in x]
+    assert len(pdf_requests) == 2
+
+
+def test_get_consumption_history(server, monkeypatch):
+    monkeypatch.setattr(ku, "PORTAL_URL", server.url)
+    api = ku.KitchenerUtilitiesAPI(
+        "user", "password", data_path=tempfile.mkdtemp(), transport="odata"
+    )
+    history = api.get_consumption_history("Gas")
+    assert len(history) == 12
+    assert history["2022-01-31"] == 120.0
+    assert history["2022-12-31"] == 135.0
+    with pytest.raises(KeyError):
+        api.get_consumption_history("Electricity")
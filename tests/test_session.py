@@ -0,0 +1,219 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchElementException,
+    WebDriverException,
+)
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI
+from utility_bill_scraper import Timeout
+
+
+class FakeSwitchTo:
+    def default_content(self):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, server):
+        self.alive = True
+        self.quit_called = False
+        self.switch_to = FakeSwitchTo()
+        self.cookies = []
+        self._server = server
+
+    def get(self, url):
+        pass
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def delete_all_cookies(self):
+        self.cookies = []
+
+    def execute_script(self, script, *args):
+        if not self.alive:
+            raise WebDriverException("browser has gone away")
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeServer:
+    """Keeps track of which session ids are logged in."""
+
+    def __init__(self):
+        self.sessions = set()
+
+
+class SessionAPI(ExampleAPI):
+    _session_url = "https://example.com/account"
+
+    def __init__(self, *args, server=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server or FakeServer()
+        self.drivers = []
+        self.logins = 0
+
+    def _init_driver(self):
+        self._driver = FakeDriver(self.server)
+        self.drivers.append(self._driver)
+
+    def _login(self):
+        self.logins += 1
+        session_id = "session-%d" % self.logins
+        self.server.sessions.add(session_id)
+        self._driver.add_cookie({"name": "session", "value": session_id})
+
+    def _is_logged_in(self):
+        return any(
+            x["value"] in self.server.sessions for x in self._driver.get_cookies()
+        )
+
+    def download_statements(self, start_date=None, end_date=None, max_downloads=None):
+        with self.session():
+            return []
+
+
+def test_session_is_shared_by_nested_operations():
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+    with api.session() as driver:
+        api.download_statements()
+        api.download_statements()
+        assert api._driver is driver
+        assert not driver.quit_called
+    assert len(api.drivers) == 1
+    assert api.logins == 1
+    assert driver.quit_called
+    assert api._driver is None
+
+
+def test_each_operation_gets_its_own_session_by_default():
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+    api.download_statements()
+    api.download_statements()
+    assert len(api.drivers) == 2
+    assert api.logins == 2
+
+
+def test_session_reconnects_if_browser_dies():
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+    with api.session():
+        api.drivers[0].alive = False
+        api.download_statements()
+        assert len(api.drivers) == 2
+        assert api._driver is api.drivers[1]
+        assert api.logins == 2
+
+
+def test_cached_session_skips_login():
+    pytest.importorskip("cryptography")
+    server = FakeServer()
+    cache_dir = tempfile.mkdtemp()
+
+    def make_api():
+        return SessionAPI(
+            "user",
+            "password",
+            data_path=tempfile.mkdtemp(),
+            session_cache=cache_dir,
+            server=server,
+        )
+
+    api = make_api()
+    api.download_statements()
+    assert api.logins == 1
+
+    # The next run restores the cookies instead of logging in.
+    api = make_api()
+    api.download_statements()
+    assert api.logins == 0
+
+    # Falls back to logging in if the session has expired on the server.
+    server.sessions.clear()
+    api = make_api()
+    api.download_statements()
+    assert api.logins == 1
+
+
+def test_retry_with_restarts():
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+    calls = []
+
+    def flaky():
+        calls.append(api._driver)
+        if len(calls) < 3:
+            # e.g., the browser crashed or the portal's session expired
+            raise InvalidSessionIdException("invalid session id")
+        return "done"
+
+    with api.session():
+        assert api._retry_with_restarts(flaky, "Flaky operation") == "done"
+        # Each retry gets a fresh browser and login.
+        assert calls == api.drivers
+        assert api.logins == 3
+        assert api.drivers[0].quit_called and api.drivers[1].quit_called
+
+    def broken():
+        raise InvalidSessionIdException("invalid session id")
+
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+    with api.session():
+        with pytest.raises(InvalidSessionIdException):
+            api._retry_with_restarts(broken, "Broken operation")
+    assert len(api.drivers) == 1 + api._max_session_restarts
+
+
+def test_only_lost_sessions_are_restarted():
+    api = SessionAPI(data_path=tempfile.mkdtemp())
+
+    def fail(error):
+        def func():
+            raise error
+
+        return func
+
+    with api.session():
+        # Errors from a browser that is still logged in are raised right
+        # away (e.g., a broken selector or a table that never shows rows).
+        for error in [
+            NoSuchElementException("#missing"),
+            Timeout("Timed out after 10s waiting for table."),
+            WebDriverException("element not interactable"),
+        ]:
+            with pytest.raises(type(error)):
+                api._retry_with_restarts(fail(error), "Broken operation")
+        assert len(api.drivers) == 1
+        assert api.logins == 1
+
+        # A timeout after the portal's session expired restarts the session.
+        def expired():
+            if api.logins == 1:
+                api.server.sessions.clear()
+                raise Timeout("Timed out after 10s waiting for table.")
+            return "done"
+
+        assert api._retry_with_restarts(expired, "Expired session") == "done"
+        assert api.logins == 2
+
+        # So does an error from a browser that stopped responding.
+        def crashed():
+            if len(api.drivers) == 2:
+                api._driver.alive = False
+                raise WebDriverException("Failed to decode response from marionette")
+            return "done"
+
+        assert api._retry_with_restarts(crashed, "Crashed browser") == "done"
+        assert len(api.drivers) == 3
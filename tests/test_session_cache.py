@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper.session_cache import SessionCache
+
+COOKIES = [{"name": "SAP_SESSIONID", "value": "secret-value", "path": "/"}]
+
+
+def test_round_trip():
+    cache_dir = tempfile.mkdtemp()
+    cache = SessionCache("Example Utility", "user", "password", cache_dir)
+    assert cache.load() is None
+    cache.save(COOKIES)
+    assert cache.load() == COOKIES
+
+    # The cookies are not stored in plain text.
+    with open(cache.path, "rb") as f:
+        assert b"secret-value" not in f.read()
+    assert os.stat(cache.path).st_mode & 0o077 == 0
+
+    cache.clear()
+    assert cache.load() is None
+
+
+def test_accounts_are_cached_separately():
+    cache_dir = tempfile.mkdtemp()
+    SessionCache("Example Utility", "user", "password", cache_dir).save(COOKIES)
+    assert (
+        SessionCache("Example Utility", "other", "password", cache_dir).load() is None
+    )
+    assert SessionCache("Other Utility", "user", "password", cache_dir).load() is None
+
+
+def test_invalid_sessions_are_not_loaded():
+    cache_dir = tempfile.mkdtemp()
+    SessionCache("Example Utility", "user", "password", cache_dir).save(COOKIES)
+
+    # Changing the password invalidates the session.
+    assert SessionCache("Example Utility", "user", "changed", cache_dir).load() is None
+
+    # So does its age.
+    time.sleep(1.1)
+    cache = SessionCache("Example Utility", "user", "password", cache_dir, max_age=0)
+    assert cache.load() is None
@@ -0,0 +1,104 @@
+"""Startup benchmarks for `import utility_bill_scraper` (and therefore `ubs`).
+
+The package is imported in a fresh interpreter to check that heavy
+dependencies aren't imported until they're used. Set `UBS_STARTUP_BENCHMARK=1`
+to also check its import time against a (generous) budget; wall-clock timings
+are too noisy on shared CI machines to check by default.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import registry
+
+# Maximum cumulative import time (in seconds). The package itself takes well
+# under 0.1 s to import, while importing the heavy modules takes longer than
+# the budget.
+IMPORT_BUDGET = 0.5
+
+# Modules that are slow to import.
+HEAVY_MODULES = [
+    "pandas",
+    "arrow",
+    "googleapiclient",
+    "selenium.webdriver.remote.webdriver",
+]
+
+
+def run(code):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=dict(os.environ, PYTHONPATH=os.path.abspath("src")),
+    )
+
+
+def imported_heavy_modules(code):
+    process = run(
+        code
+        + "\nimport json, sys\n"
+        + f"print(json.dumps([x for x in {HEAVY_MODULES!r} if x in sys.modules]))"
+    )
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+@pytest.mark.skipif(
+    not os.getenv("UBS_STARTUP_BENCHMARK"),
+    reason="set UBS_STARTUP_BENCHMARK=1 to check the import time",
+)
+def test_import_time():
+    process = run("import utility_bill_scraper")
+    match = re.search(
+        r"import time:\s+\d+ \|\s+(\d+) \| utility_bill_scraper$",
+        process.stderr,
+        re.MULTILINE,
+    )
+    seconds = int(match.group(1)) / 1e6
+    print(f"import utility_bill_scraper: {seconds:.3f} s (budget: {IMPORT_BUDGET} s)")
+    assert seconds <= IMPORT_BUDGET
+
+
+def test_heavy_modules_are_imported_lazily():
+    assert imported_heavy_modules("import utility_bill_scraper") == []
+    # Only the chosen utility's module (and its own dependencies) is imported.
+    assert imported_heavy_modules(
+        "from utility_bill_scraper import registry\n"
+        "registry.get('Kitchener Utilities')"
+    ) == ["pandas", "arrow"]
+    assert "googleapiclient" in imported_heavy_modules(
+        "from utility_bill_scraper import GoogleDriveHelper"
+    )
+
+
+def test_registry():
+    from utility_bill_scraper.canada.on.enova_power import EnovaPowerAPI
+    from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper
+
+    import utility_bill_scraper
+
+    assert utility_bill_scraper.GoogleDriveHelper is GoogleDriveHelper
+    assert "Kitchener Utilities" in registry.names()
+    assert registry.get("Kitchener-Wilmot Hydro") is EnovaPowerAPI
+    with pytest.raises(RuntimeError, match="Unsupported utility"):
+        registry.get("Missing Utility")
+
+
+def test_make_api():
+    from utility_bill_scraper.bin.ubs import make_api
+
+    # Utilities with a single transport ignore `transport`.
+    with make_api(
+        "Kitchener-Wilmot Hydro", transport="odata", data_path=tempfile.mkdtemp()
+    ) as api:
+        assert api.name == "Kitchener-Wilmot Hydro"
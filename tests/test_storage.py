@@ -0,0 +1,169 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI, monthly_statements, write_statements
+from fake_drive import FakeDriveService
+from utility_bill_scraper import storage
+from utility_bill_scraper.google_drive_helpers import GoogleDriveHelper
+
+
+def make_history(dates, totals):
+    df = pd.DataFrame({"Total": totals}, index=pd.to_datetime(dates))
+    df.index.name = "Date"
+    return df
+
+
+def check_backend(backend):
+    backend.write("folder/data.bin", bytes(range(100)))
+    assert backend.read("folder/data.bin") == bytes(range(100))
+    assert backend.read_range("folder/data.bin", 10, 15) == bytes(range(10, 15))
+    assert backend.read_range("folder/data.bin", 95) == bytes(range(95, 100))
+    assert backend.exists("folder/data.bin")
+    assert not backend.exists("folder/missing.bin")
+    assert backend.list("folder") == ["data.bin"]
+    assert backend.list("folder", "*.csv") == []
+    with pytest.raises(FileNotFoundError):
+        backend.read("folder/missing.bin")
+
+
+def test_get_storage():
+    assert isinstance(storage.get_storage(tempfile.mkdtemp()), storage.LocalStorage)
+    with pytest.raises(RuntimeError):
+        storage.get_storage("https://drive.google.com/drive/u/0/folders/abc")
+
+
+def test_local_storage():
+    check_backend(storage.LocalStorage(tempfile.mkdtemp()))
+
+
+def test_local_history_round_trip():
+    data_path = tempfile.mkdtemp()
+    api = ExampleAPI(data_path=data_path)
+    api._monthly_history = make_history(["2023-01-31", "2023-02-28"], [1.0, 2.0])
+    api._update_history()
+    assert os.path.exists(os.path.join(data_path, "Example Utility", "monthly.csv"))
+
+    api = ExampleAPI(data_path=data_path)
+    assert list(api.history()["Total"]) == [1.0, 2.0]
+
+
+def test_google_drive_concurrent_writes_share_new_folders():
+    # With slow listings, concurrent uploads all find the folder missing.
+    drive = FakeDriveService(list_latency=0.05)
+    folder_id = drive.add_folder("data")
+
+    def make_api():
+        return ExampleAPI(
+            data_path=f"https://drive.google.com/drive/u/0/folders/{folder_id}",
+            google_sa_credentials=GoogleDriveHelper(service=drive),
+        )
+
+    api = make_api()
+    api._copy_statements_to_data_path(
+        write_statements(tempfile.mkdtemp(), monthly_statements(6))
+    )
+    api._monthly_history = make_history(
+        ["2021-12-31", "2022-12-31", "2023-12-31"], [1.0, 2.0, 3.0]
+    )
+    api._update_history()
+
+    # Each new folder is only created once.
+    for name in ["Example Utility", "statements", "monthly"]:
+        assert len(drive.find(name)) == 1, name
+    api = make_api()
+    assert len(api._archived_statements()) == 6
+    assert list(api.history()["Total"]) == [1.0, 2.0, 3.0]
+
+
+@pytest.fixture
+def s3_data_path(monkeypatch):
+    pytest.importorskip("boto3")
+    server_module = pytest.importorskip("moto.server")
+    import boto3
+
+    server = server_module.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("S3_ENDPOINT_URL", f"http://{host}:{port}")
+    boto3.client("s3", endpoint_url=f"http://{host}:{port}").create_bucket(
+        Bucket="ubs-test"
+    )
+    yield "s3://ubs-test/data"
+    server.stop()
+
+
+def test_s3_storage(s3_data_path):
+    backend = storage.get_storage(s3_data_path)
+    assert isinstance(backend, storage.S3Storage)
+    check_backend(backend)
+
+
+def test_s3_multipart_upload(s3_data_path):
+    backend = storage.S3Storage(
+        "ubs-test",
+        "data",
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024,
+    )
+    local_path = os.path.join(tempfile.mkdtemp(), "large.bin")
+    data = os.urandom(11 * 1024 * 1024)
+    with open(local_path, "wb") as f:
+        f.write(data)
+    backend.upload(local_path, "large.bin")
+    assert backend.read_range("large.bin", 6 * 1024 * 1024, 6 * 1024 * 1024 + 10) == (
+        data[6 * 1024 * 1024 : 6 * 1024 * 1024 + 10]
+    )
+
+
+def test_s3_history_only_uploads_changed_partitions(s3_data_path):
+    api = ExampleAPI(data_path=s3_data_path, compression="gzip")
+    api._monthly_history = make_history(["2022-12-31", "2023-01-31"], [1.0, 2.0])
+    api._update_history()
+    assert api._storage.list("Example Utility/monthly") == [
+        "2022.csv.gz",
+        "2023.csv.gz",
+        "manifest.json",
+    ]
+
+    api = ExampleAPI(data_path=s3_data_path, compression="gzip")
+    assert list(api.history()["Total"]) == [1.0, 2.0]
+    api._monthly_history.loc[pd.Timestamp("2023-02-28")] = 3.0
+    puts = api._storage.stats().get("put_object", {}).get("calls", 0)
+    api._update_history()
+
+    # Only the 2023 partition and the manifest are uploaded.
+    assert api._storage.stats()["put_object"]["calls"] - puts == 2
+
+
+def test_s3_archived_statements(s3_data_path):
+    api = ExampleAPI(data_path=s3_data_path, compression="gzip")
+    name = "2023-01-31 - Example Utility - $12.34.pdf"
+    local_path = os.path.join(tempfile.mkdtemp(), name)
+    with open(local_path, "wb") as f:
+        f.write(b"%PDF-1.4 statement")
+    api._copy_statements_to_data_path([local_path])
+    assert api._archived_statements() == {name: name + ".gz"}
+
+    # Archived statements are found without downloading them again.
+    api = ExampleAPI(data_path=s3_data_path, compression="gzip")
+    download_path = tempfile.mkdtemp()
+    filepath = api._archived_statement(name, download_path)
+    assert filepath == os.path.join(download_path, name)
+    with open(filepath, "rb") as f:
+        assert f.read() == b"%PDF-1.4 statement"
+    assert (
+        api._archived_statement(
+            "2023-02-28 - Example Utility - $1.00.pdf", download_path
+        )
+        is None
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI
+from utility_bill_scraper import timing
+
+
+def test_timings():
+    timings = timing.Timings()
+    with timings.span("download", bytes=10):
+        pass
+    with timings.span("download") as span:
+        span.bytes = 5
+    with pytest.raises(ValueError):
+        with timings.span("download"):
+            raise ValueError()
+    timings.count("new_rows", 3)
+
+    phase = timings.phases()["download"]
+    assert phase["count"] == 3
+    assert phase["failed"] == 1
+    assert phase["bytes"] == 15
+    assert phase["max_seconds"] <= phase["total_seconds"]
+    assert timings.counts() == {"new_rows": 3}
+
+    # Module-level spans only go to a `Timings` that is recording.
+    with timing.span("pdf_to_text"):
+        pass
+    with timing.recording(timings):
+        with timing.span("pdf_to_text", bytes=7):
+            pass
+    assert timings.phases()["pdf_to_text"]["bytes"] == 7
+    assert timings.phases()["pdf_to_text"]["count"] == 1
+
+
+class TimedAPI(ExampleAPI):
+    available_statements = [("2021-%02d-15" % month, 50.0) for month in range(1, 4)]
+    statement_size = 100
+
+    def extract_data(self, pdf_file):
+        with timing.span("pdf_to_text", os.path.getsize(pdf_file)):
+            pass
+        return super().extract_data(pdf_file)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_run_report(use_async):
+    api = TimedAPI("me@example.com", data_path=tempfile.mkdtemp())
+    if use_async:
+        asyncio.run(api.aupdate())
+    else:
+        api.update()
+    report = json.loads(json.dumps(api.run_report()))
+
+    assert report["utility_name"] == "Example Utility"
+    # The account is identified by a hash, rather than the login.
+    assert "me@example.com" not in json.dumps(report)
+    assert len(report["account"]) == 12
+    assert report["seconds"] >= 0
+    phases = report["phases"]
+    assert phases["extract"]["count"] == 3
+    # Spans recorded by the extractors (even in executor threads).
+    assert phases["pdf_to_text"]["count"] == 3
+    assert phases["pdf_to_text"]["bytes"] == 300
+    # The monthly and hourly history are read when the object is created.
+    assert phases["history_read"]["count"] == 2
+    assert phases["history_write"]["count"] == 1
+    assert phases["storage_write"]["count"] == 1
+    assert report["counts"] == {
+        "statements_extracted": 3,
+        "new_rows": 3,
+        "monthly_rows": 3,
+    }
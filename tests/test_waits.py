@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from utility_bill_scraper import Timeout, wait_for_element, waits
+
+
+def test_until_retries_ignored_exceptions():
+    stats = waits.WaitStats()
+    calls = []
+
+    def condition(driver):
+        calls.append(driver)
+        if len(calls) < 3:
+            raise NoSuchElementException()
+        return "element"
+
+    assert (
+        waits.until("driver", condition, 5, poll_frequency=0.01, stats=stats)
+        == "element"
+    )
+    assert calls == ["driver"] * 3
+    assert stats.as_dict()["condition"]["waits"] == 1
+    assert stats.as_dict()["condition"]["timeouts"] == 0
+
+
+def test_until_times_out():
+    stats = waits.WaitStats()
+    with pytest.raises(Timeout):
+        waits.until(
+            None,
+            lambda driver: False,
+            0.1,
+            name="never",
+            poll_frequency=0.01,
+            stats=stats,
+        )
+    assert stats.as_dict()["never"]["timeouts"] == 1
+    assert stats.as_dict()["never"]["max_seconds"] >= 0.1
+
+
+def test_poll_backs_off():
+    calls = []
+
+    def condition():
+        calls.append(time.time())
+        return len(calls) == 5
+
+    waits.poll(condition, 5, initial_delay=0.01, max_delay=0.04)
+    delays = [b - a for a, b in zip(calls, calls[1:])]
+    assert delays[-1] > delays[0]
+
+
+def test_wait_for_element_returns_falsy_results():
+    @wait_for_element
+    def get_rows():
+        return []
+
+    assert get_rows() == []
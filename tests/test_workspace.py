@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+# add src to the python path
+sys.path.insert(0, os.path.abspath("src"))
+
+from example_api import ExampleAPI
+from utility_bill_scraper.workspace import PID_FILE, DownloadWorkspace
+
+
+def test_workspaces_are_separate_and_removed_on_close():
+    root = tempfile.mkdtemp()
+    with DownloadWorkspace(root) as a, DownloadWorkspace(root) as b:
+        assert a.path != b.path
+        assert os.path.isdir(a.browser_dir)
+        dirs = [a.new_dir(), a.new_dir(), b.new_dir()]
+        assert len(set(dirs)) == 3
+        assert all(os.path.isdir(x) for x in dirs)
+    assert not os.path.exists(a.path)
+    assert not os.path.exists(b.path)
+    assert a.closed
+    with pytest.raises(RuntimeError):
+        a.new_dir()
+
+
+def test_stale_workspaces_are_removed():
+    root = tempfile.mkdtemp()
+    # A workspace left behind by a process that has since exited.
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import os, sys; sys.path.insert(0, 'src');"
+            "from utility_bill_scraper.workspace import DownloadWorkspace;"
+            f"w = DownloadWorkspace({root!r}); w._finalizer.detach();"
+            "print(w.path)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    stale_path = process.stdout.strip()
+    assert os.path.exists(os.path.join(stale_path, PID_FILE))
+
+    with DownloadWorkspace(root) as workspace:
+        other = DownloadWorkspace(root)
+        assert not os.path.exists(stale_path)
+        # Workspaces belonging to running processes are kept.
+        assert os.path.exists(workspace.path)
+        assert os.path.exists(other.path)
+        other.close()
+
+
+def test_api_close_removes_workspace():
+    with ExampleAPI(
+        data_path=tempfile.mkdtemp(), user="user", password="password"
+    ) as api:
+        path = api._workspace.path
+        statements_path = api._workspace.new_dir("statements-")
+        assert os.path.isdir(statements_path)
+    assert not os.path.exists(path)
+    # Closing again is a no-op.
+    api.close()
@@ -0,0 +1,187 @@
+"""A local stub of the SAP UMC OData service used by the Kitchener Utilities
+portal.
+
+Entity sets are served from the JSON fixtures in
+`fixtures/kitchener_utilities_odata` (in the service's OData v2 JSON format).
+The stub checks basic auth credentials, hands out a session cookie and a
+CSRF token, pages large entity sets with `__next` links and serves a small
+fake PDF for each invoice. It counts requests so that tests can check how
+many round trips an operation takes.
+"""
+
+import base64
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+FIXTURES_PATH = os.path.join(
+    os.path.dirname(__file__), "fixtures", "kitchener_utilities_odata"
+)
+SERVICE_PATH = "/sap/opu/odata/sap/ERP_UTILITIES_UMC"
+SESSION_COOKIE = "SAP_SESSIONID_KUP_100"
+CSRF_TOKEN = "stub-csrf-token"
+
+
+def invoice_pdf(invoice_id):
+    return b"%PDF-1.4\n% stub invoice " + invoice_id.encode() + b"\n%%EOF\n"
+
+
+class UMCStubServer:
+    def __init__(self, user="user", password="password", page_size=None, delay=0):
+        """
+        Parameters
+        ----------
+        page_size : int, optional
+            Page entity sets with `__next` links.
+        delay : float
+            Seconds to wait before responding to each PDF request.
+        """
+        self.user = user
+        self.password = password
+        self.page_size = page_size
+        self.delay = delay
+        self.requests = []
+        self.max_concurrent_pdfs = 0
+        self._concurrent_pdfs = 0
+        self._session_id = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _load(self, name):
+        with open(os.path.join(FIXTURES_PATH, name + ".json")) as f:
+            return json.load(f)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(
+                self, status, body=b"", content_type="application/json", headers=None
+            ):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, data, headers=None):
+                self._send(200, json.dumps(data).encode(), headers=headers)
+
+            def _authenticated(self):
+                cookie = self.headers.get("Cookie", "")
+                if (
+                    stub._session_id
+                    and f"{SESSION_COOKIE}={stub._session_id}" in cookie
+                ):
+                    return True
+                auth = self.headers.get("Authorization", "")
+                if auth.startswith("Basic "):
+                    user, _, password = (
+                        base64.b64decode(auth[6:]).decode().partition(":")
+                    )
+                    return user == stub.user and password == stub.password
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = unquote(url.path)
+                query = parse_qs(url.query)
+                with stub._lock:
+                    stub.requests.append(path)
+
+                if not path.startswith(SERVICE_PATH):
+                    return self._send(404)
+                if not self._authenticated():
+                    return self._send(401, headers={"WWW-Authenticate": "Basic"})
+                path = path[len(SERVICE_PATH) :].strip("/")
+
+                headers = {}
+                if self.headers.get("X-CSRF-Token") == "Fetch":
+                    headers["X-CSRF-Token"] = CSRF_TOKEN
+                if stub._session_id is None:
+                    stub._session_id = "stub-session"
+                headers["Set-Cookie"] = (
+                    f"{SESSION_COOKIE}={stub._session_id}; path=/; HttpOnly"
+                )
+
+                if path == "":
+                    return self._send_json(
+                        {"d": {"EntitySets": ["Accounts", "Contracts", "Invoices"]}},
+                        headers,
+                    )
+
+                match = re.match(r"InvoicePDFs\(InvoiceID='([^']+)'\)/\$value$", path)
+                if match:
+                    return self._send_pdf(match.group(1), headers)
+
+                match = re.match(
+                    r"Contracts\('([^']+)'\)/ContractConsumptionValues$", path
+                )
+                if match:
+                    name = "ContractConsumptionValues_" + match.group(1)
+                    if not os.path.exists(os.path.join(FIXTURES_PATH, name + ".json")):
+                        return self._send(404)
+                    return self._send_json(stub._load(name), headers)
+
+                if path in ["Accounts", "Contracts", "Invoices"]:
+                    return self._send_json(
+                        self._page(stub._load(path), path, query), headers
+                    )
+                return self._send(404)
+
+            def _page(self, data, path, query):
+                results = data["d"]["results"]
+                if not stub.page_size:
+                    return data
+                skip = int(query.get("$skiptoken", ["0"])[0])
+                page = results[skip : skip + stub.page_size]
+                d = {"results": page}
+                if skip + stub.page_size < len(results):
+                    params = "&".join(
+                        f"{quote(k)}={quote(v[0])}"
+                        for k, v in query.items()
+                        if k != "$skiptoken"
+                    )
+                    d["__next"] = (
+                        f"{stub.url}{SERVICE_PATH}/{path}?{params}"
+                        f"&$skiptoken={skip + stub.page_size}"
+                    )
+                return {"d": d}
+
+            def _send_pdf(self, invoice_id, headers):
+                with stub._lock:
+                    stub._concurrent_pdfs += 1
+                    stub.max_concurrent_pdfs = max(
+                        stub.max_concurrent_pdfs, stub._concurrent_pdfs
+                    )
+                try:
+                    time.sleep(stub.delay)
+                    self._send(200, invoice_pdf(invoice_id), "application/pdf", headers)
+                finally:
+                    with stub._lock:
+                        stub._concurrent_pdfs -= 1
+
+        return Handler